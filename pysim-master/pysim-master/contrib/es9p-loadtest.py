@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+# (C) 2024 by sysmocom - s.f.m.c. GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import time
+import argparse
+import logging
+import statistics
+import multiprocessing
+
+from typing import List, Dict
+from urllib.parse import urlparse
+
+from cryptography import x509
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from osmocom.utils import h2b
+
+import pySim.esim.rsp as rsp
+from pySim.esim import es9p
+from pySim.esim.x509_cert import CertAndPrivkey
+
+parser = argparse.ArgumentParser(description="""
+Load test for the ES9+ API of an SM-DP+ (such as osmo-smdpp).  A number of client processes run RSP
+sessions against the SM-DP+ concurrently; the latencies of the individual ES9+ requests and the overall
+throughput are reported at the end.""")
+parser.add_argument('--url', required=True, help='Base URL of ES9+ API endpoint')
+parser.add_argument('--server-ca-cert', help="""X.509 CA certificates acceptable for the server side. In
+                    production use cases, this would be the GSMA Root CA (CI) certificate.""")
+parser.add_argument('--smdp-address',
+                    help='smdpAddress to send in initiateAuthentication (default: host part of the URL)')
+parser.add_argument('--scenario', choices=['initiate-auth', 'download'], default='initiate-auth',
+                    help="""RSP session to perform: only initiateAuthentication, or the complete profile
+                    download (initiateAuthentication, authenticateClient, getBoundProfilePackage)""")
+parser.add_argument('--clients', type=int, default=4, help='Number of concurrent client processes')
+parser.add_argument('--sessions', type=int, default=10, help='Number of RSP sessions per client')
+parser.add_argument('--certificate-path', default='.',
+                    help="Path in which to look for certificate and key files.")
+parser.add_argument('--ci-certificate',
+                    default='smdpp-data/certs/CertificateIssuer/CERT_CI_ECDSA_NIST.der',
+                    help="File name of DER-encoded CI certificate file.")
+parser.add_argument('--euicc-certificate', default='CERT_EUICC_ECDSA_NIST.der',
+                    help="File name of DER-encoded eUICC certificate file (download only).")
+parser.add_argument('--euicc-private-key', default='SK_EUICC_ECDSA_NIST.pem',
+                    help="File name of PEM-format eUICC secret key file (download only).")
+parser.add_argument('--eum-certificate', default='CERT_EUM_ECDSA_NIST.der',
+                    help="File name of DER-encoded EUM certificate file (download only).")
+parser.add_argument('--matchingId', help='MatchingID that shall be used by profile download')
+
+
+class LoadClient:
+    """A single (sequential) ES9+ client, recording the latency of each request."""
+    def __init__(self, opts):
+        self.opts = opts
+        self.smdp_address = opts.smdp_address or urlparse(opts.url).hostname
+        self.latencies = {} # type: Dict[str, List[float]]
+        self.errors = [] # type: List[str]
+
+        with open(os.path.join(opts.certificate_path, opts.ci_certificate), 'rb') as f:
+            ci_cert = x509.load_der_x509_certificate(f.read())
+        self.ci_pkid = ci_cert.extensions.get_extension_for_class(x509.SubjectKeyIdentifier).value.key_identifier
+
+        if opts.scenario == 'download':
+            self.cert_and_key = CertAndPrivkey()
+            self.cert_and_key.cert_from_der_file(os.path.join(opts.certificate_path, opts.euicc_certificate))
+            self.cert_and_key.privkey_from_pem_file(os.path.join(opts.certificate_path, opts.euicc_private_key))
+            with open(os.path.join(opts.certificate_path, opts.eum_certificate), 'rb') as f:
+                eum_cert = x509.load_der_x509_certificate(f.read())
+            # constant for all sessions, so only converted once
+            self.euicc_cert_dec = rsp.asn1.decode('Certificate', self.cert_and_key.get_cert_as_der())
+            self.eum_cert_dec = rsp.asn1.decode('Certificate', eum_cert.public_bytes(Encoding.DER))
+
+        self.peer = es9p.Es9pApiClient(opts.url, server_cert_verify=opts.server_ca_cert)
+
+    def _call(self, name: str, data: dict) -> dict:
+        start = time.monotonic()
+        res = getattr(self.peer, 'call_' + name)(data)
+        self.latencies.setdefault(name, []).append(time.monotonic() - start)
+        return res
+
+    def run_session(self):
+        euiccInfo1 = {
+            'svn': b'\x02\x04\x00',
+            'euiccCiPKIdListForVerification': [self.ci_pkid],
+            'euiccCiPKIdListForSigning': [self.ci_pkid],
+        }
+        init_auth_res = self._call('initiateAuthentication', {
+            'euiccChallenge': os.urandom(16),
+            'euiccInfo1': euiccInfo1,
+            'smdpAddress': self.smdp_address,
+        })
+        if self.opts.scenario == 'initiate-auth':
+            return
+
+        euiccInfo2 = {
+            'profileVersion': b'\x02\x03\x01',
+            'svn': euiccInfo1['svn'],
+            'euiccFirmwareVer': b'\x23\x42\x00',
+            'extCardResource': b'\x81\x01\x00\x82\x04\x00\x04\x9ch\x83\x02"#',
+            'uiccCapability': (b'k6\xd3\xc3', 32),
+            'javacardVersion': b'\x11\x02\x00',
+            'globalplatformVersion': b'\x02\x03\x00',
+            'rspCapability': (b'\x9c', 6),
+            'euiccCiPKIdListForVerification': euiccInfo1['euiccCiPKIdListForVerification'],
+            'euiccCiPKIdListForSigning': euiccInfo1['euiccCiPKIdListForSigning'],
+            'ppVersion': b'\x01\x00\x00',
+            'sasAcreditationNumber': 'OSMOCOM-TEST-1',
+        }
+        euiccSigned1 = {
+            'transactionId': h2b(init_auth_res['transactionId']),
+            'serverAddress': init_auth_res['serverSigned1']['serverAddress'],
+            'serverChallenge': init_auth_res['serverSigned1']['serverChallenge'],
+            'euiccInfo2': euiccInfo2,
+            'ctxParams1':
+                ('ctxParamsForCommonAuthentication', {
+                    'matchingId': self.opts.matchingId,
+                    'deviceInfo': {
+                        'tac': b'\x35\x23\x01\x45',
+                        'deviceCapabilities': {},
+                    }
+                }),
+        }
+        euiccSigned1_bin = rsp.asn1.encode('EuiccSigned1', euiccSigned1)
+        auth_clnt_res = self._call('authenticateClient', {
+            'transactionId': init_auth_res['transactionId'],
+            'authenticateServerResponse':
+                ('authenticateResponseOk', {
+                    'euiccSigned1': euiccSigned1,
+                    'euiccSignature1': self.cert_and_key.ecdsa_sign(euiccSigned1_bin),
+                    'euiccCertificate': self.euicc_cert_dec,
+                    'eumCertificate': self.eum_cert_dec,
+                 })
+        })
+
+        smdp_cert = x509.load_der_x509_certificate(auth_clnt_res['smdpCertificate'])
+        euicc_ot = ec.generate_private_key(smdp_cert.public_key().public_numbers().curve)
+        euiccSigned2 = {
+            'transactionId': h2b(auth_clnt_res['transactionId']),
+            'euiccOtpk': euicc_ot.public_key().public_bytes(Encoding.X962, PublicFormat.UncompressedPoint),
+        }
+        euiccSigned2_bin = rsp.asn1.encode('EUICCSigned2', euiccSigned2)
+        euiccSignature2 = self.cert_and_key.ecdsa_sign(euiccSigned2_bin + auth_clnt_res['smdpSignature2'])
+        # the bound profile package is not decoded/verified here, to keep the client side cheap
+        self._call('getBoundProfilePackage', {
+            'transactionId': auth_clnt_res['transactionId'],
+            'prepareDownloadResponse':
+                ('downloadResponseOk', {
+                    'euiccSigned2': euiccSigned2,
+                    'euiccSignature2': euiccSignature2,
+                 })
+        })
+
+    def run(self, num_sessions: int):
+        for i in range(num_sessions):
+            try:
+                self.run_session()
+            except Exception as e:
+                self.errors.append('%s: %s' % (type(e).__name__, e))
+
+
+def run_client(opts) -> tuple:
+    """Entry point of the client processes: Run opts.sessions sessions, return latencies and errors."""
+    # es9p.py enables DEBUG logging of all requests/responses, which would dominate the client CPU time
+    for name in ['pySim.esim.es9p', 'pySim.esim.http_json_api']:
+        logging.getLogger(name).setLevel(logging.WARNING)
+    client = LoadClient(opts)
+    client.run(opts.sessions)
+    return client.latencies, client.errors
+
+
+def print_report(latencies: Dict[str, List[float]], errors: List[str], sessions: int, duration: float):
+    print("%-24s %7s %9s %9s %9s %9s" % ('request', 'count', 'mean[ms]', 'median', 'p95', 'max'))
+    for name, values in latencies.items():
+        p95 = statistics.quantiles(values, n=20, method='inclusive')[18] if len(values) > 1 else values[0]
+        print("%-24s %7u %9.1f %9.1f %9.1f %9.1f" % (name, len(values), statistics.mean(values) * 1000,
+                                                      statistics.median(values) * 1000, p95 * 1000,
+                                                      max(values) * 1000))
+    print()
+    print("%u sessions (%u failed) in %.2f s: %.1f sessions/s" % (sessions, len(errors), duration,
+                                                                 (sessions - len(errors)) / duration))
+    for e in sorted(set(errors)):
+        print("  error (%ux): %s" % (errors.count(e), e))
+
+
+if __name__ == '__main__':
+    opts = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    if opts.scenario == 'download' and not opts.matchingId:
+        parser.error('--matchingId is required for the download scenario')
+
+    start = time.monotonic()
+    with multiprocessing.Pool(opts.clients) as pool:
+        results = pool.map(run_client, [opts] * opts.clients)
+    duration = time.monotonic() - start
+
+    latencies = {} # type: Dict[str, List[float]]
+    errors = [] # type: List[str]
+    for client_latencies, client_errors in results:
+        for name, values in client_latencies.items():
+            latencies.setdefault(name, []).extend(values)
+        errors.extend(client_errors)
+    print_report(latencies, errors, opts.clients * opts.sessions, duration)
+    sys.exit(1 if errors else 0)
@@ -26,6 +26,7 @@ from osmocom.utils import h2b, b2h, swap_nibbles
 
 from pySim.esim.saip import *
 from pySim.esim.saip.validation import CheckBasicStructure
+from pySim.esim.saip.batch import personalize_csv
 from pySim import javacard
 from pySim.pprint import HexBytesPrettyPrinter
 
@@ -65,6 +66,12 @@ parser_eapp.add_argument('--format', default='cap', choices=['ijc', 'cap'], help
 
 parser_info = subparsers.add_parser('tree', help='Display the filesystem tree')
 
+parser_pb = subparsers.add_parser('personalize-batch', help='Generate personalized profiles from a CSV file')
+parser_pb.add_argument('--csv', required=True,
+                       help='CSV file with one row per profile, columns named after the parameters (iccid, imsi, k, ...)')
+parser_pb.add_argument('--output-dir', default='.', help='Output directory (where to store files)')
+parser_pb.add_argument('--processes', type=int, help='Number of worker processes (default: number of CPUs)')
+
 def do_split(pes: ProfileElementSequence, opts):
     i = 0
     for pe in pes.pe_list:
@@ -227,6 +234,11 @@ def do_extract_apps(pes:ProfileElementSequence, opts):
 def do_tree(pes:ProfileElementSequence, opts):
     pes.mf.print_tree()
 
+def do_personalize_batch(pes:ProfileElementSequence, opts):
+    os.makedirs(opts.output_dir, exist_ok=True)
+    count = personalize_csv(pes.to_der(), opts.csv, opts.output_dir, opts.processes)
+    print("Generated %u profiles in '%s'" % (count, opts.output_dir))
+
 if __name__ == '__main__':
     opts = parser.parse_args()
 
@@ -236,7 +248,7 @@ if __name__ == '__main__':
         logging.basicConfig(level=logging.getLevelName(opts.loglevel))
 
     with open(opts.INPUT_UPP, 'rb') as f:
-        pes = ProfileElementSequence.from_der(f.read())
+        pes = ProfileElementSequence.from_der(f.read(), lazy=True)
 
     print("Read %u PEs from file '%s'" % (len(pes.pe_list), opts.INPUT_UPP))
 
@@ -256,3 +268,5 @@ if __name__ == '__main__':
         do_extract_apps(pes, opts)
     elif opts.command == 'tree':
         do_tree(pes, opts)
+    elif opts.command == 'personalize-batch':
+        do_personalize_batch(pes, opts)
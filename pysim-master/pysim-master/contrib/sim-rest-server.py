@@ -20,8 +20,11 @@
 import json
 import sys
 import argparse
+import threading
 
 from klein import Klein
+from twisted.internet import reactor
+from twisted.internet.threads import deferToThread
 
 from pySim.transport import ApduTracer
 from pySim.transport.pcsc import PcscSimLink
@@ -55,6 +58,77 @@ def connect_to_card(slot_nr:int):
 
     return tp, scc, card
 
+class SlotSession:
+    """A persistent connection to the card in one slot, including a cache of its static identity data
+    (ICCID, IMSI).  All operations on one slot are serialized."""
+    def __init__(self, slot_nr:int):
+        self.slot_nr = slot_nr
+        self.lock = threading.Lock()
+        self.tp = None
+        self.scc = None
+        self.card = None
+        self.atr = None
+        self.identity = {}
+
+    def _connect(self):
+        self.tp, self.scc, self.card = connect_to_card(self.slot_nr)
+        atr = self.tp.get_atr()
+        (iccid, _sw) = self.scc.read_binary(EF_ICCID().fid)
+        iccid = dec_iccid(iccid)
+        if atr != self.atr or iccid != self.identity.get('iccid', None):
+            # a different card than the one whose data we cached
+            self.identity = {'iccid': iccid}
+        self.atr = atr
+
+    def _disconnect(self):
+        try:
+            self.tp.disconnect()
+        except Exception:
+            pass
+        self.tp = self.scc = self.card = None
+
+    def _healthy(self) -> bool:
+        """Check (without sending an APDU) if the connection is still alive and the card still the same.
+        PC/SC queries the current card status in order to determine the ATR."""
+        try:
+            return self.tp.get_atr() == self.atr
+        except Exception:
+            return False
+
+    def run(self, func):
+        """Call func(self) with the session locked; (re-)connect to the card first if required."""
+        with self.lock:
+            if self.tp and not self._healthy():
+                self._disconnect()
+            if not self.tp:
+                try:
+                    self._connect()
+                except Exception as e:
+                    self._disconnect()
+                    raise e
+            try:
+                return func(self)
+            except SwMatchError as e:
+                # the card responded, so the connection is fine
+                raise e
+            except Exception as e:
+                # we don't know in which state the card/reader is: start over with the next request
+                self._disconnect()
+                raise e
+
+class SlotPool:
+    """Pool of SlotSession, indexed by slot number."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}
+
+    def run(self, slot_nr:int, func):
+        with self.lock:
+            if slot_nr not in self.sessions:
+                self.sessions[slot_nr] = SlotSession(slot_nr)
+            session = self.sessions[slot_nr]
+        return session.run(func)
+
 class ApiError:
     def __init__(self, msg:str, sw=None):
         self.msg = msg
@@ -73,6 +147,9 @@ def set_headers(request):
 class SimRestServer:
     app = Klein()
 
+    def __init__(self):
+        self.pool = SlotPool()
+
     @app.handle_errors(NoCardError)
     def no_card_error(self, request, failure):
         set_headers(request)
@@ -119,15 +196,19 @@ class SimRestServer:
             request.setResponseCode(400)
             return str(ApiError("Malformed Request"))
 
-        tp, scc, card = connect_to_card(slot)
-
-        card.select_adf_by_aid(adf='usim')
-        res, sw = scc.authenticate(rand, autn)
+        def _auth(session):
+            session.card.select_adf_by_aid(adf='usim')
+            res, sw = session.scc.authenticate(rand, autn)
+            return res
 
-        tp.disconnect()
+        def _respond(res):
+            set_headers(request)
+            return json.dumps(res, indent=4)
 
-        set_headers(request)
-        return json.dumps(res, indent=4)
+        # talk to the card in a thread of the reactor's thread pool, so we don't block other requests
+        d = deferToThread(self.pool.run, slot, _auth)
+        d.addCallback(_respond)
+        return d
 
     @app.route('/sim-info-api/v1/slot/<int:slot>')
     def info(self, request, slot):
@@ -135,31 +216,35 @@ class SimRestServer:
         Expects empty body in request.
         Returns a JSON body containing ICCID, IMSI."""
 
-        tp, scc, card = connect_to_card(slot)
-
-        ef_iccid = EF_ICCID()
-        (iccid, sw) = card._scc.read_binary(ef_iccid.fid)
-
-        card.select_adf_by_aid(adf='usim')
-        ef_imsi = EF_IMSI()
-        (imsi, sw) = card._scc.read_binary(ef_imsi.fid)
+        def _info(session):
+            # the ICCID is read when connecting, the IMSI only once per card
+            if not 'imsi' in session.identity:
+                session.card.select_adf_by_aid(adf='usim')
+                ef_imsi = EF_IMSI()
+                (imsi, sw) = session.scc.read_binary(ef_imsi.fid)
+                session.identity['imsi'] = dec_imsi(imsi)
+            return {"imsi": session.identity['imsi'], "iccid": session.identity['iccid'] }
 
-        res = {"imsi": dec_imsi(imsi), "iccid": dec_iccid(iccid) }
-
-        tp.disconnect()
+        def _respond(res):
+            set_headers(request)
+            return json.dumps(res, indent=4)
 
-        set_headers(request)
-        return json.dumps(res, indent=4)
+        d = deferToThread(self.pool.run, slot, _info)
+        d.addCallback(_respond)
+        return d
 
 
 def main(argv):
     parser = argparse.ArgumentParser()
     parser.add_argument("-H", "--host", help="Host/IP to bind HTTP to", default="localhost")
     parser.add_argument("-p", "--port", help="TCP port to bind HTTP to", default=8000)
+    parser.add_argument("-t", "--threads", type=int, default=10,
+                        help="Maximum number of card slots served concurrently (threads)")
     #parser.add_argument("-v", "--verbose", help="increase output verbosity", action='count', default=0)
 
     args = parser.parse_args()
 
+    reactor.suggestThreadPoolSize(args.threads)
     srr = SimRestServer()
     srr.app.run(args.host, args.port)
 
@@ -22,15 +22,18 @@ import sys
 import argparse
 import uuid
 import os
+import time
+import socket
+import signal
+import subprocess
 import functools
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
 from pprint import pprint as pp
 
 import base64
 from base64 import b64decode
 from klein import Klein
 from twisted.web.iweb import IRequest
-import asn1tools
 
 from osmocom.utils import h2b, b2h, swap_nibbles
 
@@ -134,8 +137,12 @@ class SmDppHttpServer:
                 return cert
         return None
 
-    def __init__(self, server_hostname: str, ci_certs_path: str, use_brainpool: bool = False):
+    def __init__(self, server_hostname: str, ci_certs_path: str, use_brainpool: bool = False,
+                 rss: Optional[rsp.RspSessionStore] = None, threaded: bool = False):
         self.server_hostname = server_hostname
+        # process the requests (and hence all the ECDSA, ECDH and BSP crypto) in the thread pool of the
+        # reactor instead of on the reactor thread, so that it keeps serving other requests meanwhile
+        self.threaded = threaded
         self.upp_dir = os.path.realpath(os.path.join(DATA_DIR, 'upp'))
         self.ci_certs = self.load_certs_from_path(ci_certs_path)
         # load DPauth cert + key
@@ -155,7 +162,9 @@ class SmDppHttpServer:
         else:
             self.dp_pb.cert_from_der_file(os.path.join(cert_dir, 'DPpb', 'CERT_S_SM_DPpb_ECDSA_NIST.der'))
             self.dp_pb.privkey_from_pem_file(os.path.join(cert_dir, 'DPpb', 'SK_S_SM_DPpb_ECDSA_NIST.pem'))
-        self.rss = rsp.RspSessionStore(os.path.join(DATA_DIR, "sm-dp-sessions"))
+        if rss is None:
+            rss = rsp.RspSessionStoreSqlite(os.path.join(DATA_DIR, "sm-dp-sessions.sqlite"))
+        self.rss = rss
 
     @app.handle_errors(ApiError)
     def handle_apierror(self, request: IRequest, failure):
@@ -176,7 +185,8 @@ class SmDppHttpServer:
     @staticmethod
     def rsp_api_wrapper(func):
         """Wrapper that can be used as decorator in order to perform common REST API endpoint entry/exit
-        functionality, such as JSON decoding/encoding and debug-printing."""
+        functionality, such as JSON decoding/encoding and debug-printing.  The wrapped function returns
+        the JSON response (dict), or the HTTP status code of a response without body (int)."""
         @functools.wraps(func)
         def _api_wrapper(self, request: IRequest):
             # TODO: evaluate User-Agent + X-Admin-Protocol header
@@ -186,13 +196,24 @@ class SmDppHttpServer:
             print("Rx JSON: %s" % json.dumps(content))
             set_headers(request)
 
-            output = func(self, request, content)
-            if output == None:
-                return ''
-
-            build_resp_header(output)
-            print("Tx JSON: %s" % json.dumps(output))
-            return json.dumps(output)
+            def _encode_output(output):
+                if output == None:
+                    return ''
+                if isinstance(output, int):
+                    # only called on the reactor thread, which is the only one that may touch the request
+                    request.setResponseCode(output)
+                    return ''
+
+                build_resp_header(output)
+                print("Tx JSON: %s" % json.dumps(output))
+                return json.dumps(output)
+
+            if self.threaded:
+                # the result is written on the reactor thread once the Deferred fires; exceptions (like
+                # ApiError) end up in the error handlers just as if they were raised synchronously
+                from twisted.internet import threads
+                return threads.deferToThread(func, self, request, content).addCallback(_encode_output)
+            return _encode_output(func(self, request, content))
         return _api_wrapper
 
     @app.route('/gsma/rsp2/es9plus/initiateAuthentication', methods=['POST'])
@@ -366,7 +387,7 @@ class SmDppHttpServer:
                     raise ApiError('8.2.6', '3.8', 'Refused')
                 ss.matchingId = matchingId
                 with open(path, 'rb') as f:
-                    pes = saip.ProfileElementSequence.from_der(f.read())
+                    pes = saip.ProfileElementSequence.from_der(f.read(), lazy=True)
                     iccid_str = b2h(pes.get_pe_for_type('header').decoded['iccid'])
         else:
             # there's currently no other option in the ctxParams1 choice, so this cannot happen
@@ -479,11 +500,10 @@ class SmDppHttpServer:
 
     @app.route('/gsma/rsp2/es9plus/handleNotification', methods=['POST'])
     @rsp_api_wrapper
-    def handleNotification(self, request: IRequest, content: dict) -> dict:
+    def handleNotification(self, request: IRequest, content: dict) -> int:
         """See ES9+ HandleNotification in SGP.22 Section 5.6.4"""
         # SGP.22 Section 6.3: "A normal notification function execution status (MEP Notification)
         # SHALL be indicated by the HTTP status code '204' (No Content) with an empty HTTP response body"
-        request.setResponseCode(204)
         pendingNotification_bin = b64decode(content['pendingNotification'])
         pendingNotification = rsp.asn1.decode('PendingNotification', pendingNotification_bin)
         print("Rx %s: %s" % pendingNotification)
@@ -494,7 +514,7 @@ class SmDppHttpServer:
             ss = self.rss.get(transactionId, None)
             if ss is None:
                 print("Unable to find session for transactionId")
-                return
+                return 204
             profileInstallRes['euiccSignPIR']
             # TODO: use original data, don't re-encode?
             pird_bin = rsp.asn1.encode('ProfileInstallationResultData', pird)
@@ -529,6 +549,7 @@ class SmDppHttpServer:
             print("handleNotification: EID %s: %s of %s" % (eid, pmo, iccid))
         else:
             raise ValueError(pendingNotification)
+        return 204
 
     #@app.route('/gsma/rsp3/es9plus/handleDeviceChangeRequest, methods=['POST']')
     #@rsp_api_wrapper
@@ -579,17 +600,99 @@ class SmDppHttpServer:
         return { 'transactionId': transactionId }
 
 
+def serve_on_fd(hs: SmDppHttpServer, fd: int):
+    """Serve the ES9+ API on an already listening socket, inherited from the supervisor process."""
+    from twisted.internet import reactor
+    from twisted.web.server import Site
+    # determine the address family; detach() so that the file descriptor isn't closed along with sock
+    sock = socket.socket(fileno=fd)
+    family = sock.family
+    sock.detach()
+    reactor.adoptStreamPort(fd, family, Site(hs.app.resource()))
+    reactor.run()
+
+def supervise_workers(host: str, port: int, num_workers: int, argv: List[str]) -> int:
+    """Run num_workers worker processes (instances of this program), which all accept connections on one
+    shared listening socket.  Workers which terminate are restarted, unless they fail right at startup."""
+    sock = socket.create_server((host, port), family=socket.AF_INET6 if ':' in host else socket.AF_INET,
+                                backlog=128)
+    cmd = [sys.executable, argv[0]] + argv[1:] + ['--workers', '1', '--listen-fd', str(sock.fileno())]
+
+    def spawn() -> Tuple[subprocess.Popen, float]:
+        return subprocess.Popen(cmd, pass_fds=(sock.fileno(),)), time.monotonic()
+
+    stopping = False
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+    signal.signal(signal.SIGTERM, _stop)
+
+    workers = [spawn() for i in range(num_workers)]
+    print("Started %u worker processes on %s:%u" % (num_workers, host, port))
+    rc = 0
+    try:
+        while not stopping:
+            time.sleep(0.5)
+            for i, (proc, started) in enumerate(workers):
+                if proc.poll() is None:
+                    continue
+                if time.monotonic() - started < 5:
+                    print("Worker process %u failed at startup (exit code %d)" % (proc.pid, proc.returncode))
+                    stopping = True
+                    rc = 1
+                    break
+                print("Worker process %u terminated (exit code %d), restarting" % (proc.pid, proc.returncode))
+                workers[i] = spawn()
+    except KeyboardInterrupt:
+        pass
+    for proc, _started in workers:
+        if proc.poll() is None:
+            proc.terminate()
+    for proc, _started in workers:
+        proc.wait()
+    return rc
+
 def main(argv):
     parser = argparse.ArgumentParser()
-    #parser.add_argument("-H", "--host", help="Host/IP to bind HTTP to", default="localhost")
-    #parser.add_argument("-p", "--port", help="TCP port to bind HTTP to", default=8000)
+    parser.add_argument("-H", "--host", help="Host/IP to bind HTTP to", default="localhost")
+    parser.add_argument("-p", "--port", help="TCP port to bind HTTP to", type=int, default=8000)
     #parser.add_argument("-v", "--verbose", help="increase output verbosity", action='count', default=0)
-
-    args = parser.parse_args()
-
-    hs = SmDppHttpServer(HOSTNAME, os.path.join(DATA_DIR, 'certs', 'CertificateIssuer'), use_brainpool=False)
-    #hs.app.run(endpoint_description="ssl:port=8000:dhParameters=dh_param_2048.pem")
-    hs.app.run("localhost", 8000)
+    parser.add_argument("--session-store", choices=['sqlite', 'memory'], default='sqlite',
+                        help="Where to store the RSP session state (sqlite: persistent, memory: volatile)")
+    parser.add_argument("--session-ttl", type=float, default=3600,
+                        help="Time (in seconds) after which an inactive RSP session expires")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="""Number of worker processes, which share one listening socket and the (sqlite)
+                        session store""")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="""Number of threads (per worker process) in which the requests, including their
+                        ECDSA/ECDH/BSP cryptography, are processed (default: 0, process them on the reactor
+                        thread)""")
+    # used internally when starting the worker processes
+    parser.add_argument("--listen-fd", type=int, help=argparse.SUPPRESS)
+
+    args = parser.parse_args(argv[1:])
+
+    if args.workers > 1 and args.session_store == 'memory':
+        parser.error("multiple worker processes require the sqlite session store")
+    if args.workers > 1 and args.listen_fd is None:
+        return supervise_workers(args.host, args.port, args.workers, argv)
+
+    if args.session_store == 'memory':
+        rss = rsp.RspSessionStoreMemory(ttl=args.session_ttl)
+    else:
+        rss = rsp.RspSessionStoreSqlite(os.path.join(DATA_DIR, "sm-dp-sessions.sqlite"), ttl=args.session_ttl)
+    hs = SmDppHttpServer(HOSTNAME, os.path.join(DATA_DIR, 'certs', 'CertificateIssuer'), use_brainpool=False,
+                         rss=rss, threaded=args.threads > 0)
+    if args.threads:
+        from twisted.internet import reactor
+        reactor.suggestThreadPoolSize(args.threads)
+    if args.listen_fd is not None:
+        serve_on_fd(hs, args.listen_fd)
+    else:
+        #hs.app.run(endpoint_description="ssl:port=8000:dhParameters=dh_param_2048.pem")
+        hs.app.run(args.host, args.port)
+    return 0
 
 if __name__ == "__main__":
-    main(sys.argv)
+    sys.exit(main(sys.argv))
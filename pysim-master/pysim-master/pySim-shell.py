@@ -20,7 +20,10 @@
 from typing import List, Optional
 
 import json
+import queue
 import traceback
+import multiprocessing
+from contextlib import redirect_stdout, redirect_stderr
 
 import cmd2
 from packaging import version
@@ -56,15 +59,16 @@ from pySim.transport import init_reader, ApduTracer, argparse_add_reader_args, P
 from pySim.utils import sanitize_pin_adm, tabulate_str_list, boxed_heading_str, dec_iccid, sw_match
 from pySim.card_handler import CardHandler, CardHandlerAuto
 
-from pySim.filesystem import CardMF, CardEF, CardDF, CardADF, LinFixedEF, TransparentEF, BerTlvEF
+from pySim.filesystem import CardMF, CardEF, CardDF, CardADF, LinFixedEF, CyclicEF, TransparentEF, BerTlvEF
 from pySim.ts_102_221 import pin_names
 from pySim.ts_102_222 import Ts102222Commands
 from pySim.gsm_r import DF_EIRENE
 from pySim.cat import ProactiveCommand
 
-from pySim.card_key_provider import CardKeyProviderCsv, card_key_provider_register, card_key_provider_get_field
+from pySim.card_key_provider import CardKeyProviderCsv, CardKeyProviderSqlite, card_key_provider_register
+from pySim.card_key_provider import card_key_provider_get_field, card_key_provider_prefetch
 
-from pySim.app import init_card
+from pySim.profile_cache import CardProfileCache, default_cache_path
 
 
 class Cmd2Compat(cmd2.Cmd):
@@ -91,7 +95,7 @@ class PysimApp(Cmd2Compat):
 (C) 2021-2023 by Harald Welte, sysmocom - s.f.m.c. GmbH and contributors
 Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/shell.html """
 
-    def __init__(self, card, rs, sl, ch, script=None):
+    def __init__(self, card, rs, sl, ch, script=None, card_cache=None, reader_opts=None):
         if version.parse(cmd2.__version__) < version.parse("2.0.0"):
             kwargs = {'use_ipython': True}
         else:
@@ -108,9 +112,14 @@ Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/
         self.py_locals = {'card': self.card, 'rs': self.rs, 'lchan': self.lchan}
         self.sl = sl
         self.ch = ch
+        # cache of detected card profiles (see --card-cache), used by the 'equip' command
+        self.card_cache = card_cache
+        # reader related command line options, passed on to the readers of parallel bulk_script runs
+        self.reader_opts = reader_opts
 
         self.numeric_path = False
         self.conserve_write = True
+        self.use_sfi = False
         self.json_pretty_print = True
         self.apdu_trace = False
 
@@ -118,6 +127,8 @@ Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/
                                           onchange_cb=self._onchange_numeric_path))
         self.add_settable(Settable2Compat('conserve_write', bool, 'Read and compare before write', self,
                                           onchange_cb=self._onchange_conserve_write))
+        self.add_settable(Settable2Compat('use_sfi', bool, 'Read EFs of the current DF/ADF by their SFI (no SELECT)',
+                                          self, onchange_cb=self._onchange_use_sfi))
         self.add_settable(Settable2Compat('json_pretty_print', bool, 'Pretty-Print JSON output', self))
         self.add_settable(Settable2Compat('apdu_trace', bool, 'Trace and display APDUs exchanged with card', self,
                                           onchange_cb=self._onchange_apdu_trace))
@@ -153,6 +164,7 @@ Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/
             self.lchan = self.rs.lchan[0]
             self._onchange_conserve_write(
                 'conserve_write', False, self.conserve_write)
+            self._onchange_use_sfi('use_sfi', False, self.use_sfi)
             self._onchange_apdu_trace('apdu_trace', False, self.apdu_trace)
             if self.rs.profile:
                 for cmd_set in self.rs.profile.shell_cmdsets:
@@ -190,6 +202,10 @@ Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/
         if self.rs:
             self.rs.conserve_write = new
 
+    def _onchange_use_sfi(self, param_name, old, new):
+        if self.rs:
+            self.rs.use_sfi = new
+
     def _onchange_apdu_trace(self, param_name, old, new):
         if self.card:
             if new == True:
@@ -234,7 +250,8 @@ Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/
         if self.rs and self.rs.profile:
             for cmd_set in self.rs.profile.shell_cmdsets:
                 self.unregister_command_set(cmd_set)
-        rs, card = init_card(self.sl)
+        from pySim.app import init_card
+        rs, card = init_card(self.sl, self.card_cache)
         self.equip(card, rs)
 
     apdu_cmd_parser = argparse.ArgumentParser()
@@ -309,6 +326,7 @@ Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/
     def _process_card(self, first, script_path):
 
         # Early phase of card initialzation (this part may fail with an exception)
+        from pySim.app import init_card
         try:
             rs, card = init_card(self.sl)
             rc = self.equip(card, rs)
@@ -357,20 +375,21 @@ Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/
                                     help='commandline to execute when card handling has stopped')
     bulk_script_parser.add_argument('--pre_card_action', type=str, default=None,
                                     help='commandline to execute before actually talking to the card')
-
-    @cmd2.with_argparser(bulk_script_parser)
-    @cmd2.with_category(CUSTOM_CATEGORY)
-    def do_bulk_script(self, opts):
-        """Run script on multiple cards (bulk provisioning)"""
-
-        # Make sure that the script file exists and that it is readable.
-        if not os.access(opts.SCRIPT_PATH, os.R_OK):
-            self.poutput("Invalid script file!")
-            return
-
-        success_count = 0
-        fail_count = 0
-
+    bulk_script_parser.add_argument('--pcsc_devices', type=str, default=None,
+                                    help='comma separated list of PC/SC reader numbers; when given, the cards '
+                                    'are processed in parallel, using one worker process per reader')
+    bulk_script_parser.add_argument('--card_handler_configs', type=str, default=None,
+                                    help='comma separated list of card handler config files, one for each reader '
+                                    'passed via --pcsc_devices (manual card handling when omitted)')
+    bulk_script_parser.add_argument('--transcript_dir', type=str, default='.',
+                                    help='directory where the per-card transcripts of a parallel run are stored')
+    bulk_script_parser.add_argument('--prefetch_iccids', type=str, default=None,
+                                    help='file with the ICCIDs (one per line) of the cards of the batch, whose '
+                                    'card data (ADM PIN, keys, ...) is then fetched at once before the run')
+
+    def _bulk_script_loop(self, opts, report):
+        """Fetch one card after another via the card handler and run the bulk script on each of them. The
+        result code of each processing attempt (0 = success, -1 = failure) is passed to report()."""
         first = True
         while 1:
             # TODO: Count consecutive failures, if more than N consecutive failures occur, then stop.
@@ -390,17 +409,9 @@ Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/
 
                     # process the card
                     rc = self._process_card(first, opts.SCRIPT_PATH)
+                    report(rc)
                     if rc == 0:
-                        success_count = success_count + 1
-                        self._show_success_sign()
-                        self.poutput("Statistics: success :%i, failure: %i" % (
-                            success_count, fail_count))
                         break
-                    else:
-                        fail_count = fail_count + 1
-                        self._show_failure_sign()
-                        self.poutput("Statistics: success :%i, failure: %i" % (
-                            success_count, fail_count))
 
                 # Depending on success or failure, the card goes either in the "error" bin or in the
                 # "done" bin.
@@ -433,13 +444,147 @@ Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/
                 traceback.print_exc()
                 self.poutput("---------------------8<---------------------")
                 self.poutput("")
-                fail_count = fail_count + 1
-                self._show_failure_sign()
-                self.poutput("Statistics: success :%i, failure: %i" %
-                             (success_count, fail_count))
+                report(-1)
 
             first = False
 
+    def _bulk_script_prefetch(self, path: str):
+        """Look up the card data of all cards of a batch at once (e.g. in a single SQLite query) instead of
+        card by card.  The file contains the ICCIDs of the cards, one per line."""
+        with open(path, 'r') as f:
+            iccids = [l.strip() for l in f if l.strip()]
+        card_key_provider_prefetch('ICCID', iccids)
+        self.poutput("Prefetched card data of %u cards" % len(iccids))
+
+    def _bulk_script_parallel(self, opts):
+        """Run the bulk script on several readers at the same time. Each reader is served by a separate
+        worker process (see BulkScriptWorker), which owns its transport, card handler and RuntimeState.
+        The parent process only collects and displays the results."""
+        readers = [int(x) for x in opts.pcsc_devices.split(',')]
+        if opts.card_handler_configs:
+            ch_configs = opts.card_handler_configs.split(',')
+            if len(ch_configs) != len(readers):
+                self.poutput("Number of card handler configs does not match number of readers!")
+                return
+        else:
+            ch_configs = [None] * len(readers)
+        if not os.path.isdir(opts.transcript_dir):
+            self.poutput("Invalid transcript directory!")
+            return
+
+        # The workers will open the readers exclusively, so we must release ours (it may be one of them)
+        self.equip(None, None)
+        self.sl.disconnect()
+
+        success_count = 0
+        fail_count = 0
+        try:
+            # The workers inherit the state of this process (registered card key providers etc.) via fork()
+            ctx = multiprocessing.get_context('fork')
+            results = ctx.Queue()
+            workers = []
+            for worker_nr, (pcsc_dev, ch_config) in enumerate(zip(readers, ch_configs)):
+                # same reader options (--pcsc-shared, --pcsc-protocol, ...) as ours, but a different reader
+                reader_opts = argparse.Namespace(**vars(self.reader_opts or argparse.Namespace()))
+                reader_opts.pcsc_dev = pcsc_dev
+                reader_opts.pcsc_regex = None
+                proc = ctx.Process(target=bulk_script_worker, name='bulk_script-%u' % worker_nr,
+                                   args=(worker_nr, reader_opts, ch_config, opts, results))
+                proc.start()
+                workers.append(proc)
+                self.poutput("Started worker %u on PC/SC reader %u (pid %u)" % (worker_nr, pcsc_dev, proc.pid))
+
+            # workers which have finished (or died), and those which we found dead while waiting for results
+            finished = set()
+            dead = set()
+            while len(finished) < len(workers):
+                try:
+                    (worker_nr, rc, transcript) = results.get(timeout=1.0)
+                except queue.Empty:
+                    # A worker that was killed (by a signal, the OOM killer, ...) cannot tell us that it has
+                    # finished.  Everything it sent before it died is in the queue at the time we find it dead,
+                    # so if it has not finished by the next time the queue runs empty, it never will.
+                    for worker_nr, proc in enumerate(workers):
+                        if worker_nr in finished or proc.is_alive():
+                            continue
+                        if worker_nr not in dead:
+                            dead.add(worker_nr)
+                            continue
+                        finished.add(worker_nr)
+                        fail_count = fail_count + 1
+                        self.poutput("Reader %u: failure, worker %u exited unexpectedly (exit code %s)"
+                                     % (readers[worker_nr], worker_nr, proc.exitcode))
+                        self.poutput("Statistics: success :%i, failure: %i" % (success_count, fail_count))
+                    continue
+                except (KeyboardInterrupt):
+                    # The workers are in the same process group and receive the SIGINT as well, we keep
+                    # collecting results until all of them have stopped.
+                    self.poutput("")
+                    self.poutput("Terminated by user, waiting for workers to stop...")
+                    continue
+                if rc is None:
+                    # worker has finished
+                    finished.add(worker_nr)
+                    continue
+                if rc == 0:
+                    success_count = success_count + 1
+                    result = "success"
+                else:
+                    fail_count = fail_count + 1
+                    result = "failure"
+                self.poutput("Reader %u: %s, transcript: %s" % (readers[worker_nr], result, transcript))
+                self.poutput("Statistics: success :%i, failure: %i" % (success_count, fail_count))
+
+            for proc in workers:
+                proc.join()
+        finally:
+            # Take the reader back, so that the shell can be used with the card in it again
+            from pySim.app import init_card
+            try:
+                rs, card = init_card(self.sl, self.card_cache)
+                self.equip(card, rs)
+            except Exception as e:
+                self.poutput("Card initialization (%s) failed after bulk_script: %s" % (str(self.sl), str(e)))
+                self.poutput("Use the 'equip' command to re-initialize the card")
+
+        if success_count + fail_count:
+            if fail_count:
+                self._show_failure_sign()
+            else:
+                self._show_success_sign()
+        self.poutput("Statistics: success :%i, failure: %i" % (success_count, fail_count))
+
+    @cmd2.with_argparser(bulk_script_parser)
+    @cmd2.with_category(CUSTOM_CATEGORY)
+    def do_bulk_script(self, opts):
+        """Run script on multiple cards (bulk provisioning)"""
+
+        # Make sure that the script file exists and that it is readable.
+        if not os.access(opts.SCRIPT_PATH, os.R_OK):
+            self.poutput("Invalid script file!")
+            return
+
+        # With parallel processing, the workers inherit the prefetched data.
+        if opts.prefetch_iccids:
+            self._bulk_script_prefetch(opts.prefetch_iccids)
+
+        if opts.pcsc_devices:
+            self._bulk_script_parallel(opts)
+            return
+
+        stats = {'success': 0, 'failure': 0}
+
+        def report(rc):
+            if rc == 0:
+                stats['success'] += 1
+                self._show_success_sign()
+            else:
+                stats['failure'] += 1
+                self._show_failure_sign()
+            self.poutput("Statistics: success :%i, failure: %i" % (stats['success'], stats['failure']))
+
+        self._bulk_script_loop(opts, report)
+
     echo_parser = argparse.ArgumentParser()
     echo_parser.add_argument('STRING', help="string to echo on the shell", nargs='+')
 
@@ -557,6 +702,23 @@ class PySimCommands(CommandSet):
         """Display a filesystem-tree with all selectable files"""
         self.__walk()
 
+    def __sfi_ef(self, file):
+        """ Return the given EF if its contents can be read by its SFI, without selecting it (which is the case
+        for transparent and record oriented EFs in the currently selected DF/ADF when the 'use_sfi' setting is
+        enabled), None otherwise """
+        if isinstance(file, (TransparentEF, LinFixedEF)) and self._cmd.lchan.sfi_of(file) is not None:
+            return file
+        return None
+
+    @staticmethod
+    def __ef_structure(ef) -> str:
+        """ Structure of an EF according to the file system model (when there is no FCP of the EF) """
+        if isinstance(ef, CyclicEF):
+            return 'cyclic'
+        if isinstance(ef, LinFixedEF):
+            return 'linear_fixed'
+        return 'transparent'
+
     def __export_file(self, filename, context, as_json):
         """ Select and export a single file (EF, DF or ADF) """
         context['COUNT'] += 1
@@ -571,6 +733,15 @@ class PySimCommands(CommandSet):
             raise RuntimeError("cannot export, file %s does not exist in the file system tree" % filename)
 
         try:
+            sfi_ef = self.__sfi_ef(file)
+            if sfi_ef:
+                # read by its SFI, without selecting it, so there is no FCP
+                self._cmd.poutput("# file: %s (%s), read by SFI %s" % (sfi_ef.name, sfi_ef.fid, sfi_ef.sfid))
+                self._cmd.poutput("# structure: %s" % self.__ef_structure(sfi_ef))
+                self._cmd.poutput("select " + sfi_ef.fully_qualified_path_str())
+                self._cmd.poutput(sfi_ef.export(as_json, self._cmd.lchan, ef=sfi_ef))
+                self._cmd.poutput("#")
+                return
             fcp_dec = self._cmd.lchan.select_file(file, self._cmd)
             self._cmd.poutput("# file: %s (%s)" %
                               (self._cmd.lchan.selected_file.name, self._cmd.lchan.selected_file.fid))
@@ -646,38 +817,43 @@ class PySimCommands(CommandSet):
             raise RuntimeError("cannot dump, file %s does not exist in the file system tree" % filename)
 
         try:
-            fcp_dec = self._cmd.lchan.select(filename, self._cmd)
-
-            # File control parameters (common for EF, DF and ADF files)
-            if not self._cmd.lchan.selected_file_fcp_hex:
-                # An application without a real ADF (like ADF.ARA-M) / filesystem
-                return
+            # EFs which can be read by their SFI are not selected, their FCP is not included then
+            sfi_ef = self.__sfi_ef(file)
+            if not sfi_ef:
+                fcp_dec = self._cmd.lchan.select(filename, self._cmd)
+
+                # File control parameters (common for EF, DF and ADF files)
+                if not self._cmd.lchan.selected_file_fcp_hex:
+                    # An application without a real ADF (like ADF.ARA-M) / filesystem
+                    return
 
-            res['fcp_raw'] = str(self._cmd.lchan.selected_file_fcp_hex)
-            res['fcp'] = fcp_dec
+                res['fcp_raw'] = str(self._cmd.lchan.selected_file_fcp_hex)
+                res['fcp'] = fcp_dec
 
             # File structure and contents (EF only)
-            if isinstance(self._cmd.lchan.selected_file, CardEF):
-                structure = self._cmd.lchan.selected_file_structure()
+            if sfi_ef or isinstance(self._cmd.lchan.selected_file, CardEF):
+                if sfi_ef:
+                    structure = self.__ef_structure(sfi_ef)
+                else:
+                    structure = self._cmd.lchan.selected_file_structure()
                 if structure == 'transparent':
                     if as_json:
-                        result = self._cmd.lchan.read_binary_dec()
+                        result = self._cmd.lchan.read_binary_dec(ef=sfi_ef)
                         body = result[0]
                     else:
-                        result = self._cmd.lchan.read_binary()
+                        result = self._cmd.lchan.read_binary(ef=sfi_ef)
                         body = str(result[0])
                 elif structure == 'cyclic' or structure == 'linear_fixed':
                     body = []
                     # Use number of records specified in select response
-                    num_of_rec = self._cmd.lchan.selected_file_num_of_rec()
+                    num_of_rec = None if sfi_ef else self._cmd.lchan.selected_file_num_of_rec()
                     if num_of_rec:
-                        for r in range(1, num_of_rec + 1):
-                            if as_json:
-                                result = self._cmd.lchan.read_record_dec(r)
-                                body.append(result[0])
-                            else:
-                                result = self._cmd.lchan.read_record(r)
-                                body.append(str(result[0]))
+                        if as_json:
+                            (records, _sw) = self._cmd.lchan.read_records_dec(range(1, num_of_rec + 1))
+                            body = list(records.values())
+                        else:
+                            (records, _sw) = self._cmd.lchan.read_records(range(1, num_of_rec + 1))
+                            body = [str(data) for data in records.values()]
 
                     # When the select response does not return the number of records, read until we hit the
                     # first record that cannot be read.
@@ -686,14 +862,14 @@ class PySimCommands(CommandSet):
                         while True:
                             try:
                                 if as_json:
-                                    result = self._cmd.lchan.read_record_dec(r)
+                                    result = self._cmd.lchan.read_record_dec(r, ef=sfi_ef)
                                     body.append(result[0])
                                 else:
-                                    result = self._cmd.lchan.read_record(r)
+                                    result = self._cmd.lchan.read_record(r, ef=sfi_ef)
                                     body.append(str(result[0]))
                             except SwMatchError as e:
-                                # We are past the last valid record - stop
-                                if e.sw_actual == "9402":
+                                # We are past the last valid record (9402: TS 51.011, 6a83: ISO/IEC 7816-4) - stop
+                                if e.sw_actual in ["9402", "6a83"]:
                                     break
                                 # Some other problem occurred
                                 raise e
@@ -1033,6 +1209,58 @@ class Proact(ProactiveHandler):
         # TODO: implement the basics, such as SMS Sending, ...
 
 
+class BulkScriptWorker(PysimApp):
+    """PysimApp that processes the cards of a single reader during a parallel bulk_script run. It runs in a
+    process of its own, with its own transport, card handler and RuntimeState. The output of each card is
+    written into a separate transcript file, the results are reported to the parent via a queue."""
+
+    def __init__(self, worker_nr: int, sl, ch, transcript_dir: str, results):
+        super().__init__(None, None, sl, ch)
+        self.worker_nr = worker_nr
+        self.transcript_dir = transcript_dir
+        self.results = results
+        self.card_count = 0
+        self.transcript = None
+
+    def _process_card(self, first, script_path):
+        self.card_count += 1
+        self.transcript = os.path.join(self.transcript_dir, 'bulk_reader%02u_card%05u.log' %
+                                       (self.worker_nr, self.card_count))
+        stdout = self.stdout
+        with open(self.transcript, 'w') as f, redirect_stdout(f), redirect_stderr(f):
+            self.stdout = f
+            try:
+                return super()._process_card(first, script_path)
+            finally:
+                self.stdout = stdout
+
+    def report(self, rc):
+        self.results.put((self.worker_nr, rc, self.transcript))
+
+
+def bulk_script_worker(worker_nr: int, reader_opts: argparse.Namespace, ch_config: Optional[str], opts, results):
+    """Entry point of a bulk_script worker process (see PysimApp.do_bulk_script).  'reader_opts' are the
+    PC/SC reader options (see PcscSimLink) of the reader served by the worker."""
+    # Everything that is not related to a specific card (card handler output etc.) goes into a per-reader log
+    from pySim.transport.pcsc import PcscSimLink
+    log_path = os.path.join(opts.transcript_dir, 'bulk_reader%02u.log' % worker_nr)
+    with open(log_path, 'w') as log, redirect_stdout(log), redirect_stderr(log):
+        try:
+            sl = PcscSimLink(reader_opts, proactive_handler=Proact())
+            if ch_config:
+                ch = CardHandlerAuto(None, ch_config)
+            else:
+                ch = CardHandler(sl)
+            app = BulkScriptWorker(worker_nr, sl, ch, opts.transcript_dir, results)
+            app.stdout = log
+            app._bulk_script_loop(opts, app.report)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            # tell the parent that we are done
+            results.put((worker_nr, None, None))
+
+
 
 option_parser = argparse.ArgumentParser(description='interactive SIM card shell',
                                         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -1043,12 +1271,17 @@ global_group.add_argument('--script', metavar='PATH', default=None,
                           help='script with pySim-shell commands to be executed automatically at start-up')
 global_group.add_argument('--csv', metavar='FILE',
                           default=None, help='Read card data from CSV file')
+global_group.add_argument('--sqlite', metavar='FILE',
+                          default=None, help='Read card data from SQLite database (table card_data)')
 global_group.add_argument('--csv-column-key', metavar='FIELD:AES_KEY_HEX', default=[], action='append',
-                          help='per-CSV-column AES transport key')
+                          help='per-CSV-column AES transport key (also applies to --sqlite)')
 global_group.add_argument("--card_handler", dest="card_handler_config", metavar="FILE",
                           help="Use automatic card handling machine")
 global_group.add_argument("--noprompt", help="Run in non interactive mode",
                           action='store_true', default=False)
+global_group.add_argument('--card-cache', metavar='FILE', nargs='?', const=default_cache_path(), default=None,
+                          help='Cache the detected card profile, add-ons and applications (by ATR + ICCID) in FILE '
+                          'to skip probing the card on the next start (default FILE: %s)' % default_cache_path())
 
 adm_group = global_group.add_mutually_exclusive_group()
 adm_group.add_argument('-a', '--pin-adm', metavar='PIN_ADM1', dest='pin_adm', default=None,
@@ -1078,6 +1311,8 @@ if __name__ == '__main__':
     csv_default = str(Path.home()) + "/.osmocom/pysim/card_data.csv"
     if opts.csv:
         card_key_provider_register(CardKeyProviderCsv(opts.csv, csv_column_keys))
+    if opts.sqlite:
+        card_key_provider_register(CardKeyProviderSqlite(opts.sqlite, csv_column_keys))
     if os.path.isfile(csv_default):
         card_key_provider_register(CardKeyProviderCsv(csv_default, csv_column_keys))
 
@@ -1093,9 +1328,12 @@ if __name__ == '__main__':
     # Detect and initialize the card in the reader. This may fail when there
     # is no card in the reader or the card is unresponsive. PysimApp is
     # able to tolerate and recover from that.
+    # card profiles and applications are only imported now, so that e.g. '--help' is not delayed by them
+    from pySim.app import init_card
+    card_cache = CardProfileCache(opts.card_cache) if opts.card_cache else None
     try:
-        rs, card = init_card(sl)
-        app = PysimApp(card, rs, sl, ch)
+        rs, card = init_card(sl, card_cache)
+        app = PysimApp(card, rs, sl, ch, card_cache=card_cache, reader_opts=opts)
     except:
         startup_errors = True
         print("Card initialization (%s) failed with an exception:" % str(sl))
@@ -1107,7 +1345,7 @@ if __name__ == '__main__':
             print(" it should also be noted that some readers may behave strangely when no card")
             print(" is inserted.)")
             print("")
-        app = PysimApp(None, None, sl, ch)
+        app = PysimApp(None, None, sl, ch, card_cache=card_cache, reader_opts=opts)
 
     # If the user supplies an ADM PIN at via commandline args authenticate
     # immediately so that the user does not have to use the shell commands
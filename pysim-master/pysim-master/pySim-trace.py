@@ -1,11 +1,20 @@
 #!/usr/bin/env python3
 
+import os
 import sys
+import heapq
+import pickle
+import tempfile
+import itertools
+import contextlib
+import multiprocessing
 import logging, colorlog
 import argparse
+from typing import List, Optional, Tuple
 from pprint import pprint as pp
 
 from pySim.apdu import *
+from pySim.apdu.output import OUTPUT_FORMATS, BUFFER_SIZE, ApduOutput, open_output_stream
 from pySim.runtime import RuntimeState
 
 from osmocom.utils import JsonEncoder
@@ -14,16 +23,8 @@ from pySim.cards import UiccCardBase
 from pySim.commands import SimCardCommands
 from pySim.profile import CardProfile
 from pySim.ts_102_221 import CardProfileUICC
-from pySim.ts_31_102 import CardApplicationUSIM
-from pySim.ts_31_103 import CardApplicationISIM
-from pySim.euicc import CardApplicationISDR, CardApplicationECASD
 from pySim.transport import LinkBase
 
-from pySim.apdu_source.gsmtap import GsmtapApduSource
-from pySim.apdu_source.pyshark_rspro import PysharkRsproPcap, PysharkRsproLive
-from pySim.apdu_source.pyshark_gsmtap import PysharkGsmtapPcap
-from pySim.apdu_source.tca_loader_log import TcaLoaderLogApduSource
-
 from pySim.apdu.ts_102_221 import UiccSelect, UiccStatus
 
 log_format='%(log_color)s%(levelname)-8s%(reset)s %(name)s: %(message)s'
@@ -34,8 +35,8 @@ logger = colorlog.getLogger()
 # the one from the 'last' set in the addition below will prevail.
 from pySim.apdu.ts_102_221 import ApduCommands as UiccApduCommands
 from pySim.apdu.ts_31_102 import ApduCommands as UsimApduCommands
-from pySim.apdu.global_platform import ApduCommands as GpApduCommands
-ApduCommands = UiccApduCommands + UsimApduCommands #+ GpApduCommands
+# (the GlobalPlatform commands of pySim.apdu.global_platform are not part of the set yet)
+ApduCommands = UiccApduCommands + UsimApduCommands
 
 
 class DummySimLink(LinkBase):
@@ -79,6 +80,10 @@ class Tracer:
     def __init__(self, **kwargs):
         # we assume a generic UICC profile; as all APDUs return 9000 in DummySimLink above,
         # all CardProfileAddon (including SIM) will probe successful.
+        # The applications are imported only here, as the eUICC ones pull in GlobalPlatform support.
+        from pySim.ts_31_102 import CardApplicationUSIM
+        from pySim.ts_31_103 import CardApplicationISIM
+        from pySim.euicc import CardApplicationISDR, CardApplicationECASD
         profile = CardProfileUICC()
         profile.add_application(CardApplicationUSIM())
         profile.add_application(CardApplicationISIM())
@@ -87,13 +92,15 @@ class Tracer:
         scc = SimCardCommands(transport=DummySimLink())
         card = UiccCardBase(scc)
         self.rs = RuntimeState(card, profile)
-        # APDU Decoder
-        self.ad = ApduDecoder(ApduCommands)
+        # APDU Decoder; decode lazily, as most APDUs (SELECT, STATUS) are only needed for state tracking
+        self.ad = ApduDecoder(ApduCommands, lazy=True)
         # parameters
         self.suppress_status = kwargs.get('suppress_status', True)
         self.suppress_select = kwargs.get('suppress_select', True)
         self.show_raw_apdu = kwargs.get('show_raw_apdu', False)
         self.source = kwargs.get('source', None)
+        # machine-readable output (ApduOutput); human-readable output on stdout if None
+        self.output = kwargs.get('output', None)
 
     def format_capdu(self, apdu: Apdu, inst: ApduCommand):
         """Output a single decoded + processed ApduCommand."""
@@ -117,12 +124,19 @@ class Tracer:
                 apdu = self.source.read()
                 apdu_counter = apdu_counter + 1
             except StopIteration:
-                print("%i APDUs parsed, stop iteration." % apdu_counter)
+                if self.output:
+                    self.output.flush()
+                    logger.info("%i APDUs parsed, stop iteration.", apdu_counter)
+                else:
+                    print("%i APDUs parsed, stop iteration." % apdu_counter)
                 return 0
 
             if isinstance(apdu, CardReset):
                 self.rs.reset()
-                self.format_reset(apdu)
+                if self.output:
+                    self.output.output_reset(apdu, self.source.timestamp)
+                else:
+                    self.format_reset(apdu)
                 continue
 
             # ask ApduDecoder to look-up (INS,CLA) + instantiate an ApduCommand derived
@@ -137,7 +151,106 @@ class Tracer:
             if self.suppress_status and isinstance(inst, UiccStatus):
                 continue
 
-            self.format_capdu(apdu, inst)
+            if self.output:
+                self.output.output_apdu(inst, self.source.timestamp)
+            else:
+                self.format_capdu(apdu, inst)
+
+
+class _PartitionOutput(ApduOutput):
+    """Intermediate output of one partition in batch mode: The records (tagged with the name of the card)
+    are pickled into a temporary file, from which they are merged in timestamp order later on."""
+    def __init__(self, stream, card: str):
+        super().__init__(stream, flush_interval=3600)
+        self.card = card
+
+    def encode(self, rec):
+        rec['card'] = self.card
+        return pickle.dumps(rec, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _read_partition_output(filename: str):
+    if not os.path.exists(filename):
+        return
+    with open(filename, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+def _batch_partitions(job) -> List[Tuple[str, str, Optional[str]]]:
+    """Worker function: Determine the partitions (cards) of one capture file."""
+    from pySim.apdu_source.gsmtap_pcap import gsmtap_pcap_senders
+    pcap_file, udp_port, split_senders = job
+    name = os.path.basename(pcap_file)
+    senders = gsmtap_pcap_senders(pcap_file, udp_port) if split_senders else []
+    if len(senders) <= 1:
+        return [(name, pcap_file, None)]
+    return [('%s@%s' % (name, sender), pcap_file, sender) for sender in senders]
+
+def _batch_decode(job) -> Tuple[str, Optional[str]]:
+    """Worker function: Decode one partition, using a Tracer (and hence RuntimeState) of its own."""
+    from pySim.apdu_source.gsmtap_pcap import GsmtapPcapApduSource
+    (card, pcap_file, sender), opts, out_filename = job
+    try:
+        f = open(out_filename, 'wb', buffering=BUFFER_SIZE)
+        if opts.per_card_output:
+            output = OUTPUT_FORMATS[opts.output](f)
+        else:
+            output = _PartitionOutput(f, card)
+        # the card probing of the Tracer is the same for every partition; don't clutter the console with it
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            tracer = Tracer(source=GsmtapPcapApduSource(pcap_file, opts.udp_port, sender),
+                            suppress_status=opts.suppress_status, suppress_select=opts.suppress_select,
+                            output=output)
+            try:
+                tracer.main()
+            finally:
+                output.close()
+    except Exception as e:
+        logger.error('%s: %s', card, e)
+        return (card, str(e))
+    return (card, None)
+
+def batch_main(opts) -> int:
+    """Decode a number of GSMTAP pcap files in a pool of worker processes.  Each file (or each GSMTAP sender
+    within a file) is a partition that is decoded with its own RuntimeState.  The results are either merged
+    (in timestamp order) into one output, or written to one output file per partition."""
+    errors = 0
+    with multiprocessing.Pool(opts.jobs) as pool:
+        jobs = [(f, opts.udp_port, opts.split_senders) for f in opts.pcap_file]
+        partitions = list(itertools.chain.from_iterable(pool.map(_batch_partitions, jobs)))
+        logger.info('Decoding %u partitions of %u files...', len(partitions), len(opts.pcap_file))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            if opts.per_card_output:
+                os.makedirs(opts.per_card_output, exist_ok=True)
+                # card names may contain the IP address + port of the GSMTAP sender
+                fname_chars = str.maketrans(':[]', '___')
+                out_filenames = [os.path.join(opts.per_card_output,
+                                              '%s.%s' % (card.translate(fname_chars), opts.output))
+                                 for card, _f, _s in partitions]
+            else:
+                out_filenames = [os.path.join(tmpdir, '%u.pickle' % i) for i in range(len(partitions))]
+            for card, error in pool.imap_unordered(_batch_decode, zip(partitions, itertools.repeat(opts),
+                                                                      out_filenames)):
+                if error:
+                    errors += 1
+                else:
+                    logger.info('%s: done', card)
+            if not opts.per_card_output:
+                output = OUTPUT_FORMATS[opts.output](open_output_stream(opts.output_file),
+                                                     opts.output_flush_interval)
+                try:
+                    for rec in heapq.merge(*[_read_partition_output(f) for f in out_filenames],
+                                           key=lambda rec: rec['ts'] or 0):
+                        output.write(rec)
+                finally:
+                    output.close()
+    if errors:
+        logger.error('Decoding of %u partitions failed', errors)
+        return 1
+    return 0
+
 
 option_parser = argparse.ArgumentParser(description='Osmocom pySim high-level SIM card trace decoder',
                                         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -154,6 +267,18 @@ global_group.add_argument('--no-suppress-status', action='store_false', dest='su
     information that was not already received in resposne to the most recent SEELCT.""")
 global_group.add_argument('--show-raw-apdu', action='store_true', dest='show_raw_apdu',
                           help="""Show the raw APDU in addition to its parsed form.""")
+global_group.add_argument('--output', choices=list(OUTPUT_FORMATS.keys()), default='text',
+                          help="""
+    Output format. 'text' is the human-readable output. 'jsonl' (one JSON object per line) and 'msgpack'
+    (a stream of MessagePack maps) stream one compact record per APDU (timestamp, logical channel, command,
+    path, status word and decoded data) for consumption by other programs.""")
+global_group.add_argument('--output-file', default='-',
+                          help="""
+    Where to write the output: '-' for stdout, a file name, 'tcp:HOST:PORT' or 'unix:PATH' to stream it
+    to a socket.""")
+global_group.add_argument('--output-flush-interval', type=float, default=1.0,
+                          help="""
+    Maximum time (in seconds) for which the output of --output is buffered. 0 flushes after each APDU.""")
 
 
 subparsers = option_parser.add_subparsers(help='APDU Source', dest='source', required=True)
@@ -166,6 +291,33 @@ parser_gsmtap.add_argument('-i', '--bind-ip', default='127.0.0.1',
 parser_gsmtap.add_argument('-p', '--bind-port', default=4729,
                            help='Local UDP port')
 
+parser_gsmtap_pcap = subparsers.add_parser('gsmtap-pcap', help="""
+    Read APDUs from PCAP file containing GSMTAP (SIM APDU) communication; processed natively (without
+    tshark), which is much faster than gsmtap-pyshark-pcap.  Use this if you have recorded a PCAP file
+    containing GSMTAP (SIM APDU) e.g. via tcpdump or wireshark/tshark.""")
+parser_gsmtap_pcap.add_argument('-f', '--pcap-file', required=True,
+                                help='Name of the PCAP[ng] file to be read')
+parser_gsmtap_pcap.add_argument('-p', '--udp-port', type=int, default=4729,
+                                help='UDP port of the GSMTAP packets')
+
+parser_gsmtap_pcap_batch = subparsers.add_parser('gsmtap-pcap-batch', help="""
+    Read APDUs from any number of PCAP files containing GSMTAP (SIM APDU) communication, like
+    gsmtap-pcap, but decode them in parallel.  Each file, or each GSMTAP sender (source IP address + UDP
+    port, e.g. one simtrace2-sniff instance) within a file, is assumed to be a different card and is
+    decoded with a state of its own.""")
+parser_gsmtap_pcap_batch.add_argument('-f', '--pcap-file', required=True, nargs='+',
+                                      help='Name(s) of the PCAP[ng] file(s) to be read')
+parser_gsmtap_pcap_batch.add_argument('-p', '--udp-port', type=int, default=4729,
+                                      help='UDP port of the GSMTAP packets')
+parser_gsmtap_pcap_batch.add_argument('-j', '--jobs', type=int,
+                                      help='Number of worker processes (default: number of CPUs)')
+parser_gsmtap_pcap_batch.add_argument('--no-split-senders', action='store_false', dest='split_senders',
+                                      help="Don't split files with several GSMTAP senders into one card per sender")
+parser_gsmtap_pcap_batch.add_argument('--per-card-output', metavar='DIR',
+                                      help="""
+    Write one output file per card into the given directory, instead of merging the output of all
+    cards (in timestamp order) into one output (--output-file).""")
+
 parser_gsmtap_pyshark_pcap = subparsers.add_parser('gsmtap-pyshark-pcap', help="""
     Read APDUs from PCAP file containing GSMTAP (SIM APDU) communication; processed via pyshark.
     Use this if you have recorded a PCAP file containing GSMTAP (SIM APDU) e.g. via tcpdump or
@@ -194,22 +346,47 @@ if __name__ == '__main__':
 
     opts = option_parser.parse_args()
 
+    if opts.source == 'gsmtap-pcap-batch':
+        sys.exit(batch_main(opts))
+
     logger.info('Opening source %s...', opts.source)
+    # the sources are imported only when used, to keep the startup time (and e.g. '--help') fast
     if opts.source == 'gsmtap-udp':
+        from pySim.apdu_source.gsmtap import GsmtapApduSource
         s = GsmtapApduSource(opts.bind_ip, opts.bind_port)
+    elif opts.source == 'gsmtap-pcap':
+        from pySim.apdu_source.gsmtap_pcap import GsmtapPcapApduSource
+        s = GsmtapPcapApduSource(opts.pcap_file, opts.udp_port)
     elif opts.source == 'rspro-pyshark-pcap':
+        from pySim.apdu_source.pyshark_rspro import PysharkRsproPcap
         s = PysharkRsproPcap(opts.pcap_file)
     elif opts.source == 'rspro-pyshark-live':
+        from pySim.apdu_source.pyshark_rspro import PysharkRsproLive
         s = PysharkRsproLive(opts.interface)
     elif opts.source == 'gsmtap-pyshark-pcap':
+        from pySim.apdu_source.pyshark_gsmtap import PysharkGsmtapPcap
         s = PysharkGsmtapPcap(opts.pcap_file)
     elif opts.source == 'tca-loader-log':
+        from pySim.apdu_source.tca_loader_log import TcaLoaderLogApduSource
         s = TcaLoaderLogApduSource(opts.log_file)
     else:
         raise ValueError("unsupported source %s", opts.source)
 
-    tracer = Tracer(source=s, suppress_status=opts.suppress_status, suppress_select=opts.suppress_select,
-                    show_raw_apdu=opts.show_raw_apdu)
-    logger.info('Entering main loop...')
-    tracer.main()
+    output = None
+    redirect = contextlib.nullcontext()
+    if opts.output != 'text' or opts.output_file != '-':
+        output = OUTPUT_FORMATS[opts.output](open_output_stream(opts.output_file), opts.output_flush_interval)
+        if opts.output_file == '-':
+            # keep any informational print() output out of the record stream
+            redirect = contextlib.redirect_stdout(sys.stderr)
+
+    with redirect:
+        tracer = Tracer(source=s, suppress_status=opts.suppress_status, suppress_select=opts.suppress_select,
+                        show_raw_apdu=opts.show_raw_apdu, output=output)
+        logger.info('Entering main loop...')
+        try:
+            tracer.main()
+        finally:
+            if output:
+                output.close()
 
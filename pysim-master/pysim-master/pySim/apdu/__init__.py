@@ -27,7 +27,7 @@ we already know in pySim about the filesystem structure, file encoding, etc.
 
 import abc
 import typing
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Callable
 from termcolor import colored
 from construct import Byte, GreedyBytes
 from construct import Optional as COptional
@@ -142,6 +142,16 @@ class Apdu(Tpdu):
         return False
 
 
+class _DeferredResult:
+    """A function call whose evaluation is deferred until the result is needed."""
+    def __init__(self, func: Callable, *args):
+        self.func = func
+        self.args = args
+
+    def __call__(self):
+        return self.func(*self.args)
+
+
 class ApduCommand(Apdu, metaclass=ApduCommandMeta):
     """Base class from which you would derive individual commands/instructions like SELECT.
        A derived class represents a decoder for a specific instruction.
@@ -154,23 +164,85 @@ class ApduCommand(Apdu, metaclass=ApduCommandMeta):
     _tlv = None
     _tlv_rsp = None
 
-    def __init__(self, cmd: BytesOrHex, rsp: Optional[BytesOrHex] = None):
-        """Instantiate a new ApduCommand from give cmd + resp."""
+    def __init__(self, cmd: BytesOrHex, rsp: Optional[BytesOrHex] = None, lazy: bool = False):
+        """Instantiate a new ApduCommand from give cmd + resp.
+
+        Args:
+            cmd : command part of the APDU (header + command data)
+            rsp : response part of the APDU (response data + status word)
+            lazy : defer decoding of the command/response (cmd_dict, rsp_dict) and of the processed
+                   result until they are accessed. process() will then only track the state.
+        """
         # store raw data
         super().__init__(cmd, rsp)
+        self.lazy = lazy
         # default to 'empty' ID column. To be set to useful values (like record number)
         # by derived class {cmd_rsp}_to_dict() or process() methods
-        self.col_id = '-'
+        self._col_id = '-'
         # fields only set by process_* methods
         self.file = None
         self.lchan = None
-        self.processed = None
+        self._processed = None
         # the methods below could raise exceptions and those handlers might assume cmd_{dict,resp}
-        self.cmd_dict = None
-        self.rsp_dict = None
+        self._cmd_dict = None
+        self._rsp_dict = None
         # interpret the data
-        self.cmd_dict = self.cmd_to_dict()
-        self.rsp_dict = self.rsp_to_dict() if self.rsp else {}
+        if not lazy:
+            self.cmd_dict = self.cmd_to_dict()
+            self.rsp_dict = self.rsp_to_dict() if self.rsp else {}
+
+    @property
+    def cmd_dict(self) -> Dict:
+        """Decoded command part of the APDU (see cmd_to_dict)."""
+        if self._cmd_dict is None and self.lazy:
+            self._cmd_dict = self.cmd_to_dict()
+        return self._cmd_dict
+
+    @cmd_dict.setter
+    def cmd_dict(self, value: Dict):
+        self._cmd_dict = value
+
+    @property
+    def rsp_dict(self) -> Dict:
+        """Decoded response part of the APDU (see rsp_to_dict)."""
+        if self._rsp_dict is None and self.lazy:
+            self._rsp_dict = self.rsp_to_dict() if self.rsp else {}
+        return self._rsp_dict
+
+    @rsp_dict.setter
+    def rsp_dict(self, value: Dict):
+        self._rsp_dict = value
+
+    @property
+    def col_id(self) -> str:
+        """ID column (like record number) for display purposes."""
+        # derived classes may set this while decoding the command
+        if self._cmd_dict is None and self.lazy:
+            self.cmd_dict # pylint: disable=pointless-statement
+        return self._col_id
+
+    @col_id.setter
+    def col_id(self, value: str):
+        self._col_id = value
+
+    @property
+    def processed(self):
+        """Result of process(); in lazy mode its (expensive) decoding happens on first access."""
+        if isinstance(self._processed, _DeferredResult):
+            self._processed = self._processed()
+        return self._processed
+
+    @processed.setter
+    def processed(self, value):
+        self._processed = value
+
+    def _defer(self, func: Callable, *args):
+        """Helper for process_* methods of derived classes: Call func(*args) to compute the processed
+        result; in lazy mode the call is deferred until the processed result is accessed. func must not
+        depend on (or modify) the RuntimeState, as that will have moved on by then."""
+        if self.lazy:
+            return _DeferredResult(func, *args)
+        return func(*args)
 
 
     @classmethod
@@ -179,7 +251,7 @@ class ApduCommand(Apdu, metaclass=ApduCommandMeta):
         return cls(cmd=apdu.cmd, rsp=apdu.rsp, **kwargs)
 
     @classmethod
-    def from_bytes(cls, buffer:bytes) -> 'ApduCommand':
+    def from_bytes(cls, buffer:bytes, **kwargs) -> 'ApduCommand':
         """Instantiate an ApduCommand from a linear byte buffer containing hdr,cmd,rsp,sw.
         This is for example used when parsing GSMTAP traces that traditionally contain the
         full command and response portion in one packet: "CLA INS P1 P2 P3 DATA SW" and we
@@ -187,11 +259,11 @@ class ApduCommand(Apdu, metaclass=ApduCommandMeta):
         apdu_case = cls.get_apdu_case(buffer)
         if apdu_case in [1, 2]:
             # data is part of response
-            return cls(buffer[:5], buffer[5:])
+            return cls(buffer[:5], buffer[5:], **kwargs)
         if apdu_case in [3, 4]:
             # data is part of command
             lc = buffer[4]
-            return cls(buffer[:5+lc], buffer[5+lc:])
+            return cls(buffer[:5+lc], buffer[5+lc:], **kwargs)
         raise ValueError('%s: Invalid APDU Case %u' % (cls.__name__, apdu_case))
 
     @property
@@ -245,17 +317,19 @@ class ApduCommand(Apdu, metaclass=ApduCommandMeta):
 
     def process(self, rs: RuntimeState):
         # if there is a global method, use that; else use process_on_lchan
+        # (in lazy mode, the result is returned still deferred: use the processed property to evaluate it)
         method = getattr(self, 'process_global', None)
         if callable(method):
             self.processed = method(rs)
-            return self.processed
+            return self._processed
         method = getattr(self, 'process_on_lchan', None)
         if callable(method):
             self.lchan = rs.get_lchan_by_cla(self.cla)
             self.processed = method(self.lchan)
-            return self.processed
+            return self._processed
         # if none of the two methods exist:
-        return self._process_fallback(rs)
+        self._process_fallback(rs)
+        return self._processed
 
     @classmethod
     def get_apdu_case(cls, hdr:bytes) -> int:
@@ -385,17 +459,19 @@ class ApduCommandSet:
             return None
         return cmd
 
-    def parse_cmd_apdu(self, apdu: Apdu) -> ApduCommand:
-        """Parse a Command-APDU. Returns an instance of an ApduCommand derived class."""
+    def parse_cmd_apdu(self, apdu: Apdu, **kwargs) -> ApduCommand:
+        """Parse a Command-APDU. Returns an instance of an ApduCommand derived class.
+        Keyword arguments (like 'lazy') are passed to the constructor of that class."""
         # first look-up which of our member classes match CLA + INS
         a_cls = self.lookup(apdu.ins, apdu.cla)
         if not a_cls:
             raise ValueError('Unknown CLA=%02X INS=%02X' % (apdu.cla, apdu.ins))
         # then create an instance of that class and return it
-        return a_cls.from_apdu(apdu)
+        return a_cls.from_apdu(apdu, **kwargs)
 
-    def parse_cmd_bytes(self, buf:bytes) -> ApduCommand:
-        """Parse from a buffer (simtrace style). Returns an instance of an ApduCommand derived class."""
+    def parse_cmd_bytes(self, buf:bytes, **kwargs) -> ApduCommand:
+        """Parse from a buffer (simtrace style). Returns an instance of an ApduCommand derived class.
+        Keyword arguments (like 'lazy') are passed to the constructor of that class."""
         # first look-up which of our member classes match CLA + INS
         cla = buf[0]
         ins = buf[1]
@@ -403,7 +479,7 @@ class ApduCommandSet:
         if not a_cls:
             raise ValueError('Unknown CLA=%02X INS=%02X' % (cla, ins))
         # then create an instance of that class and return it
-        return a_cls.from_bytes(buf)
+        return a_cls.from_bytes(buf, **kwargs)
 
 
 
@@ -449,11 +525,17 @@ class TpduFilter(ApduHandler):
         return self.input_tpdu(tpdu)
 
 class ApduDecoder(ApduHandler):
-    def __init__(self, cmd_set: ApduCommandSet):
+    def __init__(self, cmd_set: ApduCommandSet, lazy: bool = False):
+        """
+        Args:
+            cmd_set : set of commands to decode
+            lazy : create the ApduCommand instances in lazy decoding mode (see ApduCommand)
+        """
         self.cmd_set = cmd_set
+        self.lazy = lazy
 
     def input(self, apdu: Apdu):
-        return self.cmd_set.parse_cmd_apdu(apdu)
+        return self.cmd_set.parse_cmd_apdu(apdu, lazy=self.lazy)
 
 
 class CardReset:
@@ -0,0 +1,180 @@
+"""Record-oriented output of decoded APDU traces (JSON lines, MessagePack, text)."""
+
+# (C) 2024 by sysmocom - s.f.m.c. GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import abc
+import sys
+import json
+import time
+import socket
+import threading
+from typing import BinaryIO, Dict, Optional
+
+from osmocom.utils import b2h, JsonEncoder
+
+from pySim.apdu import ApduCommand, CardReset
+
+# size of the write buffer of the output stream
+BUFFER_SIZE = 64 * 1024
+
+
+def open_output_stream(spec: str) -> BinaryIO:
+    """Open a (buffered, binary) output stream.
+
+    Args:
+        spec: '-' for stdout, 'tcp:HOST:PORT' or 'unix:PATH' to connect to a (listening) socket,
+              anything else is the name of a file to be created
+    """
+    if spec == '-':
+        return sys.stdout.buffer
+    if spec.startswith('tcp:'):
+        host, port = spec[4:].rsplit(':', 1)
+        sock = socket.create_connection((host, int(port)))
+        return sock.makefile('wb', buffering=BUFFER_SIZE)
+    if spec.startswith('unix:'):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(spec[5:])
+        return sock.makefile('wb', buffering=BUFFER_SIZE)
+    return open(spec, 'wb', buffering=BUFFER_SIZE)
+
+
+class ApduOutput(abc.ABC):
+    """Base class for streaming one compact record per decoded APDU (or card reset) to a binary output
+    stream.  The records are written to a buffered stream, which is flushed at most every
+    'flush_interval' seconds, so the output can keep up with live sources without a system call for each
+    APDU.  A timer flushes the records still held back in the buffer when no further record arrives, e.g.
+    during a pause of a live trace."""
+
+    def __init__(self, stream: BinaryIO, flush_interval: float = 1.0):
+        """
+        Args:
+            stream: binary output stream (see open_output_stream)
+            flush_interval: maximum time (in seconds) for which records are held back in the buffer;
+                            0 flushes after each record
+        """
+        self.stream = stream
+        self._close_stream = stream is not sys.stdout.buffer
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+        # the timer runs in a thread of its own, which must not flush in the middle of a write
+        self._lock = threading.Lock()
+        self._timer = None
+
+    @staticmethod
+    def apdu_to_record(inst: ApduCommand, timestamp: Optional[float] = None) -> Dict:
+        """Convert a decoded + processed ApduCommand into an output record."""
+        rec = {'ts': timestamp, 'lchan': inst.lchan_nr, 'cmd': inst._name, 'ins': inst.ins,
+               'path': inst.path_str or None, 'sw': b2h(inst.sw) if inst.sw else None}
+        if inst.col_id != '-':
+            rec['id'] = inst.col_id
+        rec['data'] = inst.processed
+        return rec
+
+    @staticmethod
+    def reset_to_record(reset: CardReset, timestamp: Optional[float] = None) -> Dict:
+        """Convert a CardReset into an output record."""
+        return {'ts': timestamp, 'reset': b2h(reset.atr) if reset.atr else None}
+
+    @abc.abstractmethod
+    def encode(self, rec: Dict) -> bytes:
+        """Encode a single record."""
+
+    def write(self, rec: Dict):
+        """Write a single record to the output stream."""
+        data = self.encode(rec)
+        with self._lock:
+            self.stream.write(data)
+            delay = self._last_flush + self.flush_interval - time.monotonic()
+            if delay <= 0:
+                self._flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(delay, self._on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def output_apdu(self, inst: ApduCommand, timestamp: Optional[float] = None):
+        self.write(self.apdu_to_record(inst, timestamp))
+
+    def output_reset(self, reset: CardReset, timestamp: Optional[float] = None):
+        self.write(self.reset_to_record(reset, timestamp))
+
+    def _flush(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self.stream.flush()
+        self._last_flush = time.monotonic()
+
+    def _on_timer(self):
+        with self._lock:
+            # unless the records have been flushed (or the stream closed) in the meantime
+            if self._timer:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """Flush and close the output stream (unless it is stdout)."""
+        self.flush()
+        if self._close_stream:
+            self.stream.close()
+
+
+class JsonlApduOutput(ApduOutput):
+    """Output in JSON lines format: one compact JSON object per line."""
+
+    def encode(self, rec: Dict) -> bytes:
+        return json.dumps(rec, cls=JsonEncoder, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+class TextApduOutput(ApduOutput):
+    """Human-readable output (like the default pySim-trace output, but without colors).  If the records
+    contain a 'card' member (see pySim-trace batch decoding), it is shown in an additional column."""
+
+    SEPARATOR = '==============================='
+
+    def encode(self, rec: Dict) -> bytes:
+        prefix = '%s ' % rec['card'] if 'card' in rec else ''
+        if 'reset' in rec:
+            line = '%sCardReset(%s)' % (prefix, rec['reset'] or '')
+        else:
+            line = '%s%02u %-16s %-35s %-8s %s %s' % (prefix, rec['lchan'], rec['cmd'], rec['path'] or '',
+                                                       rec.get('id', '-'), rec['sw'],
+                                                       json.dumps(rec['data'], cls=JsonEncoder))
+        return ('%s\n%s\n' % (line, self.SEPARATOR)).encode('utf-8')
+
+
+class MsgpackApduOutput(ApduOutput):
+    """Output as a stream of MessagePack encoded maps.  Binary values are encoded as MessagePack 'bin'
+    type.  Some decoded data contains maps with integer keys, so readers using the python 'msgpack' module
+    need to pass strict_map_key=False.  Requires the python 'msgpack' module."""
+
+    def __init__(self, stream: BinaryIO, flush_interval: float = 1.0):
+        import msgpack # pylint: disable=import-outside-toplevel
+        super().__init__(stream, flush_interval)
+        self.packer = msgpack.Packer(use_bin_type=True, default=str)
+
+    def encode(self, rec: Dict) -> bytes:
+        return self.packer.pack(rec)
+
+
+OUTPUT_FORMATS = {
+    'text': TextApduOutput,
+    'jsonl': JsonlApduOutput,
+    'msgpack': MsgpackApduOutput,
+}
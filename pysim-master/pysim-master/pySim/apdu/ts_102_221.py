@@ -54,7 +54,8 @@ class UiccSelect(ApduCommand, n='SELECT', ins=0xA4, cla=['0X', '4X', '6X']):
         return None
 
     def process_on_lchan(self, lchan: RuntimeLchan):
-        mode = self.cmd_dict['p1']
+        # only use the raw header/body here, so the full decode can be skipped in lazy mode
+        mode = parse_construct(self._construct_p1, self.p1.to_bytes(1, 'big'))
         if mode in ['path_from_mf', 'path_from_current_df']:
             # rewind to MF, if needed
             if mode == 'path_from_mf':
@@ -100,7 +101,7 @@ class UiccSelect(ApduCommand, n='SELECT', ins=0xA4, cla=['0X', '4X', '6X']):
                 logger.warning('SELECT UNKNOWN FID %s', file_hex)
         elif mode == 'df_name':
             # Select by AID (can be sub-string!)
-            aid = b2h(self.cmd_dict['body'])
+            aid = b2h(self.cmd_data)
             sels = lchan.rs.mf.get_app_selectables(['AIDS'])
             adf = self._find_aid_substr(sels, aid)
             if adf:
@@ -114,9 +115,9 @@ class UiccSelect(ApduCommand, n='SELECT', ins=0xA4, cla=['0X', '4X', '6X']):
         # decode the SELECT response
         if self.successful:
             self.file = lchan.selected_file
-            if 'body' in self.rsp_dict:
+            if self.rsp_data:
                 # not every SELECT is asking for the FCP in response...
-                return lchan.selected_file.decode_select_response(b2h(self.rsp_dict['body']))
+                return self._defer(lchan.selected_file.decode_select_response, b2h(self.rsp_data))
         return None
 
 
@@ -128,8 +129,8 @@ class UiccStatus(ApduCommand, n='STATUS', ins=0xF2, cla=['8X', 'CX', 'EX']):
     _construct_p2 = Enum(Byte, response_like_select=0, response_df_name_tlv=1, response_no_data=0x0c)
 
     def process_on_lchan(self, lchan):
-        if self.cmd_dict['p2'] == 'response_like_select':
-            return lchan.selected_file.decode_select_response(b2h(self.rsp_dict['body']))
+        if self.p2 == 0: # response_like_select
+            return self._defer(lchan.selected_file.decode_select_response, b2h(self.rsp_data))
 
 def _decode_binary_p1p2(p1, p2) -> Dict:
     ret = {}
@@ -157,7 +158,7 @@ class ReadBinary(ApduCommand, n='READ BINARY', ins=0xB0, cla=['0X', '4X', '6X'])
             return b2h(self.rsp_data)
         method = getattr(self.file, 'decode_bin', None)
         if self.successful and callable(method):
-            return method(self.rsp_data)
+            return self._defer(method, self.rsp_data)
 
 # TS 102 221 Section 11.1.4
 class UpdateBinary(ApduCommand, n='UPDATE BINARY', ins=0xD6, cla=['0X', '4X', '6X']):
@@ -174,7 +175,7 @@ class UpdateBinary(ApduCommand, n='UPDATE BINARY', ins=0xD6, cla=['0X', '4X', '6
             return b2h(self.cmd_data)
         method = getattr(self.file, 'decode_bin', None)
         if self.successful and callable(method):
-            return method(self.cmd_data)
+            return self._defer(method, self.cmd_data)
 
 def _decode_record_p1p2(p1, p2):
     ret = {}
@@ -207,7 +208,7 @@ class ReadRecord(ApduCommand, n='READ RECORD', ins=0xB2, cla=['0X', '4X', '6X'])
             return b2h(self.rsp_data)
         method = getattr(self.file, 'decode_record_bin', None)
         if self.successful and callable(method):
-            return method(self.rsp_data, self.cmd_dict['record_number'])
+            return self._defer(method, self.rsp_data, self.p1)
 
 # TS 102 221 Section 11.1.6
 class UpdateRecord(ApduCommand, n='UPDATE RECORD', ins=0xDC, cla=['0X', '4X', '6X']):
@@ -223,7 +224,7 @@ class UpdateRecord(ApduCommand, n='UPDATE RECORD', ins=0xDC, cla=['0X', '4X', '6
             return b2h(self.cmd_data)
         method = getattr(self.file, 'decode_record_bin', None)
         if self.successful and callable(method):
-            return method(self.cmd_data, self.cmd_dict['record_number'])
+            return self._defer(method, self.cmd_data, self.p1)
 
 # TS 102 221 Section 11.1.7
 class SearchRecord(ApduCommand, n='SEARCH RECORD', ins=0xA2, cla=['0X', '4X', '6X']):
@@ -10,6 +10,8 @@ logger = logging.getLogger(__name__)
 class ApduSource(abc.ABC):
     def __init__(self):
         self.apdu_filter = TpduFilter(None)
+        # timestamp (seconds since the epoch) of the most recently read packet, if known
+        self.timestamp = None
 
     @abc.abstractmethod
     def read_packet(self) -> PacketType:
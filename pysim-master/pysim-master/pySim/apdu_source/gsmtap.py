@@ -16,6 +16,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import time
 from osmocom.gsmtap import GsmtapReceiver
 
 from pySim.apdu.ts_102_221 import ApduCommands as UiccApduCommands
@@ -45,11 +46,12 @@ class GsmtapApduSource(ApduSource):
 
     def read_packet(self) -> PacketType:
         gsmtap_msg, _addr = self.gsmtap.read_packet()
+        self.timestamp = time.time()
         if gsmtap_msg['type'] != 'sim':
             raise ValueError('Unsupported GSMTAP type %s' % gsmtap_msg['type'])
         sub_type = gsmtap_msg['sub_type']
         if sub_type == 'apdu':
-            return ApduCommands.parse_cmd_bytes(gsmtap_msg['body'])
+            return ApduCommands.parse_cmd_bytes(gsmtap_msg['body'], lazy=True)
         if sub_type == 'atr':
             # card has been reset
             return CardReset(gsmtap_msg['body'])
@@ -0,0 +1,324 @@
+# coding=utf-8
+
+# (C) 2024 by sysmocom - s.f.m.c. GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import mmap
+import struct
+import logging
+import ipaddress
+from typing import Iterator, Optional, Tuple, List
+
+from pySim.apdu.ts_102_221 import ApduCommands as UiccApduCommands
+from pySim.apdu.ts_102_222 import ApduCommands as UiccAdmApduCommands
+from pySim.apdu.ts_31_102 import ApduCommands as UsimApduCommands
+from pySim.apdu.global_platform import ApduCommands as GpApduCommands
+
+from . import ApduSource, PacketType, CardReset
+
+ApduCommands = UiccApduCommands + UiccAdmApduCommands + UsimApduCommands + GpApduCommands
+
+logger = logging.getLogger(__name__)
+
+GSMTAP_UDP_PORT = 4729
+GSMTAP_VERSION = 0x02
+GSMTAP_TYPE_SIM = 0x04
+GSMTAP_SIM_APDU = 0x00
+GSMTAP_SIM_ATR = 0x01
+GSMTAP_SIM_PPS_REQ = 0x02
+GSMTAP_SIM_PPS_RSP = 0x03
+
+# link-layer header types, see https://www.tcpdump.org/linktypes.html
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_IPV6 = 0x86dd
+ETHERTYPES_VLAN = (0x8100, 0x88a8, 0x9100)
+IPPROTO_UDP = 17
+# IPv6 extension headers that we skip while looking for the UDP header
+IPV6_EXT_HDRS = (0, 43, 60)
+
+
+class PcapReader:
+    """Minimal reader for (classic) pcap and pcapng capture files.  The file is memory-mapped and the
+    packets are returned as memoryview slices of the mapping, i.e. without copying them."""
+
+    PCAP_MAGIC_USEC = 0xa1b2c3d4
+    PCAP_MAGIC_NSEC = 0xa1b23c4d
+    PCAPNG_SHB = 0x0a0d0d0a
+    PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+
+    def __init__(self, filename: str):
+        """
+        Args:
+            filename: name of the pcap or pcapng file to be read
+        """
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buf = memoryview(self._mmap)
+        if len(self.buf) < 4:
+            raise ValueError('%s: File too short for a pcap/pcapng file' % filename)
+        magic_le = struct.unpack_from('<I', self.buf, 0)[0]
+        magic_be = struct.unpack_from('>I', self.buf, 0)[0]
+        if magic_le == self.PCAPNG_SHB:
+            self.format = 'pcapng'
+        elif magic_le in [self.PCAP_MAGIC_USEC, self.PCAP_MAGIC_NSEC]:
+            self.format = 'pcap'
+            self._endian = '<'
+            self._ts_div = 1e6 if magic_le == self.PCAP_MAGIC_USEC else 1e9
+        elif magic_be in [self.PCAP_MAGIC_USEC, self.PCAP_MAGIC_NSEC]:
+            self.format = 'pcap'
+            self._endian = '>'
+            self._ts_div = 1e6 if magic_be == self.PCAP_MAGIC_USEC else 1e9
+        else:
+            raise ValueError('%s: Neither a pcap nor a pcapng file' % filename)
+
+    def __iter__(self) -> Iterator[Tuple[float, int, memoryview]]:
+        """Iterate over the packets in the file.
+
+        Yields:
+            tuple of (timestamp, link-layer header type, packet data)
+        """
+        if self.format == 'pcapng':
+            return self._iter_pcapng()
+        return self._iter_pcap()
+
+    def _iter_pcap(self):
+        buf = self.buf
+        e = self._endian
+        linktype = struct.unpack_from(e + 'I', buf, 20)[0] & 0xffff
+        rec_hdr = struct.Struct(e + 'IIII')
+        offset = 24
+        end = len(buf)
+        while offset + 16 <= end:
+            ts_sec, ts_frac, incl_len, _orig_len = rec_hdr.unpack_from(buf, offset)
+            offset += 16
+            if offset + incl_len > end:
+                logger.warning('%s: Truncated packet at end of file', self.filename)
+                return
+            yield (ts_sec + ts_frac / self._ts_div, linktype, buf[offset:offset+incl_len])
+            offset += incl_len
+
+    def _iter_pcapng(self):
+        buf = self.buf
+        end = len(buf)
+        offset = 0
+        e = '<'
+        # per-interface (link type, timestamp resolution) of the current section
+        interfaces = []
+        while offset + 12 <= end:
+            block_type = struct.unpack_from(e + 'I', buf, offset)[0]
+            if block_type == self.PCAPNG_SHB:
+                # the byte order may change with each section
+                bom = struct.unpack_from('<I', buf, offset + 8)[0]
+                e = '<' if bom == self.PCAPNG_BYTE_ORDER_MAGIC else '>'
+                interfaces = []
+            block_len = struct.unpack_from(e + 'I', buf, offset + 4)[0]
+            if block_len < 12 or offset + block_len > end:
+                logger.warning('%s: Truncated/invalid block at end of file', self.filename)
+                return
+            body = offset + 8
+            if block_type == 1:
+                # Interface Description Block
+                linktype = struct.unpack_from(e + 'H', buf, body)[0]
+                interfaces.append((linktype, self._pcapng_tsresol(buf[body+8:offset+block_len-4], e)))
+            elif block_type == 6:
+                # Enhanced Packet Block
+                if_id, ts_high, ts_low, cap_len = struct.unpack_from(e + 'IIII', buf, body)
+                linktype, ts_div = interfaces[if_id]
+                yield (((ts_high << 32) | ts_low) / ts_div, linktype, buf[body+20:body+20+cap_len])
+            elif block_type == 3:
+                # Simple Packet Block: always interface 0, no timestamp
+                orig_len = struct.unpack_from(e + 'I', buf, body)[0]
+                cap_len = min(orig_len, block_len - 16)
+                yield (0.0, interfaces[0][0], buf[body+4:body+4+cap_len])
+            elif block_type == 2:
+                # (obsolete) Packet Block
+                if_id, _drops, ts_high, ts_low, cap_len = struct.unpack_from(e + 'HHIII', buf, body)
+                linktype, ts_div = interfaces[if_id]
+                yield (((ts_high << 32) | ts_low) / ts_div, linktype, buf[body+20:body+20+cap_len])
+            offset += block_len
+
+    @staticmethod
+    def _pcapng_tsresol(options: memoryview, e: str) -> float:
+        """Determine the timestamp divisor from the if_tsresol option of an Interface Description Block."""
+        offset = 0
+        while offset + 4 <= len(options):
+            code, length = struct.unpack_from(e + 'HH', options, offset)
+            if code == 0:
+                break
+            if code == 9 and length >= 1:
+                tsresol = options[offset + 4]
+                if tsresol & 0x80:
+                    return float(2 ** (tsresol & 0x7f))
+                return float(10 ** tsresol)
+            offset += 4 + ((length + 3) & ~3)
+        return 1e6
+
+
+def udp_payload(linktype: int, pkt: memoryview, port: int) -> Optional[Tuple[memoryview, int, memoryview]]:
+    """Return the source (IP address, UDP port) and the UDP payload of the given link-layer packet, if it
+    is an (unfragmented) IPv4/IPv6 UDP packet from/to the given port.  Anything else is rejected as early
+    (and cheaply) as possible."""
+    if linktype == LINKTYPE_ETHERNET:
+        if len(pkt) < 14:
+            return None
+        ethertype = (pkt[12] << 8) | pkt[13]
+        offset = 14
+        while ethertype in ETHERTYPES_VLAN and len(pkt) >= offset + 4:
+            ethertype = (pkt[offset+2] << 8) | pkt[offset+3]
+            offset += 4
+    elif linktype in [LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6]:
+        if not len(pkt):
+            return None
+        ethertype = ETHERTYPE_IPV6 if pkt[0] >> 4 == 6 else ETHERTYPE_IPV4
+        offset = 0
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if len(pkt) < 16:
+            return None
+        ethertype = (pkt[14] << 8) | pkt[15]
+        offset = 16
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        if len(pkt) < 20:
+            return None
+        ethertype = (pkt[0] << 8) | pkt[1]
+        offset = 20
+    elif linktype == LINKTYPE_NULL:
+        if len(pkt) < 4:
+            return None
+        # address family in host byte order of the capturing machine: 2 is AF_INET everywhere,
+        # the AF_INET6 values differ between operating systems.
+        family = pkt[0] or pkt[3]
+        ethertype = ETHERTYPE_IPV4 if family == 2 else ETHERTYPE_IPV6
+        offset = 4
+    else:
+        return None
+
+    if ethertype == ETHERTYPE_IPV4:
+        if len(pkt) < offset + 20 or pkt[offset+9] != IPPROTO_UDP:
+            return None
+        # skip fragments (GSMTAP-SIM messages are far smaller than any MTU)
+        if ((pkt[offset+6] & 0x3f) << 8) | pkt[offset+7]:
+            return None
+        src = pkt[offset+12:offset+16]
+        offset += (pkt[offset] & 0x0f) * 4
+    elif ethertype == ETHERTYPE_IPV6:
+        if len(pkt) < offset + 40:
+            return None
+        next_hdr = pkt[offset+6]
+        src = pkt[offset+8:offset+24]
+        offset += 40
+        while next_hdr in IPV6_EXT_HDRS and len(pkt) >= offset + 8:
+            next_hdr = pkt[offset]
+            offset += (pkt[offset+1] + 1) * 8
+        if next_hdr != IPPROTO_UDP:
+            return None
+    else:
+        return None
+
+    if len(pkt) < offset + 8:
+        return None
+    sport = (pkt[offset] << 8) | pkt[offset+1]
+    dport = (pkt[offset+2] << 8) | pkt[offset+3]
+    if port not in (sport, dport):
+        return None
+    # the UDP length excludes any link-layer padding (e.g. of short Ethernet frames)
+    udp_len = (pkt[offset+4] << 8) | pkt[offset+5]
+    return (src, sport, pkt[offset+8:offset+max(udp_len, 8)])
+
+
+def format_sender(src: bytes, sport: int) -> str:
+    """Format the source IP address + UDP port of a packet (e.g. '127.0.0.1:40000', '[::1]:40000')."""
+    addr = ipaddress.ip_address(bytes(src))
+    if addr.version == 6:
+        return '[%s]:%u' % (addr, sport)
+    return '%s:%u' % (addr, sport)
+
+def parse_sender(sender: str) -> Tuple[bytes, int]:
+    """Parse the result of format_sender() into the packed IP address and UDP port."""
+    addr, sport = sender.rsplit(':', 1)
+    return (ipaddress.ip_address(addr.strip('[]')).packed, int(sport))
+
+
+class GsmtapPcapApduSource(ApduSource):
+    """APDU Source [provider] class for reading GSMTAP-SIM from a pcap or pcapng file.  Unlike
+    PysharkGsmtapPcap, this doesn't require tshark/pyshark: The file is parsed natively, which is
+    much faster, particularly for large captures."""
+
+    def __init__(self, pcap_filename: str, udp_port: int = GSMTAP_UDP_PORT, sender: Optional[str] = None):
+        """
+        Args:
+            pcap_filename: File name of the pcap[ng] file to be opened
+            udp_port: UDP port number of the GSMTAP packets
+            sender: only use the GSMTAP packets of this sender (see gsmtap_pcap_senders); this is used
+                    to separate the traces of several cards (SIMtrace instances) in one capture
+        """
+        super().__init__()
+        self.reader = PcapReader(pcap_filename)
+        self.packets = iter(self.reader)
+        self.udp_port = udp_port
+        self.sender = parse_sender(sender) if sender else None
+
+    def read_packet(self) -> PacketType:
+        for ts, linktype, pkt in self.packets:
+            udp = udp_payload(linktype, pkt, self.udp_port)
+            if udp is None:
+                continue
+            src, sport, gsmtap = udp
+            # quickly skip anything that is not GSMTAP-SIM
+            if len(gsmtap) < 16 or gsmtap[2] != GSMTAP_TYPE_SIM:
+                continue
+            if self.sender and (sport != self.sender[1] or src != self.sender[0]):
+                continue
+            if gsmtap[0] != GSMTAP_VERSION:
+                raise ValueError('Unknown GSMTAP version 0x%02x' % gsmtap[0])
+            self.timestamp = ts
+            sub_type = gsmtap[12]
+            body = bytes(gsmtap[gsmtap[1]*4:])
+            if sub_type == GSMTAP_SIM_APDU:
+                return ApduCommands.parse_cmd_bytes(body, lazy=True)
+            if sub_type == GSMTAP_SIM_ATR:
+                # card has been reset
+                return CardReset(body)
+            if sub_type in [GSMTAP_SIM_PPS_REQ, GSMTAP_SIM_PPS_RSP]:
+                # simply ignore for now
+                continue
+            raise ValueError('Unsupported GSMTAP-SIM sub-type %u' % sub_type)
+        raise StopIteration
+
+
+def gsmtap_pcap_senders(pcap_filename: str, udp_port: int = GSMTAP_UDP_PORT) -> List[str]:
+    """Determine the senders (source IP address + UDP port) of GSMTAP-SIM packets in a pcap[ng] file,
+    in the order of their first appearance.  Each sender (e.g. each simtrace2-sniff instance) usually
+    corresponds to one card."""
+    senders = {}
+    for _ts, linktype, pkt in PcapReader(pcap_filename):
+        udp = udp_payload(linktype, pkt, udp_port)
+        if udp is None:
+            continue
+        src, sport, gsmtap = udp
+        if len(gsmtap) < 16 or gsmtap[2] != GSMTAP_TYPE_SIM:
+            continue
+        key = (bytes(src), sport)
+        if key not in senders:
+            senders[key] = format_sender(*key)
+    return list(senders.values())
@@ -45,6 +45,7 @@ class _PysharkGsmtap(ApduSource):
 
     def read_packet(self) -> PacketType:
         p = self.pyshark.next()
+        self.timestamp = float(p.sniff_timestamp)
         return self._parse_packet(p)
 
     def _set_or_verify_bank_slot(self, bsl: Tuple[int, int]):
@@ -65,7 +66,7 @@ class _PysharkGsmtap(ApduSource):
             raise ValueError('Unsupported GSMTAP type %s' % gsmtap_msg['type'])
         sub_type = gsmtap_msg['sub_type']
         if sub_type == 'apdu':
-            return ApduCommands.parse_cmd_bytes(gsmtap_msg['body'])
+            return ApduCommands.parse_cmd_bytes(gsmtap_msg['body'], lazy=True)
         if sub_type == 'atr':
             # card has been reset
             return CardReset(gsmtap_msg['body'])
@@ -60,6 +60,7 @@ class _PysharkRspro(ApduSource):
 
     def read_packet(self) -> PacketType:
         p = self.pyshark.next()
+        self.timestamp = float(p.sniff_timestamp)
         return self._parse_packet(p)
 
     def _set_or_verify_bank_slot(self, bsl: Tuple[int, int]):
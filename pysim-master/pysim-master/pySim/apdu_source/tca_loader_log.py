@@ -44,5 +44,5 @@ class TcaLoaderLogApduSource(ApduSource):
             elif command and line.startswith('Response'):
                 response = line.split()[1]
                 print("Response: '%s'" % response)
-                return ApduCommands.parse_cmd_bytes(h2b(command) + h2b(response))
+                return ApduCommands.parse_cmd_bytes(h2b(command) + h2b(response), lazy=True)
         raise StopIteration
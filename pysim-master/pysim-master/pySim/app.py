@@ -14,41 +14,145 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from typing import Tuple
+import sys
+import importlib
+from typing import Tuple, Optional
+
+from osmocom.utils import i2h
 
 from pySim.transport import LinkBase
 from pySim.commands import SimCardCommands
 from pySim.filesystem import CardModel, CardApplication
-from pySim.cards import card_detect, SimCardBase, UiccCardBase
+from pySim.cards import card_detect, CardBase, SimCardBase, UiccCardBase
 from pySim.runtime import RuntimeState
 from pySim.profile import CardProfile
+from pySim.profile_cache import CardProfileCache, class_name, find_class
 from pySim.cdma_ruim import CardProfileRUIM
 from pySim.ts_102_221 import CardProfileUICC
-from pySim.utils import all_subclasses
+from pySim.utils import all_subclasses, dec_iccid
 from pySim.exceptions import SwMatchError
 
-# we need to import this module so that the SysmocomSJA2 sub-class of
-# CardModel is created, which will add the ATR-based matching and
-# calling of SysmocomSJA2.add_files.  See  CardModel.apply_matching_models
-import pySim.sysmocom_sja2
-
-# we need to import these modules so that the various sub-classes of
-# CardProfile are created, which will be used in init_card() to iterate
-# over all known CardProfile sub-classes.
-import pySim.ts_31_102
-import pySim.ts_31_103
-import pySim.ts_31_104
-import pySim.ara_m
-import pySim.global_platform
-import pySim.euicc
-
-def init_card(sl: LinkBase) -> Tuple[RuntimeState, SimCardBase]:
+# Modules which need to be imported before a card can be detected: They contain the sub-classes of
+# CardProfile, CardApplication and CardModel (like SysmocomSJA2, which adds the ATR-based matching
+# and calling of SysmocomSJA2.add_files, see CardModel.apply_matching_models) which init_card()
+# discovers by iterating over the sub-classes of those base classes.  Some of them pull in heavy
+# dependencies (cmd2 command sets, cryptographic libraries, ...), so they are only imported by
+# load_card_modules() on the first call of init_card(), and not when this module is imported.
+CARD_MODULES = [
+    'pySim.sysmocom_sja2',
+    'pySim.ts_31_102',
+    'pySim.ts_31_103',
+    'pySim.ts_31_104',
+    'pySim.ara_m',
+    'pySim.global_platform',
+    'pySim.euicc',
+]
+
+def register_card_module(name: str):
+    """Register an additional module (by its name) to be imported by load_card_modules().  This allows
+    applications to provide their own CardProfile/CardApplication/CardModel sub-classes."""
+    if name not in CARD_MODULES:
+        CARD_MODULES.append(name)
+
+def load_card_modules():
+    """Import all modules registered in CARD_MODULES (unless they are imported already)."""
+    for name in CARD_MODULES:
+        if name not in sys.modules:
+            importlib.import_module(name)
+
+def _add_uicc_applications(profile: CardProfileUICC):
+    for app_cls in all_subclasses(CardApplication):
+        # skip any intermediary sub-classes such as CardApplicationSD
+        if hasattr(app_cls, '_' + app_cls.__name__ + '__intermediate'):
+            continue
+        profile.add_application(app_cls())
+
+def _read_iccid(scc: SimCardCommands) -> Optional[str]:
+    try:
+        (res, _sw) = scc.read_binary(['3f00', '2fe2'], 10)
+        return dec_iccid(res)
+    except Exception:
+        return None
+
+def _init_card_cached(sl: LinkBase, scc: SimCardCommands, cache: CardProfileCache) -> Optional[Tuple[RuntimeState, SimCardBase]]:
+    """Set up card profile and runtime state from the cache entry of the card (if any).  The entry is
+    validated by reading the ICCID of the card using the cached class byte / selection control."""
+    atr = i2h(scc.get_atr())
+    entries = cache.get_by_atr(atr)
+    if not entries:
+        return None
+    scc.cla_byte = entries[0]['cla']
+    scc.sel_ctrl = entries[0]['sel_ctrl']
+    iccid = _read_iccid(scc)
+    entry = cache.get(atr, iccid) if iccid else None
+    if entry is None:
+        return None
+
+    card_cls = find_class(CardBase, entry['card'])
+    profile_cls = find_class(CardProfile, entry['profile'])
+    if card_cls is None or profile_cls is None:
+        return None
+    card = card_cls(scc)
+    if entry.get('adm_chv_num') is not None:
+        card._adm_chv_num = entry['adm_chv_num']
+    # the AIDs listed in EF.DIR are required to complete partial AIDs, see UiccCardBase.select_adf_by_aid
+    card._aids = entry['aids']
+    profile = profile_cls()
+    if isinstance(profile, CardProfileUICC):
+        _add_uicc_applications(profile)
+    addons = [addon_cls() for addon_cls in profile.addons if class_name(addon_cls) in entry['addons']]
+    apps = [a for a in profile.applications if a.aid in entry['applications']]
+    if len(addons) != len(entry['addons']) or len(apps) != len(entry['applications']):
+        # the cache entry was created by a different version of pySim
+        return None
+
+    print("Info: Card is of type: %s (from cache %s)" % (str(profile), cache))
+    rs = RuntimeState(card, profile, addons, apps)
+    CardModel.apply_matching_models(scc, rs)
+    sl.set_sw_interpreter(rs)
+    rs.identity['ICCID'] = iccid
+    if entry.get('eid'):
+        rs.identity['EID'] = entry['eid']
+    return rs, card
+
+def _update_cache(scc: SimCardCommands, cache: CardProfileCache, rs: RuntimeState, card: SimCardBase):
+    """Store the detected card type, profile, add-ons and applications in the cache."""
+    iccid = _read_iccid(scc)
+    # we changed the selected file behind the back of the runtime state
+    rs.lchan[0].select('MF')
+    if not iccid or not rs.identity.get('ATR'):
+        return
+    entry = {
+        'card': class_name(type(card)),
+        'adm_chv_num': getattr(card, '_adm_chv_num', None),
+        'profile': class_name(type(rs.profile)),
+        'cla': rs.profile.cla,
+        'sel_ctrl': rs.profile.sel_ctrl,
+        'addons': [class_name(type(addon)) for addon in rs.addons],
+        'applications': [a.aid for a in rs.applications],
+        'aids': card._aids,
+        'eid': rs.identity.get('EID'),
+    }
+    try:
+        cache.put(rs.identity['ATR'], iccid, entry)
+    except OSError as e:
+        print("Warning: Cannot update card profile cache %s: %s" % (cache, e))
+
+def init_card(sl: LinkBase, cache: Optional[CardProfileCache] = None) -> Tuple[RuntimeState, SimCardBase]:
     """
     Detect card in reader and setup card profile and runtime state. This
     function must be called at least once on startup. The card and runtime
     state object (rs) is required for all pySim-shell commands.
+
+    Args:
+        sl : transport link to the card
+        cache : optional cache of card profiles; cards found in the cache (by ATR + ICCID) are set up
+                without probing, detection results of other cards are added to the cache
     """
 
+    load_card_modules()
+    from pySim.euicc import AID_ISD_R, CardApplicationISDR # pylint: disable=import-outside-toplevel
+
     # Create command layer
     scc = SimCardCommands(transport=sl)
 
@@ -57,6 +161,11 @@ def init_card(sl: LinkBase) -> Tuple[RuntimeState, SimCardBase]:
     print("Waiting for card...")
     sl.wait_for_card(3)
 
+    if cache:
+        ret = _init_card_cached(sl, scc, cache)
+        if ret:
+            return ret
+
     generic_card = False
     card = card_detect(scc)
     if card is None:
@@ -87,11 +196,7 @@ def init_card(sl: LinkBase) -> Tuple[RuntimeState, SimCardBase]:
     # We cannot do it within pySim/profile.py as that would create circular
     # dependencies between the individual profiles and profile.py.
     if isinstance(profile, CardProfileUICC):
-        for app_cls in all_subclasses(CardApplication):
-            # skip any intermediary sub-classes such as CardApplicationSD
-            if hasattr(app_cls, '_' + app_cls.__name__ + '__intermediate'):
-                continue
-            profile.add_application(app_cls())
+        _add_uicc_applications(profile)
         # We have chosen SimCard() above, but we now know it actually is an UICC
         # so it's safe to assume it supports USIM application (which we're adding above).
         # IF we don't do this, we will have a SimCard but try USIM specific commands like
@@ -108,15 +213,18 @@ def init_card(sl: LinkBase) -> Tuple[RuntimeState, SimCardBase]:
     sl.set_sw_interpreter(rs)
 
     # try to obtain the EID, if any
-    isd_r = rs.mf.applications.get(pySim.euicc.AID_ISD_R.lower(), None)
+    isd_r = rs.mf.applications.get(AID_ISD_R.lower(), None)
     if isd_r:
         rs.lchan[0].select_file(isd_r)
         try:
-            rs.identity['EID'] = pySim.euicc.CardApplicationISDR.get_eid(scc)
+            rs.identity['EID'] = CardApplicationISDR.get_eid(scc)
         except SwMatchError:
             # has ISD-R but not a SGP.22/SGP.32 eUICC - maybe SGP.02?
             pass
         finally:
             rs.reset()
 
+    if cache:
+        _update_cache(scc, cache, rs, card)
+
     return rs, card
@@ -26,7 +26,6 @@ there are also automatic card feeders.
 
 import subprocess
 import sys
-import yaml
 
 from pySim.transport import LinkBase
 
@@ -94,6 +93,7 @@ class CardHandlerAuto(CardHandlerBase):
     def __init__(self, sl: LinkBase, config_file: str):
         super().__init__(sl)
         print("Card handler Config-file: " + str(config_file))
+        import yaml # pylint: disable=import-outside-toplevel
         with open(config_file) as cfg:
             self.cmds = yaml.load(cfg, Loader=yaml.FullLoader)
         self.verbose = self.cmds.get('verbose') is True
@@ -28,12 +28,20 @@ operation with pySim-shell.
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from typing import List, Dict, Optional
-from Cryptodome.Cipher import AES
+from typing import List, Dict, Optional, Iterable
 from osmocom.utils import h2b, b2h
 
 import abc
 import csv
+import io
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import tempfile
+
+logger = logging.getLogger(__name__)
 
 card_key_providers = []  # type: List['CardKeyProvider']
 
@@ -48,6 +56,52 @@ CRYPT_GROUPS = {
     'SCP03_ECASD': ['SCP03_ENC_ECASD', 'SCP03_MAC_ECASD', 'SCP03_DEK_ECASD'],
     }
 
+class ColumnDecryptor:
+    """Column-based decryption of card data. It is generally a bad idea to store cryptographic key material
+    in plaintext.  Instead, the key material should be encrypted by a "key-encryption key", occasionally also
+    known as "transport key" (see GSMA FS.28).  Different fields (columns) may use different transport keys."""
+    IV = b'\x23' * 16
+
+    def __init__(self, transport_keys: dict):
+        """
+        Args:
+                transport_keys : a dict indexed by field name (or name of a group of fields, see CRYPT_GROUPS),
+                                 whose values are hex-encoded AES keys for the respective field (column)
+        """
+        self.transport_keys = self.process_transport_keys(transport_keys)
+        self._ciphers = {}
+        self._strxor = None
+
+    @staticmethod
+    def process_transport_keys(transport_keys: dict):
+        """Apply a single transport key to multiple fields/columns, if the name is a group."""
+        new_dict = {}
+        for name, key in transport_keys.items():
+            if name in CRYPT_GROUPS:
+                for field in CRYPT_GROUPS[name]:
+                    new_dict[field] = key
+            else:
+                new_dict[name] = key
+        return new_dict
+
+    def decrypt_field(self, field_name: str, encrypted_val: str) -> str:
+        """decrypt a single field, if we have a transport key for the field of that name."""
+        if not field_name in self.transport_keys:
+            return encrypted_val
+        # The (stateless) ECB cipher of each column is set up only once, the CBC chaining is done by hand
+        # since a CBC cipher object can not be re-used for multiple decryptions.
+        cipher = self._ciphers.get(field_name)
+        if not cipher:
+            from Cryptodome.Cipher import AES # pylint: disable=import-outside-toplevel
+            from Cryptodome.Util.strxor import strxor # pylint: disable=import-outside-toplevel
+            cipher = AES.new(h2b(self.transport_keys[field_name]), AES.MODE_ECB)
+            self._ciphers[field_name] = cipher
+            self._strxor = strxor
+        encrypted = h2b(encrypted_val)
+        decrypted = cipher.decrypt(encrypted)
+        return b2h(self._strxor(decrypted, (self.IV + encrypted)[:len(encrypted)]))
+
+
 class CardKeyProvider(abc.ABC):
     """Base class, not containing any concrete implementation."""
 
@@ -77,6 +131,16 @@ class CardKeyProvider(abc.ABC):
         result = self.get(fields, key, value)
         return result.get(field)
 
+    def prefetch(self, key: str, values: Iterable[str]):
+        """Announce that card data for a whole batch of cards is going to be requested soon.  Providers
+        that can look up multiple cards more efficiently at once (e.g. with a single database query)
+        may use this to fetch the data of the batch in advance.
+
+        Args:
+                key : look-up key to identify card data, such as 'ICCID'
+                values : values for look-up key of all cards in the batch
+        """
+
     @abc.abstractmethod
     def get(self, fields: List[str], key: str, value: str) -> Dict[str, str]:
         """Get multiple card-individual fields for identified card.
@@ -94,11 +158,25 @@ class CardKeyProviderCsv(CardKeyProvider):
     """Card key provider implementation that allows to query against a specified CSV file.
     Supports column-based encryption as it is generally a bad idea to store cryptographic key material in
     plaintext.  Instead, the key material should be encrypted by a "key-encryption key", occasionally also
-    known as "transport key" (see GSMA FS.28)."""
-    IV = b'\x23' * 16
+    known as "transport key" (see GSMA FS.28).
+
+    To avoid parsing the whole (potentially very large) CSV file on each lookup, an index that maps the
+    values of the key columns (ICCID, EID, IMSI) to the file offset of the related row is maintained. The
+    index is stored next to the CSV file (file name + '.idx') and rebuilt as soon as the CSV file changes.
+
+    The index file contains one sorted table of fixed-size entries (value, offset) per key column.  It is
+    memory-mapped and searched by bisection, so a lookup only touches a few pages of it, no matter how
+    many rows the CSV file has."""
+    IV = ColumnDecryptor.IV
+    process_transport_keys = staticmethod(ColumnDecryptor.process_transport_keys)
     csv_file = None
     filename = None
 
+    # index file: magic, header length (4 bytes), JSON header, tables of the key columns
+    INDEX_MAGIC = b'PYSIMCSVIDX1'
+    # size of the offset in each index entry
+    OFFSET_LEN = 8
+
     def __init__(self, filename: str, transport_keys: dict):
         """
         Args:
@@ -108,50 +186,262 @@ class CardKeyProviderCsv(CardKeyProvider):
                                  (columns) can use different transport keys, which is strongly recommended by
                                  GSMA FS.28
         """
-        self.csv_file = open(filename, 'r')
+        self.csv_file = open(filename, 'rb')
         if not self.csv_file:
             raise RuntimeError("Could not open CSV file '%s'" % filename)
         self.filename = filename
-        self.transport_keys = self.process_transport_keys(transport_keys)
+        self.index_filename = filename + '.idx'
+        self.crypt = ColumnDecryptor(transport_keys)
+        self.transport_keys = self.crypt.transport_keys
+        self._stat = None
+        self.fieldnames = []
+        # index data (mmap or bytes) and the location of the table of each key column in it
+        self._index = None
+        self._tables = {}
+
+    def _decrypt_field(self, field_name: str, encrypted_val: str) -> str:
+        """decrypt a single field, if we have a transport key for the field of that name."""
+        return self.crypt.decrypt_field(field_name, encrypted_val)
 
     @staticmethod
-    def process_transport_keys(transport_keys: dict):
-        """Apply a single transport key to multiple fields/columns, if the name is a group."""
-        new_dict = {}
-        for name, key in transport_keys.items():
-            if name in CRYPT_GROUPS:
-                for field in CRYPT_GROUPS[name]:
-                    new_dict[field] = key
+    def _read_record(f) -> bytes:
+        """Read one record (row) of the CSV file.  A record spans multiple lines in case a quoted field
+        contains line breaks, which is the case as long as the number of quote characters is odd."""
+        record = f.readline()
+        while record.count(b'"') % 2:
+            line = f.readline()
+            if not line:
+                break
+            record += line
+        return record
+
+    @staticmethod
+    def _parse_record(record: bytes) -> List[str]:
+        return next(csv.reader(io.StringIO(record.decode(), newline='')), [])
+
+    def _load_index(self, st: os.stat_result) -> bool:
+        """Load (map) the persisted index, if it exists and matches the current state of the CSV file."""
+        try:
+            with open(self.index_filename, 'rb') as f:
+                idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        try:
+            hdr_start = len(self.INDEX_MAGIC) + 4
+            if idx[:len(self.INDEX_MAGIC)] != self.INDEX_MAGIC:
+                raise ValueError('not an index file')
+            hdr_len = int.from_bytes(idx[len(self.INDEX_MAGIC):hdr_start], 'big')
+            hdr = json.loads(idx[hdr_start:hdr_start + hdr_len])
+            if hdr['mtime_ns'] != st.st_mtime_ns or hdr['size'] != st.st_size:
+                raise ValueError('outdated index file')
+            self._set_index(idx, hdr['fieldnames'],
+                            {n: (hdr_start + hdr_len + t[0], t[1], t[2]) for n, t in hdr['tables'].items()})
+        except (ValueError, KeyError, TypeError):
+            idx.close()
+            return False
+        return True
+
+    def _set_index(self, idx, fieldnames: List[str], tables: Dict[str, tuple]):
+        if isinstance(self._index, mmap.mmap):
+            self._index.close()
+        self._index = idx
+        self.fieldnames = fieldnames
+        self._tables = tables
+
+    def _build_index(self, st: os.stat_result):
+        """Scan the CSV file once and record the offset of each row under its ICCID/EID/IMSI value."""
+        f = self.csv_file
+        f.seek(0)
+        fieldnames = [field.upper() for field in self._parse_record(self._read_record(f))]
+        key_columns = {n: i for i, n in enumerate(fieldnames) if n in self.VALID_KEY_FIELD_NAMES}
+        entries = {n: [] for n in key_columns}
+        offset = f.tell()
+        while True:
+            record = self._read_record(f)
+            if not record:
+                break
+            row = self._parse_record(record)
+            for name, i in key_columns.items():
+                if i < len(row):
+                    entries[name].append((row[i].encode(), offset))
+            offset += len(record)
+
+        # one table of fixed-size entries per key column, sorted by value (and by offset, so that in case
+        # of duplicates the last row wins, as with a linear search)
+        tables = {}
+        body = bytearray()
+        for name, column in entries.items():
+            width = max((len(v) for v, _o in column), default=0)
+            column = sorted((v.ljust(width, b'\0'), o) for v, o in column)
+            tables[name] = (len(body), len(column), width)
+            for v, o in column:
+                body += v + o.to_bytes(self.OFFSET_LEN, 'big')
+        hdr = json.dumps({'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'fieldnames': fieldnames,
+                          'tables': tables}).encode()
+        idx = self.INDEX_MAGIC + len(hdr).to_bytes(4, 'big') + hdr + bytes(body)
+        hdr_end = len(self.INDEX_MAGIC) + 4 + len(hdr)
+        self._set_index(idx, fieldnames, {n: (hdr_end + t[0], t[1], t[2]) for n, t in tables.items()})
+
+        # write the index atomically, so that concurrent readers never see a partial file
+        try:
+            fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(self.index_filename) or '.',
+                                           prefix=os.path.basename(self.index_filename))
+            try:
+                with os.fdopen(fd, 'wb') as idx_file:
+                    idx_file.write(idx)
+                os.replace(tmpname, self.index_filename)
+            except BaseException:
+                os.unlink(tmpname)
+                raise
+        except OSError:
+            # not being able to persist the index is not fatal, we just keep it in memory
+            pass
+
+    def _update_index(self):
+        """Make sure the index is up to date with the CSV file."""
+        st = os.stat(self.filename)
+        stat = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if stat == self._stat:
+            return
+        if self._stat and stat[2] != self._stat[2]:
+            # the file has been replaced, not just modified
+            self.csv_file.close()
+            self.csv_file = open(self.filename, 'rb')
+        if not self._load_index(st):
+            self._build_index(st)
+        self._stat = stat
+
+    def _lookup(self, key: str, value: str) -> Optional[int]:
+        """Find the offset of the (last) row whose column 'key' has the given value by bisecting the
+        sorted table of that column in the index."""
+        (start, count, width) = self._tables[key]
+        value = value.encode()
+        if len(value) > width:
+            return None
+        value = value.ljust(width, b'\0')
+        entry_len = width + self.OFFSET_LEN
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = start + mid * entry_len
+            if value < self._index[pos:pos + width]:
+                hi = mid
             else:
-                new_dict[name] = key
-        return new_dict
+                lo = mid + 1
+        if lo == 0:
+            return None
+        pos = start + (lo - 1) * entry_len
+        if self._index[pos:pos + width] != value:
+            return None
+        return int.from_bytes(self._index[pos + width:pos + entry_len], 'big')
 
-    def _decrypt_field(self, field_name: str, encrypted_val: str) -> str:
-        """decrypt a single field, if we have a transport key for the field of that name."""
-        if not field_name in self.transport_keys:
-            return encrypted_val
-        cipher = AES.new(h2b(self.transport_keys[field_name]), AES.MODE_CBC, self.IV)
-        return b2h(cipher.decrypt(h2b(encrypted_val)))
+    def get(self, fields: List[str], key: str, value: str) -> Dict[str, str]:
+        super()._verify_get_data(fields, key, value)
+
+        self._update_index()
+        if key not in self._tables:
+            raise RuntimeError("CSV-File '%s' lacks column '%s'" % (self.filename, key))
+        offset = self._lookup(key, value)
+        if offset is None:
+            return {}
+        self.csv_file.seek(offset)
+        row = dict(zip(self.fieldnames, self._parse_record(self._read_record(self.csv_file))))
+
+        rc = {}
+        for f in fields:
+            if f in row:
+                rc.update({f: self._decrypt_field(f, row[f])})
+            else:
+                raise RuntimeError("CSV-File '%s' lacks column '%s'" %
+                                   (self.filename, f))
+        return rc
+
+
+class CardKeyProviderSqlite(CardKeyProvider):
+    """Card key provider implementation that allows to query against a table of a specified SQLite database.
+    Each row of the table contains the data of one card, the column names are the field names.  The same
+    column-based encryption as with CardKeyProviderCsv is supported.
+
+    The look-up key columns (ICCID, EID, IMSI) are indexed, so each look-up is a single indexed query.  For
+    bulk operations, the data of a whole batch of cards can be fetched with one query using prefetch()."""
+
+    # SQLITE_MAX_VARIABLE_NUMBER is 999 in older SQLite versions
+    PREFETCH_CHUNK_SIZE = 500
+
+    def __init__(self, filename: str, transport_keys: dict, table: str = 'card_data'):
+        """
+        Args:
+                filename : file name (path) of SQLite database containing card-individual key/data
+                transport_keys : a dict indexed by field name, whose values are hex-encoded AES keys for the
+                                 respective field (column) of the table (see CardKeyProviderCsv)
+                table : name of the table containing the card data
+        """
+        if not os.path.isfile(filename):
+            raise RuntimeError("Could not open SQLite database '%s'" % filename)
+        self.filename = filename
+        self.table = table
+        self.crypt = ColumnDecryptor(transport_keys)
+        self._conn = None
+        self._pid = None
+        # column names are case-insensitive in SQLite, we use upper case names everywhere
+        self.columns = {row[1].upper(): row[1] for row in
+                        self.conn().execute('PRAGMA table_info("%s")' % table)}
+        if not self.columns:
+            raise RuntimeError("SQLite database '%s' lacks table '%s'" % (filename, table))
+        for name in self.VALID_KEY_FIELD_NAMES:
+            if name in self.columns:
+                try:
+                    self.conn().execute('CREATE INDEX IF NOT EXISTS "idx_%s_%s" ON "%s" ("%s")' %
+                                      (table, name.lower(), table, self.columns[name]))
+                except sqlite3.OperationalError as e:
+                    # e.g. read-only database, we have to live without the index
+                    logger.warning("Cannot create index on column '%s' of SQLite database '%s' (%s), "
+                                   "look-ups by %s will be slow", name, filename, e, name)
+        self.conn().commit()
+        self._prefetched = {}
+
+    def conn(self) -> sqlite3.Connection:
+        """Return the database connection.  A SQLite connection must not be used across fork(), so a
+        (forked) child process opens a connection of its own."""
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.filename)
+            self._pid = os.getpid()
+        return self._conn
+
+    def _query(self, key: str, values: List[str]) -> List[Dict[str, str]]:
+        if key not in self.columns:
+            raise RuntimeError("SQLite database '%s' lacks column '%s'" % (self.filename, key))
+        cur = self.conn().execute('SELECT * FROM "%s" WHERE "%s" IN (%s)' %
+                                (self.table, self.columns[key], ','.join('?' * len(values))), values)
+        names = [d[0].upper() for d in cur.description]
+        return [dict(zip(names, row)) for row in cur]
+
+    def prefetch(self, key: str, values: Iterable[str]):
+        super()._verify_get_data([], key)
+        self._prefetched = {}
+        values = list(values)
+        for i in range(0, len(values), self.PREFETCH_CHUNK_SIZE):
+            for row in self._query(key, values[i:i + self.PREFETCH_CHUNK_SIZE]):
+                self._prefetched[(key, str(row[key]))] = row
 
     def get(self, fields: List[str], key: str, value: str) -> Dict[str, str]:
         super()._verify_get_data(fields, key, value)
 
-        self.csv_file.seek(0)
-        cr = csv.DictReader(self.csv_file)
-        if not cr:
-            raise RuntimeError(
-                "Could not open DictReader for CSV-File '%s'" % self.filename)
-        cr.fieldnames = [field.upper() for field in cr.fieldnames]
+        row = self._prefetched.get((key, value))
+        if row is None:
+            rows = self._query(key, [value])
+            if not rows:
+                return {}
+            row = rows[-1]
 
         rc = {}
-        for row in cr:
-            if row[key] == value:
-                for f in fields:
-                    if f in row:
-                        rc.update({f: self._decrypt_field(f, row[f])})
-                    else:
-                        raise RuntimeError("CSV-File '%s' lacks column '%s'" %
-                                           (self.filename, f))
+        for f in fields:
+            if f in row:
+                val = '' if row[f] is None else str(row[f])
+                rc.update({f: self.crypt.decrypt_field(f, val)})
+            else:
+                raise RuntimeError("SQLite database '%s' lacks column '%s'" %
+                                   (self.filename, f))
         return rc
 
 
@@ -188,6 +478,22 @@ def card_key_provider_get(fields, key: str, value: str, provider_list=card_key_p
     return {}
 
 
+def card_key_provider_prefetch(key: str, values: Iterable[str], provider_list=card_key_providers):
+    """Let all registered card data providers prefetch the card-individual [key] data of a batch of cards.
+
+    Args:
+            key : look-up key to identify card data, such as 'ICCID'
+            values : values for look-up key of all cards in the batch
+            provider_list : override the list of providers from the global default
+    """
+    values = list(values)
+    for p in provider_list:
+        if not isinstance(p, CardKeyProvider):
+            raise ValueError(
+                "provider list contains element which is not a card data provier")
+        p.prefetch(key, values)
+
+
 def card_key_provider_get_field(field: str, key: str, value: str, provider_list=card_key_providers) -> Optional[str]:
     """Query all registered card data providers for a single field.
 
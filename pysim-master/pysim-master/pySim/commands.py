@@ -21,7 +21,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from typing import List, Tuple
+from typing import List, Tuple, Dict, Iterable, Optional
 import typing # construct also has a Union, so we do typing.Union below
 from construct import Construct, Struct, Const, Select
 from construct import Optional as COptional
@@ -29,7 +29,8 @@ from osmocom.construct import LV, filter_dict
 from osmocom.utils import rpad, lpad, b2h, h2b, h2i, i2h, str_sanitize, Hexstr
 from osmocom.tlv import bertlv_encode_len
 
-from pySim.utils import sw_match, expand_hex, SwHexstr, ResTuple, SwMatchstr
+from pySim.utils import sw_match, expand_hex, SwHexstr, ResTuple, ResTupleBin, SwMatchstr
+from pySim.utils import ef_atr_ext_length_info
 from pySim.exceptions import SwMatchError
 from pySim.transport import LinkBase
 
@@ -54,6 +55,29 @@ def lchan_nr_to_cla(cla: int, lchan_nr: int) -> int:
     else:
         raise ValueError('logical channel outside of range 0 .. 15')
 
+def build_apdu(hdr: bytes, data: bytes = b'', le: Optional[int] = None) -> bytes:
+    """Build a command APDU, using the extended length encoding of Lc/Le (ISO/IEC 7816-3 Section 12.1.3)
+    only if the data or the expected response length exceeds the limits of a short APDU.
+
+    Args:
+            hdr : APDU header (CLA, INS, P1, P2)
+            data : command data
+            le : maximum number of expected response bytes (None if no response data is expected)
+    Returns:
+            binary APDU
+    """
+    ext = len(data) > 255 or (le is not None and le > 256)
+    pdu = bytes(hdr)
+    if data:
+        pdu += b'\x00' + len(data).to_bytes(2, 'big') if ext else bytes([len(data)])
+        pdu += data
+    if le is not None:
+        if ext:
+            pdu += (b'' if data else b'\x00') + (le & 0xffff).to_bytes(2, 'big')
+        else:
+            pdu += bytes([le & 0xff])
+    return pdu
+
 def cla_with_lchan(cla_byte: Hexstr, lchan_nr: int) -> Hexstr:
     """Embed a logical channel number into the hex-string encoded CLA value."""
     cla_int = h2i(cla_byte)[0]
@@ -81,12 +105,56 @@ class SimCardCommands:
 
     @property
     def max_cmd_len(self) -> int:
-        """Maximum length of the command apdu data section. Depends on secure channel protocol used."""
+        """Maximum length of the command apdu data section. Depends on secure channel protocol used and
+        on whether extended length APDUs can be used."""
         if self.scp:
             return 255 - self.scp.overhead
+        elif self._tp.ext_len:
+            return self._tp.ext_len[0]
+        else:
+            return 255
+
+    @property
+    def max_rsp_len(self) -> int:
+        """Maximum length of the response apdu data section that we ask for."""
+        if self.scp:
+            return self.max_cmd_len
+        elif self._tp.ext_len:
+            return self._tp.ext_len[1]
         else:
             return 255
 
+    def probe_ext_length(self):
+        """Enable extended length APDUs if the link supports them and the card indicates support in its
+        EF.ATR.  Leaves the selection state of the card undefined, so the caller should select a file
+        afterwards."""
+        if not self._tp.supports_ext_length() or self._tp.ext_len:
+            return
+        try:
+            (data, _sw) = self.read_binary_bin(['3f00', '2ff1'])
+        except (SwMatchError, ValueError, KeyError):
+            return
+        if data:
+            self._tp.set_ext_length(ef_atr_ext_length_info(data))
+
+    def send_apdu_bin(self, pdu: bytes, apply_lchan:bool = True) -> ResTupleBin:
+        """Sends an APDU and auto fetch response data
+
+        Args:
+           pdu : binary APDU (ex. b'\xa0\xa4\x00\x00\x02\x3f\x00')
+           apply_lchan : apply the currently selected lchan to the CLA byte before sending
+        Returns:
+           tuple(data, sw), where
+                        data : bytes of returned data
+                        sw   : string (in hex) of status word (ex. "9000")
+        """
+        if apply_lchan:
+            pdu = bytes([lchan_nr_to_cla(pdu[0], self.lchan_nr)]) + pdu[1:]
+        if self.scp:
+            return self.scp.send_apdu_wrapper_bin(self._tp.send_apdu_bin, pdu)
+        else:
+            return self._tp.send_apdu_bin(pdu)
+
     def send_apdu(self, pdu: Hexstr, apply_lchan:bool = True) -> ResTuple:
         """Sends an APDU and auto fetch response data
 
@@ -98,12 +166,43 @@ class SimCardCommands:
                         data : string (in hex) of returned data (ex. "074F4EFFFF")
                         sw   : string (in hex) of status word (ex. "9000")
         """
+        (data, sw) = self.send_apdu_bin(h2b(pdu), apply_lchan = apply_lchan)
+        return b2h(data), sw
+
+    def send_apdu_checksw_bin(self, pdu: bytes, sw: SwMatchstr = "9000", apply_lchan:bool = True) -> ResTupleBin:
+        """Sends an APDU and check returned SW
+
+        Args:
+           pdu : binary APDU (ex. b'\xa0\xa4\x00\x00\x02\x3f\x00')
+           sw : string of 4 hexadecimal characters (ex. "9000"). The user may mask out certain
+                digits using a '?' to add some ambiguity if needed.
+           apply_lchan : apply the currently selected lchan to the CLA byte before sending
+        Returns:
+                tuple(data, sw), where
+                        data : bytes of returned data
+                        sw   : string (in hex) of status word (ex. "9000")
+        """
         if apply_lchan:
-            pdu = cla_with_lchan(pdu[0:2], self.lchan_nr) + pdu[2:]
+            pdu = bytes([lchan_nr_to_cla(pdu[0], self.lchan_nr)]) + pdu[1:]
         if self.scp:
-            return self.scp.send_apdu_wrapper(self._tp.send_apdu, pdu)
+            return self.scp.send_apdu_wrapper_bin(self._tp.send_apdu_checksw_bin, pdu, sw)
         else:
-            return self._tp.send_apdu(pdu)
+            return self._tp.send_apdu_checksw_bin(pdu, sw)
+
+    def send_apdus_checksw_bin(self, pdus: List[bytes], sw: SwMatchstr = "9000") -> List[ResTupleBin]:
+        """Sends a sequence of (idempotent) APDUs and checks the returned SW of each.  Allows the transport
+        to pipeline the APDUs, see LinkBase.send_apdus_checksw_bin().
+
+        Args:
+           pdus : list of binary APDUs
+           sw : string of 4 hexadecimal characters (ex. "9000"), see send_apdu_checksw_bin()
+        Returns:
+                list of tuple(data, sw), one for each APDU
+        """
+        if self.scp:
+            return [self.send_apdu_checksw_bin(pdu, sw) for pdu in pdus]
+        pdus = [bytes([lchan_nr_to_cla(pdu[0], self.lchan_nr)]) + pdu[1:] for pdu in pdus]
+        return self._tp.send_apdus_checksw_bin(pdus, sw)
 
     def send_apdu_checksw(self, pdu: Hexstr, sw: SwMatchstr = "9000", apply_lchan:bool = True) -> ResTuple:
         """Sends an APDU and check returned SW
@@ -118,12 +217,8 @@ class SimCardCommands:
                         data : string (in hex) of returned data (ex. "074F4EFFFF")
                         sw   : string (in hex) of status word (ex. "9000")
         """
-        if apply_lchan:
-            pdu = cla_with_lchan(pdu[0:2], self.lchan_nr) + pdu[2:]
-        if self.scp:
-            return self.scp.send_apdu_wrapper(self._tp.send_apdu_checksw, pdu, sw)
-        else:
-            return self._tp.send_apdu_checksw(pdu, sw)
+        (data, sw) = self.send_apdu_checksw_bin(h2b(pdu), sw, apply_lchan = apply_lchan)
+        return b2h(data), sw
 
     def send_apdu_constr(self, cla: Hexstr, ins: Hexstr, p1: Hexstr, p2: Hexstr, cmd_constr: Construct,
                          cmd_data: Hexstr, resp_constr: Construct, apply_lchan:bool = True) -> Tuple[dict, SwHexstr]:
@@ -232,6 +327,58 @@ class SimCardCommands:
         else:
             return int(r[-1][4:8], 16)
 
+    # Tell whether a select response describes an EF (as opposed to MF/DF/ADF). Returns None in case
+    # this cannot be determined (e.g. no select response requested via sel_ctrl).
+    def __is_ef(self, r: Hexstr) -> typing.Optional[bool]:
+        try:
+            if self.sel_ctrl == "0004":
+                # ETSI TS 102 221, chapter 11.1.1.4.3 File Descriptor
+                fdb = int(self.__parse_fcp(r)['82'][0:2], 16)
+                return fdb & 0x38 != 0x38
+            # GSM 11.11, chapter 9.2.1 SELECT: byte 7 = type of file
+            return int(r[12:14], 16) == 0x04
+        except (ValueError, KeyError, TypeError):
+            return None
+
+    def __sel_cache_get(self) -> Tuple[List[Hexstr], List[Hexstr]]:
+        entry = self._tp.sel_cache.get(self.lchan_nr)
+        # the format of the select responses depends on cla_byte/sel_ctrl
+        if entry is None or entry[0] != (self.cla_byte, self.sel_ctrl):
+            return [], []
+        return entry[1], entry[2]
+
+    def __sel_cache_set(self, path: List[Hexstr], fcps: List[Hexstr]):
+        self._tp.sel_cache[self.lchan_nr] = ((self.cla_byte, self.sel_ctrl), path, fcps)
+
+    def __sel_df_is(self, ef: Path) -> bool:
+        """Check whether the parent DF of the EF at the given path is the current DF (as far as we know from the
+        selection cache), i.e. whether the EF may be addressed by its SFI."""
+        if not isinstance(ef, list) or len(ef) < 2:
+            return False
+        df = [fid.lower() for fid in ef[:-1]]
+        (cur_path, cur_fcps) = self.__sel_cache_get()
+        if cur_path == df:
+            return self.__is_ef(cur_fcps[-1]) is False
+        if len(cur_path) == len(ef) and cur_path[:-1] == df:
+            return self.__is_ef(cur_fcps[-1]) is True
+        return False
+
+    def __sel_cache_sfi(self, cur_path: List[Hexstr], cur_fcps: List[Hexstr]):
+        """Update the selection cache after an EF has been implicitly selected by its SFI.  The current DF
+        stays the same, so we keep the path to the current DF (cur_path/cur_fcps being the cache contents
+        from before the command was sent)."""
+        if cur_path and self.__is_ef(cur_fcps[-1]) is True:
+            (cur_path, cur_fcps) = (cur_path[:-1], cur_fcps[:-1])
+        if cur_path and self.__is_ef(cur_fcps[-1]) is False:
+            self.__sel_cache_set(cur_path, cur_fcps)
+        else:
+            self.invalidate_sel_cache()
+
+    def invalidate_sel_cache(self):
+        """Forget about the currently selected file, the next select_path() call will select
+        the requested path in full."""
+        self._tp.sel_cache.pop(self.lchan_nr, None)
+
     def get_atr(self) -> Hexstr:
         """Return the ATR of the currently inserted card."""
         return self._tp.get_atr()
@@ -256,18 +403,42 @@ class SimCardCommands:
     def select_path(self, dir_list: Path) -> List[Hexstr]:
         """Execute SELECT for an entire list/path of FIDs.
 
+        The currently selected path is tracked per lchan, so SELECT commands are skipped in case
+        the requested file is already selected. Absolute paths (starting at 3f00) are shortened to
+        the part below the currently selected DF (or below the parent DF of the currently selected EF).
+
         Args:
                 dir_list: list of FIDs representing the path to select
 
         Returns:
                 list of return values (FCP in hex encoding) for each element of the path
         """
-        rv = []
         if not isinstance(dir_list, list):
             dir_list = [dir_list]
-        for i in dir_list:
+        dir_list = [fid.lower() for fid in dir_list]
+
+        (cur_path, cur_fcps) = self.__sel_cache_get()
+        if cur_path == dir_list:
+            return list(cur_fcps)
+        # a single FID may refer to the currently selected file
+        if len(dir_list) == 1 and cur_path and cur_path[-1] == dir_list[0]:
+            return [cur_fcps[-1]]
+
+        skip = 0
+        if cur_path and cur_path[0] == '3f00' and dir_list[0] == '3f00':
+            if len(dir_list) > len(cur_path) and dir_list[:len(cur_path)] == cur_path:
+                # the target is located below the currently selected DF
+                skip = len(cur_path)
+            elif len(dir_list) >= len(cur_path) and dir_list[:len(cur_path)-1] == cur_path[:-1] and \
+                 self.__is_ef(cur_fcps[-1]):
+                # the target is located below the parent DF of the currently selected EF
+                skip = len(cur_path) - 1
+
+        rv = cur_fcps[:skip]
+        for i in dir_list[skip:]:
             data, _sw = self.select_file(i)
             rv.append(data)
+        self.__sel_cache_set(dir_list, rv)
         return rv
 
     def select_file(self, fid: Hexstr) -> ResTuple:
@@ -277,7 +448,9 @@ class SimCardCommands:
                 fid : file identifier as hex string
         """
 
-        return self.send_apdu_checksw(self.cla_byte + "a4" + self.sel_ctrl + "02" + fid)
+        data, sw = self.send_apdu_checksw(self.cla_byte + "a4" + self.sel_ctrl + "02" + fid)
+        self.__sel_cache_set([fid.lower()], [data])
+        return data, sw
 
     def select_parent_df(self) -> ResTuple:
         """Execute SELECT to switch to the parent DF """
@@ -293,14 +466,61 @@ class SimCardCommands:
         aidlen = ("0" + format(len(aid) // 2, 'x'))[-2:]
         return self.send_apdu_checksw(self.cla_byte + "a4" + "0404" + aidlen + aid)
 
-    def read_binary(self, ef: Path, length: int = None, offset: int = 0) -> ResTuple:
+    def read_binary_sfi_bin(self, sfi: int, length: Optional[int] = None, offset: int = 0) -> ResTupleBin:
+        """Execute READ BINARY, addressing the EF by its short file identifier (ISO/IEC 7816-4, P1 bit 8)
+        instead of selecting it first.  The EF must be located in the current DF; it becomes the current EF.
+
+        Args:
+                sfi : short file identifier of the transparent EF
+                length : number of bytes to read (None: read until the card returns less data than requested)
+                offset : byte offset in file from which to start reading (0..255)
+        Returns:
+                tuple(data, sw), where data are the bytes read from the file
+        """
+        if not 0 < sfi < 31 or not 0 <= offset <= 0xff:
+            raise ValueError('Cannot use SFI %s / offset %d for READ BINARY' % (sfi, offset))
+        (cur_path, cur_fcps) = self.__sel_cache_get()
+        cla = h2b(self.cla_byte)
+        total_data = bytearray()
+        sw = None
+        while length is None or len(total_data) < length:
+            chunk_len = self.max_rsp_len if length is None else min(self.max_rsp_len, length - len(total_data))
+            if not total_data:
+                # only the first command addresses the EF by its SFI, the EF is the current EF afterwards
+                hdr = cla + bytes([0xb0, 0x80 | sfi, offset])
+            else:
+                hdr = cla + b'\xb0' + (offset + len(total_data)).to_bytes(2, 'big')
+            try:
+                data, sw = self.send_apdu_checksw_bin(build_apdu(hdr, le=chunk_len))
+            except SwMatchError as e:
+                # ISO/IEC 7816-4: 6B00 = offset beyond the end of the EF
+                if length is None and total_data and e.sw_actual == '6b00':
+                    break
+                e.add_note('failed to read (SFI %02x, offset %d)' % (sfi, offset + len(total_data)))
+                raise e
+            finally:
+                if not total_data:
+                    self.__sel_cache_sfi(cur_path, cur_fcps)
+            total_data += data
+            if len(data) < chunk_len:
+                break
+        return bytes(total_data), sw
+
+    def read_binary_bin(self, ef: Path, length: int = None, offset: int = 0,
+                        sfi: Optional[int] = None) -> ResTupleBin:
         """Execute READD BINARY.
 
         Args:
                 ef : string or list of strings indicating name or path of transparent EF
                 length : number of bytes to read
                 offset : byte offset in file from which to start reading
+                sfi : short file identifier of the EF; if specified, the EF is not selected but addressed
+                      by its SFI in case its parent DF is the current DF (see read_binary_sfi_bin)
+        Returns:
+                tuple(data, sw), where data are the bytes read from the file
         """
+        if sfi is not None and offset <= 0xff and self.__sel_df_is(ef):
+            return self.read_binary_sfi_bin(sfi, length, offset)
         r = self.select_path(ef)
         if len(r[-1]) == 0:
             return (None, None)
@@ -309,20 +529,35 @@ class SimCardCommands:
         if length < 0:
             return (None, None)
 
-        total_data = ''
+        cla = h2b(self.cla_byte)
+        total_data = bytearray()
+        sw = None
         chunk_offset = 0
         while chunk_offset < length:
-            chunk_len = min(self.max_cmd_len, length-chunk_offset)
-            pdu = self.cla_byte + \
-                'b0%04x%02x' % (offset + chunk_offset, chunk_len)
+            chunk_len = min(self.max_rsp_len, length-chunk_offset)
+            pdu = build_apdu(cla + b'\xb0' + (offset + chunk_offset).to_bytes(2, 'big'), le=chunk_len)
             try:
-                data, sw = self.send_apdu_checksw(pdu)
+                data, sw = self.send_apdu_checksw_bin(pdu)
             except Exception as e:
                 e.add_note('failed to read (offset %d)' % offset)
                 raise e
             total_data += data
             chunk_offset += chunk_len
-        return total_data, sw
+        return bytes(total_data), sw
+
+    def read_binary(self, ef: Path, length: int = None, offset: int = 0, sfi: Optional[int] = None) -> ResTuple:
+        """Execute READD BINARY.
+
+        Args:
+                ef : string or list of strings indicating name or path of transparent EF
+                length : number of bytes to read
+                offset : byte offset in file from which to start reading
+                sfi : short file identifier of the EF (see read_binary_bin)
+        """
+        (data, sw) = self.read_binary_bin(ef, length, offset, sfi)
+        if data is None:
+            return (None, None)
+        return b2h(data), sw
 
     def __verify_binary(self, ef, data: str, offset: int = 0):
         """Verify contents of transparent EF.
@@ -367,37 +602,111 @@ class SimCardCommands:
                 pass
 
         self.select_path(ef)
-        total_data = ''
+        cla = h2b(self.cla_byte)
+        data_bin = memoryview(h2b(data))
         chunk_offset = 0
         while chunk_offset < data_length:
             chunk_len = min(self.max_cmd_len, data_length - chunk_offset)
-            # chunk_offset is bytes, but data slicing is hex chars, so we need to multiply by 2
-            pdu = self.cla_byte + \
-                'd6%04x%02x' % (offset + chunk_offset, chunk_len) + \
-                data[chunk_offset*2: (chunk_offset+chunk_len)*2]
+            pdu = build_apdu(cla + b'\xd6' + (offset + chunk_offset).to_bytes(2, 'big'),
+                             data_bin[chunk_offset:chunk_offset+chunk_len])
             try:
-                chunk_data, chunk_sw = self.send_apdu_checksw(pdu)
+                chunk_data, chunk_sw = self.send_apdu_checksw_bin(pdu)
             except Exception as e:
                 e.add_note('failed to write chunk (chunk_offset %d, chunk_len %d)' % (chunk_offset, chunk_len))
                 raise e
-            total_data += data
             chunk_offset += chunk_len
         if verify:
             self.__verify_binary(ef, data, offset)
-        return total_data, chunk_sw
+        return data, chunk_sw
 
-    def read_record(self, ef: Path, rec_no: int) -> ResTuple:
+    def read_record_sfi(self, sfi: int, rec_no: int, rec_length: Optional[int] = None) -> ResTuple:
+        """Execute READ RECORD, addressing the EF by its short file identifier (ISO/IEC 7816-4, P2 bits 8..4)
+        instead of selecting it first.  The EF must be located in the current DF; it becomes the current EF.
+
+        Args:
+                sfi : short file identifier of the linear fixed EF
+                rec_no : record number to read
+                rec_length : length of the record (None: as returned by the card)
+        """
+        if not 0 < sfi < 31:
+            raise ValueError('Cannot use SFI %s for READ RECORD' % sfi)
+        (cur_path, cur_fcps) = self.__sel_cache_get()
+        pdu = self.cla_byte + 'b2%02x%02x%02x' % (rec_no, sfi << 3 | 0x04, rec_length or 0)
+        try:
+            return self.send_apdu_checksw(pdu)
+        finally:
+            self.__sel_cache_sfi(cur_path, cur_fcps)
+
+    def read_record(self, ef: Path, rec_no: int, sfi: Optional[int] = None) -> ResTuple:
         """Execute READ RECORD.
 
         Args:
                 ef : string or list of strings indicating name or path of linear fixed EF
                 rec_no : record number to read
+                sfi : short file identifier of the EF; if specified, the EF is not selected but addressed
+                      by its SFI in case its parent DF is the current DF (see read_record_sfi)
         """
+        if sfi is not None and self.__sel_df_is(ef):
+            return self.read_record_sfi(sfi, rec_no)
         r = self.select_path(ef)
         rec_length = self.__record_len(r)
         pdu = self.cla_byte + 'b2%02x04%02x' % (rec_no, rec_length)
         return self.send_apdu_checksw(pdu)
 
+    def __read_records_current(self, rec_length: int, rec_range: List[int]) -> Tuple[Dict[int, Hexstr], SwHexstr]:
+        """Read the given records of the current EF."""
+        pdus = [h2b(self.cla_byte + 'b2%02x04%02x' % (rec_no, rec_length)) for rec_no in rec_range]
+        try:
+            rsps = self.send_apdus_checksw_bin(pdus)
+        except Exception as e:
+            e.add_note('failed to read records %s' % rec_range)
+            raise e
+        records = {rec_no: b2h(data) for rec_no, (data, _sw) in zip(rec_range, rsps)}
+        return records, rsps[-1][1] if rsps else None
+
+    def read_records_sfi(self, sfi: int, rec_range: Iterable[int]) -> Tuple[Dict[int, Hexstr], SwHexstr]:
+        """Execute READ RECORD for multiple records, addressing the EF by its short file identifier (see
+        read_record_sfi).  Only the first record is read using the SFI, its length determines the record
+        length; the other records are then read from the (now current) EF.
+
+        Args:
+                sfi : short file identifier of the linear fixed EF
+                rec_range : record numbers to read
+        Returns:
+                tuple of a dict of hex strings (record data) indexed by record number, and the last status word
+        """
+        rec_range = list(rec_range)
+        if not rec_range:
+            return {}, None
+        (data, sw) = self.read_record_sfi(sfi, rec_range[0])
+        records = {rec_range[0]: data}
+        if len(rec_range) > 1:
+            (more, sw) = self.__read_records_current(len(data) // 2, rec_range[1:])
+            records.update(more)
+        return records, sw
+
+    def read_records(self, ef: Path, rec_range: Optional[Iterable[int]] = None,
+                     sfi: Optional[int] = None) -> Tuple[Dict[int, Hexstr], SwHexstr]:
+        """Execute READ RECORD for multiple records. The file is selected (and its select response
+        interpreted) only once, then the records are read one after another.
+
+        Args:
+                ef : string or list of strings indicating name or path of linear fixed EF
+                rec_range : record numbers to read (None: all records of the file)
+                sfi : short file identifier of the EF; if specified (and rec_range is specified), the EF is
+                      not selected but addressed by its SFI in case its parent DF is the current DF (see
+                      read_records_sfi)
+        Returns:
+                tuple of a dict of hex strings (record data) indexed by record number, and the last status word
+        """
+        if sfi is not None and rec_range is not None and self.__sel_df_is(ef):
+            return self.read_records_sfi(sfi, rec_range)
+        r = self.select_path(ef)
+        rec_length = self.__record_len(r)
+        if rec_range is None:
+            rec_range = range(1, 1 + self.__len(r) // rec_length)
+        return self.__read_records_current(rec_length, list(rec_range))
+
     def __verify_record(self, ef: Path, rec_no: int, data: str):
         """Verify record against given data
 
@@ -464,6 +773,63 @@ class SimCardCommands:
             self.__verify_record(ef, rec_no, data)
         return res
 
+    def update_records(self, ef: Path, records: Dict[int, Hexstr], verify: bool = False, conserve: bool = False,
+                       leftpad: bool = False) -> Tuple[Dict[int, Hexstr], SwHexstr]:
+        """Execute UPDATE RECORD for multiple records. The file is selected (and its select response
+        interpreted) only once, then the records are written one after another.
+
+        Args:
+                ef : string or list of strings indicating name or path of linear fixed EF
+                records : dict of hex strings (data to be written) indexed by record number
+                verify : verify data by re-reading the records
+                conserve : read records and compare them with data, skip writes on match
+                leftpad : apply 0xff padding from the left instead from the right side.
+        Returns:
+                tuple of a dict of hex strings (response data) indexed by record number, and the last status word
+        """
+        r = self.select_path(ef)
+        rec_length = self.__record_len(r)
+
+        # make sure the input data is padded to the record length using 0xFF.
+        padded = {}
+        for rec_no, data in records.items():
+            data = expand_hex(data, rec_length)
+            if len(data) // 2 > rec_length:
+                raise ValueError('Data length exceeds record length of record %d (expected max %d, got %d)' % (
+                    rec_no, rec_length, len(data) // 2))
+            if leftpad:
+                padded[rec_no] = lpad(data, rec_length * 2)
+            else:
+                padded[rec_no] = rpad(data, rec_length * 2)
+
+        # Save write cycles by reading+comparing before write
+        current = {}
+        sw = None
+        if conserve:
+            try:
+                current, sw = self.read_records(ef, padded.keys())
+            except Exception:
+                # see update_record() on why we ignore this
+                pass
+
+        todo = [rec_no for rec_no, data in padded.items() if current.get(rec_no, '').lower() != data.lower()]
+        pdus = [h2b(self.cla_byte + 'dc%02x04%02x' % (rec_no, rec_length) + padded[rec_no]) for rec_no in todo]
+        try:
+            rsps = self.send_apdus_checksw_bin(pdus)
+        except Exception as e:
+            e.add_note('failed to update records %s' % todo)
+            raise e
+        result = {rec_no: b2h(data) for rec_no, (data, _sw) in zip(todo, rsps)}
+        if rsps:
+            sw = rsps[-1][1]
+        if verify and padded:
+            res, _sw = self.read_records(ef, padded.keys())
+            for rec_no, data in padded.items():
+                if res[rec_no].lower() != data.lower():
+                    raise ValueError('Record %d verification failed (expected %s, got %s)' % (
+                        rec_no, data.lower(), res[rec_no].lower()))
+        return result, sw
+
     def record_size(self, ef: Path) -> int:
         """Determine the record size of given file.
 
@@ -524,10 +890,11 @@ class SimCardCommands:
             p1 = 0x80
         else:
             p1 = 0x00
-        if isinstance(data, (bytes, bytearray)):
-            data = b2h(data)
-        pdu = '80db00%02x%02x%s' % (p1, len(data)//2, data)
-        return self.send_apdu_checksw(pdu)
+        if not isinstance(data, (bytes, bytearray)):
+            data = h2b(data)
+        pdu = build_apdu(bytes([0x80, 0xdb, 0x00, p1]), data)
+        (rdata, sw) = self.send_apdu_checksw_bin(pdu)
+        return b2h(rdata), sw
 
     def set_data(self, ef, tag: int, value: str, verify: bool = False, conserve: bool = False) -> ResTuple:
         """Execute SET DATA.
@@ -1,7 +1,13 @@
+import os
 import sys
+import pickle
+import hashlib
+import tempfile
 from typing import Optional, Tuple
 from importlib import resources
 
+from pySim.utils import cache_dir
+
 class PMO:
     """Convenience conversion class for ProfileManagementOperation as used in ES9+ notifications."""
     pmo4operation = {
@@ -47,18 +53,96 @@ class PMO:
     def __str__(self):
         return self.op
 
-def compile_asn1_subdir(subdir_name:str, codec='der'):
-    """Helper function that compiles ASN.1 syntax from all files within given subdir"""
-    import asn1tools
+def _read_asn1_subdir(subdir_name: str) -> str:
+    """Read and concatenate the ASN.1 syntax from all files within given subdir."""
     asn_txt = ''
     __ver = sys.version_info
     if (__ver.major, __ver.minor) >= (3, 9):
-        for i in resources.files('pySim.esim').joinpath('asn1').joinpath(subdir_name).iterdir():
+        for i in sorted(resources.files('pySim.esim').joinpath('asn1').joinpath(subdir_name).iterdir(),
+                        key=lambda x: x.name):
             asn_txt += i.read_text()
             asn_txt += "\n"
     #else:
         #print(resources.read_text(__name__, 'asn1/rsp.asn'))
-    return asn1tools.compile_string(asn_txt, codec=codec)
+    return asn_txt
+
+def asn1_cache_dir() -> Optional[str]:
+    """Return the directory in which compiled ASN.1 specifications are cached; may be overridden via the
+    PYSIM_ASN1_CACHE_DIR environment variable.  Setting it to an empty string disables the cache."""
+    ret = os.environ.get('PYSIM_ASN1_CACHE_DIR')
+    if ret is None:
+        return os.path.join(cache_dir(), 'asn1')
+    return ret or None
+
+def compile_asn1_subdir(subdir_name:str, codec='der'):
+    """Helper function that compiles ASN.1 syntax from all files within given subdir.
+
+    Compiling takes a significant amount of time, so the resulting asn1tools Specification is cached
+    (pickled) on disk, keyed by a hash of the ASN.1 syntax and of the asn1tools version, and loaded from
+    there if possible.  Only use a cache directory that is not writable by anyone else, as unpickling
+    a cache file executes arbitrary code.
+    """
+    import asn1tools
+    asn_txt = _read_asn1_subdir(subdir_name)
+    cachedir = asn1_cache_dir()
+    if not cachedir:
+        return asn1tools.compile_string(asn_txt, codec=codec)
+
+    key = hashlib.sha256(('%s\0%s\0' % (asn1tools.__version__, codec)).encode() + asn_txt.encode()).hexdigest()
+    prefix = '%s-%s-' % (subdir_name, codec)
+    filename = os.path.join(cachedir, prefix + key[:32] + '.pickle')
+    try:
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
+    except Exception: # pylint: disable=broad-except
+        # not cached yet, or unreadable / incompatible cache file
+        pass
+
+    spec = asn1tools.compile_string(asn_txt, codec=codec)
+    try:
+        os.makedirs(cachedir, exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(dir=cachedir, prefix='.' + prefix)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(spec, f)
+            # atomically, as concurrent processes (e.g. SM-DP+ workers) may load it at the same time
+            os.replace(tmpname, filename)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+        # remove cache files of previous versions of the ASN.1 syntax or of asn1tools
+        for stale in os.listdir(cachedir):
+            if stale.startswith(prefix) and stale.endswith('.pickle') and stale != os.path.basename(filename):
+                os.unlink(os.path.join(cachedir, stale))
+    except OSError:
+        pass
+    return spec
+
+
+class LazyAsn1Spec:
+    """Proxy for the asn1tools Specification compiled from all files within given subdir (see
+    compile_asn1_subdir).  The specification is only compiled (or loaded from the cache) on its first use,
+    e.g. when calling its encode() or decode() method, so that importing a module using ASN.1 is cheap."""
+    def __init__(self, subdir_name: str, codec='der'):
+        self.subdir_name = subdir_name
+        self.codec = codec
+        self._spec = None
+
+    @property
+    def spec(self):
+        """The compiled asn1tools Specification."""
+        if self._spec is None:
+            self._spec = compile_asn1_subdir(self.subdir_name, self.codec)
+        return self._spec
+
+    def __getattr__(self, name):
+        # only called for attributes not found via the normal mechanism, i.e. those of the Specification
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.spec, name)
+
+    def __repr__(self):
+        return '%s(%s, %s)' % (self.__class__.__name__, self.subdir_name, self.codec)
 
 
 # SGP.22 section 4.1 Activation Code
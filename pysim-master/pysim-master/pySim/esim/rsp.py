@@ -18,23 +18,29 @@
 
 
 from typing import Optional
-import shelve
+from collections import OrderedDict
+import abc
+import os
+import time
+import pickle
+import sqlite3
+import threading
 
 from cryptography.hazmat.primitives.asymmetric import ec
-from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.hazmat.primitives.serialization import Encoding, PrivateFormat, NoEncryption
+from cryptography.hazmat.primitives.serialization import load_der_private_key
 from cryptography import x509
 from osmocom.utils import b2h
 from osmocom.tlv import bertlv_parse_one_rawtag, bertlv_return_one_rawtlv
 
-from pySim.esim import compile_asn1_subdir
+from pySim.esim import LazyAsn1Spec
 
-asn1 = compile_asn1_subdir('rsp')
+asn1 = LazyAsn1Spec('rsp')
 
 class RspSessionState:
     """Encapsulates the state of a RSP session.  It is created during the initiateAuthentication
     and subsequently used by further API calls using the same transactionId.  The session state
-    is removed either after cancelSession or after notification.
-    TODO: add some kind of time based expiration / garbage collection."""
+    is removed either after cancelSession or after notification, or it expires (see RspSessionStore)."""
     def __init__(self, transactionId: str, serverChallenge: bytes, ci_cert_id: bytes):
         self.transactionId = transactionId
         self.serverChallenge = serverChallenge
@@ -95,9 +101,196 @@ class RspSessionState:
         self.__dict__.update(state)
 
 
-class RspSessionStore(shelve.DbfilenameShelf):
-    """A derived class as wrapper around the database-backed non-volatile storage 'shelve', in case we might
-    need to extend it in the future. We use it to store RspSessionState objects indexed by transactionId."""
+class RspSessionStore(abc.ABC):
+    """Interface of a store for RspSessionState objects indexed by transactionId.  Sessions which have not
+    been stored for more than 'ttl' seconds (e.g. because the LPA abandoned them) are considered expired:
+    they are no longer returned and are eventually removed by the garbage collection (see gc()), which is
+    run every 'gc_interval' seconds as part of storing a session.
+
+    Callers must store a session again after modifying it; implementations may return copies.  All
+    implementations can be used from multiple threads (e.g. the request handling threads of osmo-smdpp)."""
+    def __init__(self, ttl: float = 3600, gc_interval: float = 60):
+        """
+        Args:
+                ttl : time (in seconds) after which a session expires if it is not stored again
+                gc_interval : minimum time (in seconds) between two garbage collection runs
+        """
+        self.ttl = ttl
+        self.gc_interval = gc_interval
+        self._last_gc = time.monotonic()
+        # serializes the access to the underlying storage
+        self._lock = threading.RLock()
+
+    @abc.abstractmethod
+    def get(self, transactionId: str, default=None) -> Optional[RspSessionState]:
+        """Look up the (non-expired) session with the given transactionId."""
+
+    @abc.abstractmethod
+    def _store(self, transactionId: str, ss: RspSessionState, expires: float):
+        pass
+
+    @abc.abstractmethod
+    def __delitem__(self, transactionId: str):
+        pass
+
+    @abc.abstractmethod
+    def gc(self) -> int:
+        """Remove all expired sessions.  Returns the number of removed sessions."""
+
+    def close(self):
+        """Release any resources held by the store."""
+
+    def __setitem__(self, transactionId: str, ss: RspSessionState):
+        now = time.time()
+        self._store(transactionId, ss, now + self.ttl)
+        if time.monotonic() - self._last_gc >= self.gc_interval:
+            self._last_gc = time.monotonic()
+            self.gc()
+
+    def __getitem__(self, transactionId: str) -> RspSessionState:
+        ss = self.get(transactionId)
+        if ss is None:
+            raise KeyError(transactionId)
+        return ss
+
+    def __contains__(self, transactionId: str) -> bool:
+        return self.get(transactionId) is not None
+
+
+class RspSessionStoreMemory(RspSessionStore):
+    """Volatile in-memory session store.  The RspSessionState objects are kept as-is (no serialization).  In
+    addition to the time based expiration, the least recently used sessions are evicted if more than
+    'max_sessions' sessions exist.  Only suitable for a single (worker) process."""
+    def __init__(self, max_sessions: int = 10000, **kwargs):
+        super().__init__(**kwargs)
+        self.max_sessions = max_sessions
+        # transactionId -> (expiration time, RspSessionState), in least-recently-used order
+        self._sessions = OrderedDict()
+
+    def get(self, transactionId: str, default=None) -> Optional[RspSessionState]:
+        with self._lock:
+            entry = self._sessions.get(transactionId, None)
+            if entry is None:
+                return default
+            if entry[0] <= time.time():
+                del self._sessions[transactionId]
+                return default
+            self._sessions.move_to_end(transactionId)
+            return entry[1]
+
+    def _store(self, transactionId: str, ss: RspSessionState, expires: float):
+        with self._lock:
+            self._sessions[transactionId] = (expires, ss)
+            self._sessions.move_to_end(transactionId)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def __delitem__(self, transactionId: str):
+        with self._lock:
+            del self._sessions[transactionId]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def gc(self) -> int:
+        with self._lock:
+            now = time.time()
+            expired = [k for k, v in self._sessions.items() if v[0] <= now]
+            for k in expired:
+                del self._sessions[k]
+            return len(expired)
+
+
+class RspSessionStoreSqlite(RspSessionStore):
+    """Persistent session store based on a SQLite database, which can be shared between multiple (worker)
+    processes.  Certificates and the one-time private key are stored as DER, the remaining (plain
+    bytes/str) members of RspSessionState are pickled.  The expiration time is indexed, so the garbage
+    collection does not slow down with the number of stored sessions."""
+    def __init__(self, filename: str, **kwargs):
+        """
+        Args:
+                filename : file name (path) of the SQLite database, created if it doesn't exist yet
+        """
+        super().__init__(**kwargs)
+        self.filename = filename
+        self._conn = None
+        self._pid = None
+        conn = self.conn()
+        conn.execute('CREATE TABLE IF NOT EXISTS sessions (transaction_id TEXT PRIMARY KEY, '
+                     'expires REAL NOT NULL, euicc_cert BLOB, eum_cert BLOB, smdp_ot BLOB, state BLOB)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires)')
+        conn.commit()
+
+    def conn(self) -> sqlite3.Connection:
+        """Return the database connection.  A SQLite connection must not be used across fork(), so a
+        (forked) child process opens a connection of its own.  Within a process, the connection is shared
+        by all threads; the store serializes its use."""
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.filename, timeout=30, check_same_thread=False)
+            # allow concurrent readers while one process is writing
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, transactionId: str, default=None) -> Optional[RspSessionState]:
+        with self._lock:
+            row = self.conn().execute('SELECT euicc_cert, eum_cert, smdp_ot, state FROM sessions '
+                                      'WHERE transaction_id = ? AND expires > ?',
+                                      (transactionId, time.time())).fetchone()
+        if row is None:
+            return default
+        euicc_cert, eum_cert, smdp_ot, state = row
+        ss = RspSessionState.__new__(RspSessionState)
+        ss.__dict__.update(pickle.loads(state))
+        ss.euicc_cert = x509.load_der_x509_certificate(euicc_cert) if euicc_cert else None
+        ss.eum_cert = x509.load_der_x509_certificate(eum_cert) if eum_cert else None
+        ss.smdp_ot = load_der_private_key(smdp_ot, None) if smdp_ot else None
+        return ss
+
+    def _store(self, transactionId: str, ss: RspSessionState, expires: float):
+        state = ss.__dict__.copy()
+        euicc_cert = state.pop('euicc_cert', None)
+        eum_cert = state.pop('eum_cert', None)
+        smdp_ot = state.pop('smdp_ot', None)
+        row = (transactionId, expires,
+               euicc_cert.public_bytes(Encoding.DER) if euicc_cert else None,
+               eum_cert.public_bytes(Encoding.DER) if eum_cert else None,
+               smdp_ot.private_bytes(Encoding.DER, PrivateFormat.PKCS8, NoEncryption()) if smdp_ot else None,
+               pickle.dumps(state))
+        with self._lock:
+            conn = self.conn()
+            conn.execute('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?)', row)
+            conn.commit()
+
+    def __delitem__(self, transactionId: str):
+        with self._lock:
+            conn = self.conn()
+            cur = conn.execute('DELETE FROM sessions WHERE transaction_id = ?', (transactionId,))
+            conn.commit()
+        if cur.rowcount == 0:
+            raise KeyError(transactionId)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn().execute('SELECT COUNT(*) FROM sessions WHERE expires > ?',
+                                       (time.time(),)).fetchone()[0]
+
+    def gc(self) -> int:
+        with self._lock:
+            conn = self.conn()
+            cur = conn.execute('DELETE FROM sessions WHERE expires <= ?', (time.time(),))
+            conn.commit()
+            return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            if self._conn and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+            self._pid = None
+
 
 def extract_euiccSigned1(authenticateServerResponse: bytes) -> bytes:
     """Extract the raw, DER-encoded binary euiccSigned1 field from the given AuthenticateServerResponse. This
@@ -18,9 +18,8 @@
 import logging
 import abc
 import io
-from typing import Tuple, List, Optional, Dict, Union
+from typing import Tuple, List, Optional, Dict, Union, Iterable
 from collections import OrderedDict
-import asn1tools
 from osmocom.utils import b2h, h2b, Hexstr
 from osmocom.tlv import BER_TLV_IE, bertlv_parse_tag, bertlv_parse_len
 from osmocom.construct import build_construct, parse_construct, GreedyInteger
@@ -30,13 +29,13 @@ from pySim.ts_102_221 import FileDescriptor
 from pySim.filesystem import CardADF, Path
 from pySim.ts_31_102 import ADF_USIM
 from pySim.ts_31_103 import ADF_ISIM
-from pySim.esim import compile_asn1_subdir
+from pySim.esim import LazyAsn1Spec
 from pySim.esim.saip import templates
 from pySim.esim.saip import oid
 from pySim.global_platform import KeyType, KeyUsageQualifier
 from pySim.global_platform.uicc import UiccSdInstallParams
 
-asn1 = compile_asn1_subdir('saip')
+asn1 = LazyAsn1Spec('saip')
 
 logger = logging.getLogger(__name__)
 
@@ -489,15 +488,36 @@ class ProfileElement:
         else:
             return None
 
+    @staticmethod
+    def type_for_der(der: bytes) -> Optional[str]:
+        """Determine the PE type from the tag of the given DER encoded PE, without decoding it."""
+        tag_len = 1
+        if der[0] & 0x1f == 0x1f:
+            # multi-byte tag
+            while der[tag_len] & 0x80:
+                tag_len += 1
+            tag_len += 1
+        member = asn1.types['ProfileElement'].type.tag_to_member.get(bytes(der[:tag_len]))
+        return member.name if member else None
+
     @classmethod
     def from_der(cls, der: bytes,
-                 pe_sequence: Optional['ProfileElementSequence'] = None) -> 'ProfileElement':
+                 pe_sequence: Optional['ProfileElementSequence'] = None, lazy: bool = False) -> 'ProfileElement':
         """Construct an instance from given raw, DER encoded bytes.
 
         Args:
             der: raw, DER-encoded bytes of a single PE
             pe_sequence: back-reference to the PE-Sequence of which this PE is part of
+            lazy: only determine the PE type now; decode the PE on first access of any other attribute
         """
+        pe_type = cls.type_for_der(der) if lazy else None
+        if pe_type:
+            pe_cls = cls.class_for_petype(pe_type) or ProfileElement
+            inst = pe_cls.__new__(pe_cls)
+            inst.pe_sequence = pe_sequence
+            inst.type = pe_type
+            inst._lazy_der = der
+            return inst
         pe_type, decoded = asn1.decode('ProfileElement', der)
         pe_cls = cls.class_for_petype(pe_type)
         if pe_cls:
@@ -512,11 +532,39 @@ class ProfileElement:
 
     def to_der(self) -> bytes:
         """Build an encoded DER representation of the instance."""
+        # a PE that was never decoded is still unmodified
+        if '_lazy_der' in self.__dict__:
+            return self._lazy_der
         # run any pre-encoder a derived class may have
         if hasattr(self, '_pre_encode'):
             self._pre_encode()
         return asn1.encode('ProfileElement', (self.type, self.decoded))
 
+    def __getattr__(self, name):
+        # Only called for attributes that do not exist (yet): A lazily parsed PE (see from_der) is decoded
+        # on first access, the files of a file-system bearing PE are only created on first access to them.
+        if not name.startswith('__'):
+            if '_lazy_der' in self.__dict__:
+                self._decode_lazy()
+                return getattr(self, name)
+            if name == 'files' and self.__dict__.get('_lazy_files'):
+                self.pe_sequence._build_lazy_fs()
+                return getattr(self, name)
+        raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
+    def _decode_lazy(self):
+        """Decode a lazily parsed PE."""
+        der = self.__dict__.pop('_lazy_der')
+        _pe_type, decoded = asn1.decode('ProfileElement', der)
+        self.__init__(decoded, pe_sequence=self.pe_sequence)
+        if isinstance(self, (FsProfileElement, ProfileElementGFM)) and self.pe_sequence:
+            # the files are added to the file system tree of the sequence, which must happen in order
+            # of the PE sequence; this is deferred until the files or the tree are needed.
+            del self.files
+            self._lazy_files = True
+        elif hasattr(self, '_post_decode'):
+            self._post_decode()
+
     def __str__(self) -> str:
         return self.type
 
@@ -1250,6 +1298,11 @@ class ProfileElementSequence:
     This primarily contains a list of PEs (pe_list member) as well as a number of convenience indexes
     like the pe_by_type and pes_by_naa dicts that allow easier access to individual PEs within the
     sequence."""
+    # PE types that start a new NAA instance in pes_by_naa
+    NAA_PE_TYPES = ['mf', 'usim', 'isim', 'csim']
+    # PE types that are not part of any NAA instance in pes_by_naa
+    PE_TYPES_NOT_NAA_RELATED = ['securityDomain', 'rfm', 'application', 'end']
+
     def __init__(self):
         """After calling the constructor, you have to further initialize the instance by either
         calling the parse_der() method, or by manually adding individual PEs, including the hedaer and
@@ -1257,9 +1310,22 @@ class ProfileElementSequence:
         self.pe_list: List[ProfileElement] = []
         self.pe_by_type: Dict = {}
         self.pes_by_naa: Dict = {}
-        self.mf: Optional[FsNodeMF] = None
+        self._cur_naa_inst: Optional[List[ProfileElement]] = None # last NAA instance in pes_by_naa
+        self._mf: Optional[FsNodeMF] = None
+        self._lazy_fs = False # file system tree of lazily parsed PEs not built yet
         self._cur_df: Optional[FsNodeDF] = None # current DF while adding files from FS-templates
 
+    @property
+    def mf(self) -> Optional['FsNodeMF']:
+        """MF (root) of the file system tree."""
+        if self._lazy_fs:
+            self._build_lazy_fs()
+        return self._mf
+
+    @mf.setter
+    def mf(self, new_mf: Optional['FsNodeMF']):
+        self._mf = new_mf
+
     @property
     def cur_df(self) -> Optional['FsNodeDF']:
         """Current DF; this is where the next files are created."""
@@ -1282,8 +1348,46 @@ class ProfileElementSequence:
     def append(self, pe: ProfileElement):
         """Append a given PE to the end of the PE Sequence"""
         self.pe_list.append(pe)
-        self._process_pelist()
-        self.renumber_identification()
+        # the convenience accessor dicts and the numbering are updated incrementally, so that building a
+        # sequence PE by PE does not require a re-scan of the entire sequence for each PE.
+        self.pe_by_type.setdefault(pe.type, []).append(pe)
+        if pe.type in self.NAA_PE_TYPES:
+            self._cur_naa_inst = [pe]
+            self.pes_by_naa.setdefault(pe.type, []).append(self._cur_naa_inst)
+        elif pe.type not in self.PE_TYPES_NOT_NAA_RELATED and self._cur_naa_inst is not None:
+            self._cur_naa_inst.append(pe)
+        self.renumber_identification(len(self.pe_list) - 1)
+
+    def extend(self, pes: Iterable[ProfileElement]):
+        """Append the given PEs to the end of the PE Sequence"""
+        for pe in pes:
+            self.append(pe)
+
+    def insert(self, idx: int, pe: ProfileElement):
+        """Insert a given PE into the PE Sequence before the given index."""
+        idx = len(self.pe_list) + idx if idx < 0 else min(idx, len(self.pe_list))
+        if idx == len(self.pe_list):
+            self.append(pe)
+            return
+        # position within the list of PEs of the same type
+        type_idx = sum(1 for x in self.pe_list[:idx] if x.type == pe.type)
+        self.pe_list.insert(idx, pe)
+        self.pe_by_type.setdefault(pe.type, []).insert(type_idx, pe)
+        if pe.type not in self.PE_TYPES_NOT_NAA_RELATED:
+            self._rebuild_pes_by_naa()
+        self.renumber_identification(idx)
+
+    def remove(self, pe: ProfileElement):
+        """Remove a given PE from the PE Sequence."""
+        idx = self.pe_list.index(pe)
+        del self.pe_list[idx]
+        pes = self.pe_by_type[pe.type]
+        pes.remove(pe)
+        if not pes:
+            del self.pe_by_type[pe.type]
+        if pe.type not in self.PE_TYPES_NOT_NAA_RELATED:
+            self._rebuild_pes_by_naa()
+        self.renumber_identification(idx)
 
     def get_pes_for_type(self, tname: str) -> List[ProfileElement]:
         """Return list of profile elements present for given profile element type."""
@@ -1323,15 +1427,32 @@ class ProfileElementSequence:
             if tid.prefix_match(pe.templateID):
                 return pe
 
-    def parse_der(self, der: bytes) -> None:
-        """Parse a sequence of PE from SAIP DER format and store the result in self.pe_list."""
+    def parse_der(self, der: bytes, lazy: bool = False) -> None:
+        """Parse a sequence of PE from SAIP DER format and store the result in self.pe_list.
+
+        Args:
+            der: raw, DER-encoded bytes of the PE sequence
+            lazy: only split the sequence into PEs now; decode each PE on first access (see
+                  ProfileElement.from_der) and build the file system tree on first access to it
+        """
         self.pe_list = []
+        self._lazy_fs = lazy
         remainder = der
         while len(remainder):
             first_tlv, remainder = bertlv_first_segment(remainder)
-            self.pe_list.append(ProfileElement.from_der(first_tlv, pe_sequence=self))
+            self.pe_list.append(ProfileElement.from_der(first_tlv, pe_sequence=self, lazy=lazy))
         self._process_pelist()
 
+    def _build_lazy_fs(self) -> None:
+        """Build the file system tree from the file-system bearing PEs of a lazily parsed sequence."""
+        self._lazy_fs = False
+        for pe in self.pe_list:
+            if '_lazy_der' in pe.__dict__ and isinstance(pe, (FsProfileElement, ProfileElementGFM)):
+                pe._decode_lazy()
+            if pe.__dict__.pop('_lazy_files', False):
+                pe.files = {}
+                pe._post_decode()
+
     def _process_pelist(self) -> None:
         """Post-process the PE-list; update convenience accessor dicts."""
         self._rebuild_pe_by_type()
@@ -1351,16 +1472,15 @@ class ProfileElementSequence:
         """rebuild the self.pes_by_naa dict {naa: [ [pe, pe, pe], [pe, pe] ]} form,
         which basically means for every NAA there's a lsit of instances, and each consists
         of a list of a list of PEs."""
-        self.pres_by_naa = {}
-        petype_not_naa_related = ['securityDomain', 'rfm', 'application', 'end']
-        naa = ['mf', 'usim', 'isim', 'csim']
+        self.pes_by_naa = {}
+        self._cur_naa_inst = None
         cur_naa = None
         cur_naa_list = []
         for pe in self.pe_list:
             # skip all PE that are not related to NAA
-            if pe.type in petype_not_naa_related:
+            if pe.type in self.PE_TYPES_NOT_NAA_RELATED:
                 continue
-            if pe.type in naa:
+            if pe.type in self.NAA_PE_TYPES:
                 if cur_naa:
                     if not cur_naa in self.pes_by_naa:
                         self.pes_by_naa[cur_naa] = []
@@ -1373,6 +1493,7 @@ class ProfileElementSequence:
             if not cur_naa in self.pes_by_naa:
                 self.pes_by_naa[cur_naa] = []
             self.pes_by_naa[cur_naa].append(cur_naa_list)
+            self._cur_naa_inst = cur_naa_list
 
     def rebuild_mandatory_services(self):
         """(Re-)build the eUICC Mandatory services list of the ProfileHeader based on what's in the
@@ -1453,10 +1574,10 @@ class ProfileElementSequence:
         hdr_pe.decoded['eUICC-Mandatory-GFSTEList'] = list(template_set)
 
     @classmethod
-    def from_der(cls, der: bytes) -> 'ProfileElementSequence':
-        """Construct an instance from given raw, DER encoded bytes."""
+    def from_der(cls, der: bytes, lazy: bool = False) -> 'ProfileElementSequence':
+        """Construct an instance from given raw, DER encoded bytes (see parse_der)."""
         inst = cls()
-        inst.parse_der(der)
+        inst.parse_der(der, lazy)
         return inst
 
     def to_der(self) -> bytes:
@@ -1466,10 +1587,24 @@ class ProfileElementSequence:
             out += pe.to_der()
         return out
 
-    def renumber_identification(self):
-        """Re-generate the 'identification' numbering of all PE headers."""
+    def renumber_identification(self, start: int = 0):
+        """Re-generate the 'identification' numbering of all PE headers.
+
+        Args:
+            start: index of the first PE to re-number; all PEs before it are assumed to be numbered already
+        """
         i = 1
-        for pe in self.pe_list:
+        # continue after the last numbered PE before start
+        for j in range(start - 1, -1, -1):
+            pe = self.pe_list[j]
+            if pe.header:
+                if 'identification' in pe.header:
+                    i = pe.header['identification'] + 1
+                else:
+                    start = 0
+                break
+        for j in range(start, len(self.pe_list)):
+            pe = self.pe_list[j]
             hdr = pe.header
             if not hdr:
                 continue
@@ -1491,9 +1626,7 @@ class ProfileElementSequence:
         # find MNO-SD index
         idx = self.get_index_by_type('securityDomain')[0]
         # insert _after_ MNO-SD
-        self.pe_list.insert(idx+1, ssd)
-        self._process_pelist()
-        self.renumber_identification()
+        self.insert(idx+1, ssd)
 
     def remove_naas_of_type(self, naa: Naa) -> None:
         """Remove all instances of NAAs of given type. This can be used, for example,
@@ -0,0 +1,267 @@
+# Mass personalization of SAIP profiles from a template
+#
+# (C) 2024 by sysmocom - s.f.m.c. GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import csv
+import random
+import itertools
+import logging
+import multiprocessing
+from typing import List, Dict, Optional, Type, Tuple
+
+from osmocom.utils import h2b
+
+from pySim.esim.saip import ProfileElementSequence
+from pySim.esim.saip.personalization import ConfigurableParameter, SdKey, AlgoConfig, AlgorithmID
+
+logger = logging.getLogger(__name__)
+
+class CompiledTemplate:
+    """A profile template (UPP) that has been "compiled" for a given set of ConfigurableParameter classes.
+
+    Personalizing a profile the regular way means parsing the template, applying the parameters to the
+    decoded PEs and re-encoding the result.  When generating a large number of profiles from the same
+    template, this is a lot of redundant work.  During compilation, the template is personalized with
+    distinct (seeded) random probe values and the byte offsets at which the raw bytes of each parameter value (see
+    ConfigurableParameter.value_bytes) end up in the DER encoded profile are recorded.  A profile is then
+    produced by simply patching the values into a copy of those bytes.
+
+    The offsets are verified against a regular personalization with two further sets of probe values.  Parameters
+    that can not be compiled (no value_bytes support, no suitable probe values, ...) are applied the regular
+    way on top of the patched profile.  The same happens for all parameters of a profile whose value
+    bytes have a different length than during compilation, as patching would change the length of the
+    surrounding TLVs."""
+
+    # number of attempts to find the valid, distinct random probe values for a parameter
+    PROBE_ATTEMPTS = 100
+    # number of probe value sets: two to determine the offsets, the others to verify them
+    PROBE_SETS = 4
+
+    def __init__(self, template_der: bytes, samples: List[ConfigurableParameter], seed: int = 0):
+        """
+        Args:
+            template_der: DER encoded template profile (UPP)
+            samples: one (example) instance of each parameter class that is going to be personalized;
+                     the probe values used during compilation are modelled after their input values
+            seed: seed of the (pseudo) random probe values
+        """
+        self.template_der = template_der
+        self.classes = [type(p) for p in samples]
+        self.base = None
+        self.offsets = None
+        # indexes of the parameters that are patched (fast) or applied the regular way (slow)
+        self.fast = []
+        self._compile(samples, seed)
+        if self.offsets is None:
+            logger.warning("Could not compile template, using regular personalization only")
+            self.fast = []
+        self.slow = [i for i in range(len(samples)) if i not in self.fast]
+
+    def _personalize_slow(self, der: bytes, params: List[ConfigurableParameter]) -> bytes:
+        """Regular personalization: apply parameters to the (lazily) decoded profile and re-encode it."""
+        pes = ProfileElementSequence.from_der(der, lazy=True)
+        for p in params:
+            p.apply(pes)
+        return pes.to_der()
+
+    @staticmethod
+    def _random_like(val, rng: random.Random):
+        """Generate a random value that has the same type and length as the given one."""
+        if isinstance(val, (bytes, bytearray)):
+            return bytes(rng.getrandbits(8) for i in range(len(val)))
+        if isinstance(val, int):
+            return rng.randrange(10 ** len(str(val)))
+        if isinstance(val, str) and val.isdecimal():
+            return ''.join(rng.choice('0123456789') for i in range(len(val)))
+        return None
+
+    def _probes(self, sample: ConfigurableParameter, rng: random.Random, used: set) -> List[ConfigurableParameter]:
+        """Generate up to PROBE_SETS validated probe instances of the class of the given sample.  The value
+        bytes of all probes differ from each other and from those in 'used' (the probes of the other
+        parameters), so that each probe value can be located unambiguously in the encoded profile."""
+        probes = []
+        for i in range(self.PROBE_ATTEMPTS):
+            val = self._random_like(sample.input_value, rng)
+            if val is None:
+                break
+            probe = type(sample)(val)
+            try:
+                probe.validate()
+            except ValueError:
+                continue
+            vbs = probe.value_bytes()
+            if vbs is None:
+                break
+            vbs = [bytes(vb) for vb in vbs]
+            if any(vb in used for vb in vbs):
+                continue
+            used.update(vbs)
+            probes.append(probe)
+            if len(probes) == self.PROBE_SETS:
+                break
+        return probes
+
+    def _compile(self, samples: List[ConfigurableParameter], seed: int):
+        # The probe values are drawn from a seeded generator, so that compiling the same template with the
+        # same parameter classes always gives the same result.
+        rng = random.Random(seed)
+        used = set()
+        probes = {}
+        for i, p in enumerate(samples):
+            l = self._probes(p, rng, used)
+            # Parameters with only three possible values (AlgorithmID) re-use the second probe in the last
+            # verification set.  With less than three values, there is no independent verification.
+            if len(l) >= 3:
+                probes[i] = l + l[1:2] * (self.PROBE_SETS - len(l))
+        fast = list(probes)
+        if not fast:
+            return
+        # the offsets are determined with the first two probe sets...
+        der_a = self._personalize_slow(self.template_der, [probes[i][0] for i in fast])
+        der_b = self._personalize_slow(self.template_der, [probes[i][1] for i in fast])
+        if len(der_a) != len(der_b):
+            return
+        offsets = {}
+        for i in fast:
+            offsets[i] = []
+            for vb_a, vb_b in zip(probes[i][0].value_bytes(), probes[i][1].value_bytes()):
+                if len(vb_a) != len(vb_b):
+                    return
+                # all positions where the value of probe a is found in profile a, and the value of
+                # probe b at the same position in profile b
+                offs = []
+                o = der_a.find(vb_a)
+                while o >= 0:
+                    if der_b[o:o+len(vb_b)] == vb_b:
+                        offs.append(o)
+                    o = der_a.find(vb_a, o + 1)
+                offsets[i].append((len(vb_a), offs))
+        self.base = der_a
+        self.offsets = offsets
+        self.fast = fast
+        # ...and verified against a regular personalization with each of the remaining ones
+        for n in range(2, self.PROBE_SETS):
+            verify = {i: probes[i][n] for i in fast}
+            if self._patch(verify) != self._personalize_slow(self.template_der, [verify[i] for i in fast]):
+                self.offsets = None
+                return
+
+    def _patch(self, params: Dict[int, ConfigurableParameter]) -> Optional[bytes]:
+        """Patch the value bytes of the given (compiled) parameters into the base profile."""
+        out = bytearray(self.base)
+        for i in self.fast:
+            for vb, (vb_len, offs) in zip(params[i].value_bytes(), self.offsets[i]):
+                if len(vb) != vb_len:
+                    return None
+                for o in offs:
+                    out[o:o+vb_len] = vb
+        return bytes(out)
+
+    def personalize(self, params: List[ConfigurableParameter]) -> bytes:
+        """Generate a personalized profile.
+
+        Args:
+            params: list of parameter instances, with one instance for each of the classes (and in the
+                    same order) as the samples that were passed during compilation
+        Returns:
+            DER encoded personalized profile
+        """
+        if [type(p) for p in params] != self.classes:
+            raise ValueError('Parameters do not match the compiled template')
+        for p in params:
+            p.validate()
+        der = self._patch(dict(enumerate(params))) if self.fast else None
+        if der is None:
+            return self._personalize_slow(self.template_der, params)
+        if self.slow:
+            return self._personalize_slow(der, [params[i] for i in self.slow])
+        return der
+
+
+def parameter_classes() -> Dict[str, Type[ConfigurableParameter]]:
+    """Return all ConfigurableParameter classes, indexed by their (snake case) name."""
+    ret = {}
+    todo = [ConfigurableParameter]
+    while todo:
+        cls = todo.pop()
+        todo.extend(cls.__subclasses__())
+        ret[cls.name] = cls
+    return ret
+
+def parameter_from_str(cls: Type[ConfigurableParameter], val: str) -> ConfigurableParameter:
+    """Create a parameter instance from its string representation (e.g. a CSV cell)."""
+    if issubclass(cls, AlgorithmID):
+        return cls(int(val))
+    if issubclass(cls, (SdKey, AlgoConfig)):
+        return cls(h2b(val))
+    return cls(val)
+
+
+# per-process state of the personalize_csv() worker processes
+_worker_tmpl = None
+
+def _worker_init(template_der: bytes, samples: List[ConfigurableParameter]):
+    global _worker_tmpl
+    _worker_tmpl = CompiledTemplate(template_der, samples)
+
+def _worker_personalize(job: Tuple[str, List[ConfigurableParameter]]) -> str:
+    fname, params = job
+    with open(fname, 'wb') as f:
+        f.write(_worker_tmpl.personalize(params))
+    return fname
+
+def personalize_csv(template_der: bytes, csv_filename: str, output_dir: str,
+                    processes: Optional[int] = None, chunksize: int = 64) -> int:
+    """Generate one personalized profile for each row of a CSV file, using a pool of worker processes
+    that each compile the template once (see CompiledTemplate).
+
+    Args:
+        template_der: DER encoded template profile (UPP)
+        csv_filename: CSV file with one row per profile, the column names are the names of the
+                      ConfigurableParameter classes (e.g. iccid, imsi, pin1, k, opc)
+        output_dir: directory in which to store the profiles (named after the ICCID, if present)
+        processes: number of worker processes (default: number of CPUs)
+        chunksize: number of profiles handed to a worker process at once
+    Returns:
+        number of generated profiles
+    """
+    classes = parameter_classes()
+
+    def jobs(reader):
+        for n, row in enumerate(reader):
+            params = [parameter_from_str(classes[k], v) for k, v in row.items()]
+            name = row.get('iccid', '%06u' % n)
+            yield (os.path.join(output_dir, name + '.der'), params)
+
+    with open(csv_filename, 'r', newline='') as f:
+        reader = csv.DictReader(f)
+        reader.fieldnames = [x.lower() for x in reader.fieldnames]
+        for k in reader.fieldnames:
+            if k not in classes:
+                raise ValueError("CSV column '%s' is not a known parameter name" % k)
+        job_iter = jobs(reader)
+        # the first row serves as sample for the probe values during compilation
+        first = next(job_iter, None)
+        if not first:
+            return 0
+        count = 0
+        with multiprocessing.Pool(processes, initializer=_worker_init,
+                                  initargs=(template_der, first[1])) as pool:
+            for _fname in pool.imap_unordered(_worker_personalize, itertools.chain([first], job_iter),
+                                              chunksize):
+                count += 1
+        return count
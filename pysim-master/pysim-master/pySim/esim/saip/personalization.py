@@ -17,7 +17,7 @@
 
 import abc
 import io
-from typing import List, Tuple
+from typing import List, Tuple, Optional
 
 from osmocom.tlv import camel_to_snake
 from pySim.utils import enc_iccid, enc_imsi, h2b, rpad, sanitize_iccid
@@ -62,6 +62,12 @@ class ConfigurableParameter(abc.ABC, metaclass=ClassVarMeta):
     def apply(self, pes: ProfileElementSequence):
         pass
 
+    def value_bytes(self) -> Optional[List[bytes]]:
+        """Return the raw bytes which apply() stores in the profile for the (validated) value, as they
+        appear in the DER encoded profile.  This is used by the compiled template fast path (see
+        pySim.esim.saip.batch) for byte-offset patching; None means that it is not supported."""
+        return None
+
 class Iccid(ConfigurableParameter):
     """Configurable ICCID.  Expects the value to be a string of decimal digits.
     If the string of digits is only 18 digits long, a Luhn check digit will be added."""
@@ -81,6 +87,9 @@ class Iccid(ConfigurableParameter):
         # patch MF/EF.ICCID
         file_replace_content(pes.get_pe_for_type('mf').decoded['ef-iccid'], h2b(enc_iccid(self.value)))
 
+    def value_bytes(self) -> Optional[List[bytes]]:
+        return [h2b(rpad(self.value, 20)), h2b(enc_iccid(self.value))]
+
 class Imsi(ConfigurableParameter):
     """Configurable IMSI. Expects value to be a string of digits. Automatically sets the ACC to
     the last digit of the IMSI."""
@@ -104,6 +113,10 @@ class Imsi(ConfigurableParameter):
             file_replace_content(pe.decoded['ef-acc'], acc.to_bytes(2, 'big'))
         # TODO: DF.GSM_ACCESS if not linked?
 
+    def value_bytes(self) -> Optional[List[bytes]]:
+        acc = (1 << int(self.value[-1]))
+        return [h2b(enc_imsi(self.value)), acc.to_bytes(2, 'big')]
+
 
 class SdKey(ConfigurableParameter, metaclass=ClassVarMeta):
     """Configurable Security Domain (SD) Key.  Value is presented as bytes."""
@@ -144,6 +157,9 @@ class SdKey(ConfigurableParameter, metaclass=ClassVarMeta):
         for pe in pes.get_pes_for_type('securityDomain'):
             self._apply_sd(pe)
 
+    def value_bytes(self) -> Optional[List[bytes]]:
+        return [bytes(self.value)]
+
 class SdKeyScp80_01(SdKey, kvn=0x01, key_type=0x88, permitted_len=[16,24,32]): # AES key type
     pass
 class SdKeyScp80_01Kic(SdKeyScp80_01, key_id=0x01, key_usage_qual=0x18): # FIXME: ordering?
@@ -208,6 +224,10 @@ def obtain_first_pe_from_pelist(l: List[ProfileElement], wanted_type: str) -> Pr
     filtered = list(filter(lambda x: x.type == wanted_type, l))
     return filtered[0]
 
+def encode_pin(value: str) -> bytes:
+    """Encode a PIN/PUK as ASCII digits, padded with 0xFF to 8 bytes (as stored in the profile)."""
+    return h2b(rpad(''.join(['%02x' % (ord(x)) for x in value]), 16))
+
 class Puk(ConfigurableParameter, metaclass=ClassVarMeta):
     """Configurable PUK (Pin Unblock Code). String ASCII-encoded digits."""
     keyReference = None
@@ -221,15 +241,17 @@ class Puk(ConfigurableParameter, metaclass=ClassVarMeta):
             raise ValueError('PUK must only contain decimal digits')
 
     def apply(self, pes: ProfileElementSequence):
-        puk = ''.join(['%02x' % (ord(x)) for x in self.value])
-        padded_puk = rpad(puk, 16)
         mf_pes = pes.pes_by_naa['mf'][0]
         pukCodes = obtain_singleton_pe_from_pelist(mf_pes, 'pukCodes')
         for pukCode in pukCodes.decoded['pukCodes']:
             if pukCode['keyReference'] == self.keyReference:
-                pukCode['pukValue'] = h2b(padded_puk)
+                pukCode['pukValue'] = encode_pin(self.value)
                 return
         raise ValueError('cannot find pukCode')
+
+    def value_bytes(self) -> Optional[List[bytes]]:
+        return [encode_pin(self.value)]
+
 class Puk1(Puk, keyReference=0x01):
     pass
 class Puk2(Puk, keyReference=0x81):
@@ -248,17 +270,19 @@ class Pin(ConfigurableParameter, metaclass=ClassVarMeta):
         if not self.value.isdecimal():
             raise ValueError('PIN must only contain decimal digits')
     def apply(self, pes: ProfileElementSequence):
-        pin = ''.join(['%02x' % (ord(x)) for x in self.value])
-        padded_pin = rpad(pin, 16)
         mf_pes = pes.pes_by_naa['mf'][0]
         pinCodes = obtain_first_pe_from_pelist(mf_pes, 'pinCodes')
         if pinCodes.decoded['pinCodes'][0] != 'pinconfig':
             return
         for pinCode in pinCodes.decoded['pinCodes'][1]:
             if pinCode['keyReference'] == self.keyReference:
-                 pinCode['pinValue'] = h2b(padded_pin)
+                 pinCode['pinValue'] = encode_pin(self.value)
                  return
         raise ValueError('cannot find pinCode')
+
+    def value_bytes(self) -> Optional[List[bytes]]:
+        return [encode_pin(self.value)]
+
 class AppPin(ConfigurableParameter, metaclass=ClassVarMeta):
     """Configurable PIN (Personal Identification Number).  String of digits."""
     keyReference = None
@@ -272,14 +296,12 @@ class AppPin(ConfigurableParameter, metaclass=ClassVarMeta):
         if not self.value.isdecimal():
             raise ValueError('PIN must only contain decimal digits')
     def _apply_one(self, pe: ProfileElement):
-        pin = ''.join(['%02x' % (ord(x)) for x in self.value])
-        padded_pin = rpad(pin, 16)
         pinCodes = obtain_first_pe_from_pelist(pe, 'pinCodes')
         if pinCodes.decoded['pinCodes'][0] != 'pinconfig':
             return
         for pinCode in pinCodes.decoded['pinCodes'][1]:
             if pinCode['keyReference'] == self.keyReference:
-                pinCode['pinValue'] = h2b(padded_pin)
+                pinCode['pinValue'] = encode_pin(self.value)
                 return
         raise ValueError('cannot find pinCode')
     def apply(self, pes: ProfileElementSequence):
@@ -288,6 +310,10 @@ class AppPin(ConfigurableParameter, metaclass=ClassVarMeta):
                 continue
             for instance in pes.pes_by_naa[naa]:
                 self._apply_one(instance)
+
+    def value_bytes(self) -> Optional[List[bytes]]:
+        return [encode_pin(self.value)]
+
 class Pin1(Pin, keyReference=0x01):
     pass
 # PIN2 is special: telecom + usim + isim + csim
@@ -313,6 +339,9 @@ class AlgoConfig(ConfigurableParameter, metaclass=ClassVarMeta):
                 continue
             algoConfiguration[1][self.key] = self.value
 
+    def value_bytes(self) -> Optional[List[bytes]]:
+        return [bytes(self.value)]
+
 class K(AlgoConfig, key='key'):
     pass
 class Opc(AlgoConfig, key='opc'):
@@ -322,3 +351,6 @@ class AlgorithmID(AlgoConfig, key='algorithmID'):
         if self.input_value not in [1, 2, 3]:
             raise ValueError('Invalid algorithmID %s' % (self.input_value))
         self.value = self.input_value
+
+    def value_bytes(self) -> Optional[List[bytes]]:
+        return [bytes([self.value])]
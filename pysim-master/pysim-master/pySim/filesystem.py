@@ -30,6 +30,7 @@ import tempfile
 import json
 import abc
 import inspect
+import types
 
 import cmd2
 from cmd2 import CommandSet, with_default_category
@@ -57,6 +58,9 @@ class CardFile:
     """
     RESERVED_NAMES = ['..', '.', '/', 'MF']
     RESERVED_FIDS = ['3f00']
+    # generation of the filesystem tree(s); bumped on any modification (add_file, add_application_df)
+    # in order to invalidate all cached selectables.
+    _tree_generation = 0
 
     def __init__(self, fid: str = None, sfid: str = None, name: str = None, desc: str = None,
                  parent: Optional['CardDF'] = None, profile: Optional['CardProfile'] = None,
@@ -85,6 +89,8 @@ class CardFile:
         self.profile = profile
         self.service = service
         self.shell_commands = []  # type: List[CommandSet]
+        self._sel_cache = {}
+        self._sel_cache_generation = -1
 
         # Note: the basic properties (fid, name, ect.) are verified when
         # the file is attached to a parent file. See method add_file() in
@@ -209,9 +215,28 @@ class CardFile:
         sels.update(self.parent._get_parent_selectables(None, flags))
         return sels
 
-    def get_selectables(self, flags=[]) -> Dict[str, 'CardFile']:
+    @staticmethod
+    def _invalidate_selectables():
+        """Invalidate the cached selectables of all files (the filesystem tree has been modified)."""
+        CardFile._tree_generation += 1
+
+    def _cached_selectables(self, key, compute):
+        """Return the cached result for 'key', call 'compute' to populate the cache if required."""
+        if self._sel_cache_generation != CardFile._tree_generation:
+            self._sel_cache = {}
+            self._sel_cache_generation = CardFile._tree_generation
+        ret = self._sel_cache.get(key)
+        if ret is None:
+            ret = compute()
+            self._sel_cache[key] = ret
+        return ret
+
+    def get_selectables(self, flags=[]) -> types.MappingProxyType:
         """Return a dict of {'identifier': File} that is selectable from the current file.
 
+        The result is computed once per flag set and cached until the filesystem tree is modified; it is
+        returned as a read-only mapping.
+
         Args:
             flags : Specify which selectables to return 'FIDS' and/or 'NAMES';
                     If not specified, all selectables will be returned.
@@ -219,6 +244,13 @@ class CardFile:
             dict containing all selectable items. Key is identifier (string), value
             a reference to a CardFile (or derived class) instance.
         """
+        # the flags may be passed as any iterable, but _get_selectables expects a list
+        flags = list(flags)
+        return self._cached_selectables(frozenset(flags),
+                                        lambda: types.MappingProxyType(self._get_selectables(flags)))
+
+    def _get_selectables(self, flags=[]) -> Dict[str, 'CardFile']:
+        """Compute the selectables (see get_selectables); extended by derived classes."""
         sels = {}
         # we can always select ourself
         if flags == [] or 'SELF' in flags:
@@ -243,10 +275,8 @@ class CardFile:
         Returns:
             list containing all selectable names.
         """
-        sels = self.get_selectables(flags)
-        sel_keys = list(sels.keys())
-        sel_keys.sort()
-        return sel_keys
+        return list(self._cached_selectables(('NAMES', frozenset(flags)),
+                                             lambda: sorted(self.get_selectables(flags).keys())))
 
     def decode_select_response(self, data_hex: str):
         """Decode the response to a SELECT command.
@@ -383,6 +413,7 @@ class CardDF(CardFile):
                 "File with given name %s already exists in %s" % (child.name, self))
         self.children[child.fid] = child
         child.parent = self
+        self._invalidate_selectables()
         # update the service -> file relationship table
         self._add_file_services(child)
         if isinstance(child, CardDF):
@@ -404,18 +435,9 @@ class CardDF(CardFile):
         for child in children:
             self.add_file(child, ignore_existing)
 
-    def get_selectables(self, flags=[]) -> dict:
-        """Return a dict of {'identifier': File} that is selectable from the current DF.
-
-        Args:
-            flags : Specify which selectables to return 'FIDS' and/or 'NAMES';
-                    If not specified, all selectables will be returned.
-        Returns:
-            dict containing all selectable items. Key is identifier (string), value
-            a reference to a CardFile (or derived class) instance.
-        """
+    def _get_selectables(self, flags=[]) -> dict:
         # global selectables + our children
-        sels = super().get_selectables(flags)
+        sels = super()._get_selectables(flags)
         if flags == [] or 'FIDS' in flags:
             sels.update({x.fid: x for x in self.children.values() if x.fid})
         if flags == [] or 'FNAMES' in flags:
@@ -471,27 +493,24 @@ class CardMF(CardDF):
             raise ValueError("AID %s already exists" % (app.aid))
         self.applications[app.aid] = app
         app.parent = self
+        self._invalidate_selectables()
 
     def get_app_names(self):
         """Get list of completions (AID names)"""
         return list(self.applications.values())
 
-    def get_selectables(self, flags=[]) -> dict:
-        """Return a dict of {'identifier': File} that is selectable from the current DF.
-
-        Args:
-            flags : Specify which selectables to return 'FIDS' and/or 'NAMES';
-                    If not specified, all selectables will be returned.
-        Returns:
-            dict containing all selectable items. Key is identifier (string), value
-            a reference to a CardFile (or derived class) instance.
-        """
-        sels = super().get_selectables(flags)
+    def _get_selectables(self, flags=[]) -> dict:
+        sels = super()._get_selectables(flags)
         sels.update(self.get_app_selectables(flags))
         return sels
 
-    def get_app_selectables(self, flags=[]) -> dict:
-        """Get applications by AID + name"""
+    def get_app_selectables(self, flags=[]) -> types.MappingProxyType:
+        """Get applications by AID + name (cached and read-only like get_selectables)"""
+        flags = list(flags)
+        return self._cached_selectables(('APPS', frozenset(flags)),
+                                        lambda: types.MappingProxyType(self._get_app_selectables(flags)))
+
+    def _get_app_selectables(self, flags=[]) -> dict:
         sels = {}
         if flags == [] or 'AIDS' in flags:
             sels.update({x.aid: x for x in self.applications.values()})
@@ -562,18 +581,9 @@ class CardEF(CardFile):
     def __str__(self):
         return "EF(%s)" % (super().__str__())
 
-    def get_selectables(self, flags=[]) -> dict:
-        """Return a dict of {'identifier': File} that is selectable from the current DF.
-
-        Args:
-            flags : Specify which selectables to return 'FIDS' and/or 'NAMES';
-                    If not specified, all selectables will be returned.
-        Returns:
-            dict containing all selectable items. Key is identifier (string), value
-            a reference to a CardFile (or derived class) instance.
-        """
+    def _get_selectables(self, flags=[]) -> dict:
         # global selectable names + those of the parent DF
-        sels = super().get_selectables(flags)
+        sels = super()._get_selectables(flags)
         if flags == [] or 'FIDS' in flags:
             sels.update({x.fid: x for x in self.parent.children.values() if x.fid and x != self})
         if flags == [] or 'FNAMES' in flags:
@@ -820,21 +830,22 @@ class TransparentEF(CardEF):
             "%s encoder not yet implemented. Patches welcome." % self)
 
     @staticmethod
-    def export(as_json: bool, lchan):
+    def export(as_json: bool, lchan, ef: Optional['TransparentEF'] = None):
         """
         Export the file contents of a TransparentEF. This method returns a shell command string (See also ShellCommand
-        definition in this class) that can be used to write the file contents back.
+        definition in this class) that can be used to write the file contents back.  If 'ef' is given, that EF is
+        exported instead of the currently selected file (see RuntimeLchan.read_binary).
         """
 
-        if lchan.selected_file_structure() != 'transparent':
+        if ef is None and lchan.selected_file_structure() != 'transparent':
             raise ValueError("selected file has structure type '%s', expecting a file with structure 'transparent'" %
                              lchan.selected_file_structure())
         export_str = ""
         if as_json:
-            result = lchan.read_binary_dec()
+            result = lchan.read_binary_dec(ef=ef)
             export_str += ("update_binary_decoded '%s'\n" % json.dumps(result[0], cls=JsonEncoder))
         else:
-            result = lchan.read_binary()
+            result = lchan.read_binary(ef=ef)
             export_str += ("update_binary %s\n" % str(result[0]))
         return export_str.strip()
 
@@ -894,9 +905,8 @@ class LinFixedEF(CardEF):
         @cmd2.with_argparser(read_recs_parser)
         def do_read_records(self, _opts):
             """Read all records from a record-oriented EF"""
-            num_of_rec = self._cmd.lchan.selected_file_num_of_rec()
-            for recnr in range(1, 1 + num_of_rec):
-                (data, _sw) = self._cmd.lchan.read_record(recnr)
+            (records, _sw) = self._cmd.lchan.read_records()
+            for recnr, data in records.items():
                 if len(data) > 0:
                     recstr = str(data)
                 else:
@@ -910,12 +920,9 @@ class LinFixedEF(CardEF):
         @cmd2.with_argparser(read_recs_dec_parser)
         def do_read_records_decoded(self, opts):
             """Read + decode all records from a record-oriented EF"""
-            num_of_rec = self._cmd.lchan.selected_file_num_of_rec()
+            (records, _sw) = self._cmd.lchan.read_records_dec()
             # collect all results in list so they are rendered as JSON list when printing
-            data_list = []
-            for recnr in range(1, 1 + num_of_rec):
-                (data, _sw) = self._cmd.lchan.read_record_dec(recnr)
-                data_list.append(data)
+            data_list = list(records.values())
             self._cmd.poutput_json(data_list, opts.oneline)
 
         upd_rec_parser = argparse.ArgumentParser()
@@ -1130,29 +1137,31 @@ class LinFixedEF(CardEF):
             "%s encoder not yet implemented. Patches welcome." % self)
 
     @staticmethod
-    def export(as_json: bool, lchan):
+    def export(as_json: bool, lchan, ef: Optional['LinFixedEF'] = None):
         """
         Export the file contents of a LinFixedEF (or a CyclicEF). This method returns a shell command string (See also
-        ShellCommand definition in this class) that can be used to write the file contents back.
+        ShellCommand definition in this class) that can be used to write the file contents back.  If 'ef' is given,
+        that EF is exported instead of the currently selected file (see RuntimeLchan.read_record).
         """
 
         # A CyclicEF is a subclass of LinFixedEF.
-        if lchan.selected_file_structure() != 'linear_fixed' and lchan.selected_file_structure() != 'cyclic':
+        if ef is None and lchan.selected_file_structure() not in ['linear_fixed', 'cyclic']:
             raise ValueError("selected file has structure type '%s', expecting a file with structure 'linear_fixed' or 'cyclic'" %
                              lchan.selected_file_structure())
 
         export_str = ""
 
-        # Use number of records specified in select response
-        num_of_rec = lchan.selected_file_num_of_rec()
+        # Use number of records specified in select response (not available when reading 'ef' by its SFI)
+        num_of_rec = lchan.selected_file_num_of_rec() if ef is None else None
         if num_of_rec:
-            for r in range(1, num_of_rec + 1):
-                if as_json:
-                    result = lchan.read_record_dec(r)
-                    export_str += ("update_record_decoded %d '%s'\n" % (r, json.dumps(result[0], cls=JsonEncoder)))
-                else:
-                    result = lchan.read_record(r)
-                    export_str += ("update_record %d %s\n" % (r, str(result[0])))
+            if as_json:
+                (records, _sw) = lchan.read_records_dec(range(1, num_of_rec + 1))
+                for r, data in records.items():
+                    export_str += ("update_record_decoded %d '%s'\n" % (r, json.dumps(data, cls=JsonEncoder)))
+            else:
+                (records, _sw) = lchan.read_records(range(1, num_of_rec + 1))
+                for r, data in records.items():
+                    export_str += ("update_record %d %s\n" % (r, str(data)))
 
         # In case the select response does not return the number of records, read until we hit the first record that
         # cannot be read.
@@ -1161,17 +1170,16 @@ class LinFixedEF(CardEF):
             while True:
                 try:
                     if as_json:
-                        result = lchan.read_record_dec(r)
+                        result = lchan.read_record_dec(r, ef=ef)
                         export_str += ("update_record_decoded %d '%s'\n" % (r, json.dumps(result[0], cls=JsonEncoder)))
                     else:
-                        result = lchan.read_record(r)
+                        result = lchan.read_record(r, ef=ef)
                         export_str += ("update_record %d %s\n" % (r, str(result[0])))
                 except SwMatchError as e:
-                    # We are past the last valid record - stop
-                    if e.sw_actual == "9402":
+                    # We are past the last valid record (9402: TS 51.011, 6a83: ISO/IEC 7816-4) - stop
+                    if e.sw_actual in ["9402", "6a83"]:
                         break
-                # Some other problem occurred
-                else:
+                    # Some other problem occurred
                     raise e
                 r = r + 1
 
@@ -27,7 +27,8 @@ from osmocom.utils import *
 from osmocom.tlv import *
 from osmocom.construct import *
 from pySim.utils import ResTuple
-from pySim.card_key_provider import card_key_provider_get_field
+from pySim.commands import build_apdu
+from pySim.card_key_provider import card_key_provider_get
 from pySim.global_platform.scp import SCP02, SCP03
 from pySim.filesystem import *
 from pySim.profile import CardProfile
@@ -579,8 +580,8 @@ class ADF_SD(CardADF):
                 p1b = build_construct(ADF_SD.StoreData,
                                       {'last_block': len(remainder) == 0, 'encryption': encryption,
                                        'structure': structure, 'response': response_permitted})
-                hdr = "80E2%02x%02x%02x" % (p1b[0], block_nr, len(chunk))
-                data, _sw = self._cmd.lchan.scc.send_apdu_checksw(hdr + b2h(chunk))
+                pdu = build_apdu(bytes([0x80, 0xe2, p1b[0], block_nr]), chunk)
+                data, _sw = self._cmd.lchan.scc.send_apdu_checksw(b2h(pdu))
                 block_nr += 1
                 response += data
             return data
@@ -815,9 +816,12 @@ class ADF_SD(CardADF):
                 suffix = opts.key_provider_suffix
                 id_field_name = self._cmd.lchan.selected_adf.scp_key_identity
                 identity = self._cmd.rs.identity.get(id_field_name)
-                opts.key_enc = card_key_provider_get_field('SCP02_ENC_' + suffix, key=id_field_name, value=identity)
-                opts.key_mac = card_key_provider_get_field('SCP02_MAC_' + suffix, key=id_field_name, value=identity)
-                opts.key_dek = card_key_provider_get_field('SCP02_DEK_' + suffix, key=id_field_name, value=identity)
+                # obtain all three keys with a single look-up
+                keys = card_key_provider_get(['SCP02_%s_%s' % (k, suffix) for k in ['ENC', 'MAC', 'DEK']],
+                                             key=id_field_name, value=identity)
+                opts.key_enc = keys.get('SCP02_ENC_' + suffix)
+                opts.key_mac = keys.get('SCP02_MAC_' + suffix)
+                opts.key_dek = keys.get('SCP02_DEK_' + suffix)
             else:
                 if not opts.key_enc or not opts.key_mac:
                     self._cmd.poutput("Cannot establish SCP02 without at least ENC and MAC keys given!")
@@ -842,9 +846,12 @@ class ADF_SD(CardADF):
                 suffix = opts.key_provider_suffix
                 id_field_name = self._cmd.lchan.selected_adf.scp_key_identity
                 identity = self._cmd.rs.identity.get(id_field_name)
-                opts.key_enc = card_key_provider_get_field('SCP03_ENC_' + suffix, key=id_field_name, value=identity)
-                opts.key_mac = card_key_provider_get_field('SCP03_MAC_' + suffix, key=id_field_name, value=identity)
-                opts.key_dek = card_key_provider_get_field('SCP03_DEK_' + suffix, key=id_field_name, value=identity)
+                # obtain all three keys with a single look-up
+                keys = card_key_provider_get(['SCP03_%s_%s' % (k, suffix) for k in ['ENC', 'MAC', 'DEK']],
+                                             key=id_field_name, value=identity)
+                opts.key_enc = keys.get('SCP03_ENC_' + suffix)
+                opts.key_mac = keys.get('SCP03_MAC_' + suffix)
+                opts.key_dek = keys.get('SCP03_DEK_' + suffix)
             else:
                 if not opts.key_enc or not opts.key_mac:
                     self._cmd.poutput("Cannot establish SCP03 without at least ENC and MAC keys given!")
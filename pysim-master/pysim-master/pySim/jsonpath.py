@@ -5,8 +5,6 @@ adding JSONpath allows us to conveniently modify individual sub-fields
 of a file or record in its JSON representation.
 """
 
-import jsonpath_ng
-
 # (C) 2021 by Harald Welte <laforge@osmocom.org>
 #
 # This program is free software: you can redistribute it and/or modify
@@ -30,6 +28,7 @@ def js_path_find(js_dict, js_path):
         js_path : JSONpath string
     Returns: Result of the JSONpath expression
     """
+    import jsonpath_ng # pylint: disable=import-outside-toplevel
     jsonpath_expr = jsonpath_ng.parse(js_path)
     return jsonpath_expr.find(js_dict)
 
@@ -41,6 +40,7 @@ def js_path_modify(js_dict, js_path, new_val):
         js_path : JSONpath string
         new_val : New value for field in js_dict at js_path
     """
+    import jsonpath_ng # pylint: disable=import-outside-toplevel
     jsonpath_expr = jsonpath_ng.parse(js_path)
     jsonpath_expr.find(js_dict)
     jsonpath_expr.update(js_dict, new_val)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+""" pySim: on-disk cache of the detected card type, profile, add-ons and applications
+"""
+
+# (C) 2024 by sysmocom - s.f.m.c. GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import tempfile
+from typing import Optional, List, Dict
+
+from osmocom.utils import Hexstr
+
+from pySim.utils import all_subclasses, cache_dir
+
+# bump whenever the format of the entries changes, entries of other versions are ignored
+CACHE_VERSION = 1
+
+
+def default_cache_path() -> str:
+    """Return the default location of the cache file (below $XDG_CACHE_HOME or ~/.cache)."""
+    return os.path.join(cache_dir(), 'card_profiles.json')
+
+
+def class_name(cls: type) -> str:
+    """Return the fully qualified name of a class, as used in the cache entries."""
+    return '%s.%s' % (cls.__module__, cls.__qualname__)
+
+
+def find_class(base: type, name: str) -> Optional[type]:
+    """Find a (sub-)class of 'base' by its fully qualified name (see class_name)."""
+    for cls in [base] + list(all_subclasses(base)):
+        if class_name(cls) == name:
+            return cls
+    return None
+
+
+class CardProfileCache:
+    """On-disk cache of the results of the card detection performed at startup (card type, card profile,
+    add-ons and applications present on the card, ...), indexed by ATR and ICCID.
+
+    Determining those requires dozens of APDUs (including several card resets), while a card whose ATR
+    and ICCID are found in the cache can be set up after reading just its EF.ICCID.  The cache is a plain
+    JSON file, which is re-written completely on each update."""
+
+    def __init__(self, filename: Optional[str] = None):
+        """
+        Args:
+            filename : path of the cache file (default: see default_cache_path); created if it does not exist
+        """
+        self.filename = filename or default_cache_path()
+        self.entries = {}  # type: Dict[str, dict]
+        self.load()
+
+    def __str__(self) -> str:
+        return self.filename
+
+    @staticmethod
+    def _key(atr: Hexstr, iccid: str) -> str:
+        return '%s:%s' % (atr.lower(), iccid)
+
+    def load(self):
+        """(Re-)load the cache file.  A missing or unreadable cache file results in an empty cache."""
+        self.entries = {}
+        try:
+            with open(self.filename, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get('version') == CACHE_VERSION:
+            self.entries = data.get('cards', {})
+
+    def save(self):
+        """Write the cache file (atomically, so concurrent readers never see a partial file)."""
+        dirname = os.path.dirname(self.filename) or '.'
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.card_profiles')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'version': CACHE_VERSION, 'cards': self.entries}, f, indent=1, sort_keys=True)
+            os.replace(tmpname, self.filename)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+
+    def get(self, atr: Hexstr, iccid: str) -> Optional[dict]:
+        """Return the cache entry for the card with given ATR and ICCID (or None)."""
+        return self.entries.get(self._key(atr, iccid))
+
+    def get_by_atr(self, atr: Hexstr) -> List[dict]:
+        """Return all cache entries of cards with the given ATR."""
+        prefix = atr.lower() + ':'
+        return [e for k, e in self.entries.items() if k.startswith(prefix)]
+
+    def put(self, atr: Hexstr, iccid: str, entry: dict):
+        """Add or replace the cache entry for the card with given ATR and ICCID and save the cache.
+
+        Args:
+            atr : ATR of the card (hex string)
+            iccid : ICCID of the card (decoded, as read from EF.ICCID)
+            entry : dict describing the card, see pySim.app.init_card
+        """
+        self.entries[self._key(atr, iccid)] = entry
+        self.save()
+
+    def remove(self, atr: Hexstr, iccid: str):
+        """Remove the cache entry for the card with given ATR and ICCID (if any) and save the cache."""
+        if self.entries.pop(self._key(atr, iccid), None) is not None:
+            self.save()
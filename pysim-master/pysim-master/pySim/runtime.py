@@ -17,8 +17,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from typing import Optional, Tuple
-from osmocom.utils import h2b, i2h, is_hex, Hexstr
+from typing import Optional, Tuple, Dict, Iterable, List
+from osmocom.utils import h2b, b2h, i2h, is_hex, Hexstr
 from osmocom.tlv import bertlv_parse_one
 
 from pySim.exceptions import *
@@ -38,11 +38,17 @@ def lchan_nr_from_cla(cla: int) -> int:
 class RuntimeState:
     """Represent the runtime state of a session with a card."""
 
-    def __init__(self, card: 'CardBase', profile: 'CardProfile'):
+    def __init__(self, card: 'CardBase', profile: 'CardProfile',
+                 addons: Optional[List['CardProfileAddon']] = None,
+                 applications: Optional[List['CardApplication']] = None):
         """
         Args:
             card : pysim.cards.Card instance
             profile : CardProfile instance
+            addons : Add-ons known to be present on the card (e.g. from a CardProfileCache); if not
+                     specified, the add-ons of the profile are probed
+            applications : Applications of the profile known to be present on the card; if not
+                           specified, they are determined from EF.DIR and by probing
         """
         self.mf = CardMF(profile=profile)
         self.card = card
@@ -59,24 +65,34 @@ class RuntimeState:
         self.card.set_apdu_parameter(
             cla=self.profile.cla, sel_ctrl=self.profile.sel_ctrl)
 
-        for addon_cls in self.profile.addons:
-            addon = addon_cls()
-            if addon.probe(self.card):
-                print("Detected %s Add-on \"%s\"" % (self.profile, addon))
-                for f in addon.files_in_mf:
-                    self.mf.add_file(f)
+        if addons is None:
+            addons = []
+            for addon_cls in self.profile.addons:
+                addon = addon_cls()
+                if addon.probe(self.card):
+                    addons.append(addon)
+        # the add-ons and applications present on the card (see also CardProfileCache)
+        self.addons = addons
+        for addon in addons:
+            print("Detected %s Add-on \"%s\"" % (self.profile, addon))
+            for f in addon.files_in_mf:
+                self.mf.add_file(f)
 
         # go back to MF before the next steps (addon probing might have changed DF)
         self.lchan[0].select('MF')
 
         # add application ADFs + MF-files from profile
-        apps = self._match_applications()
-        for a in apps:
+        if applications is None:
+            applications = self._match_applications()
+        self.applications = applications
+        for a in applications:
             if a.adf:
                 self.mf.add_application_df(a.adf)
         for f in self.profile.files_in_mf:
             self.mf.add_file(f)
         self.conserve_write = True
+        # read EFs in the currently selected DF/ADF by their SFI, see RuntimeLchan.sfi_of()
+        self.use_sfi = False
 
         # make sure that when the runtime state is created, the card is also
         # in a defined state.
@@ -140,6 +156,8 @@ class RuntimeState:
                 continue
             del self.lchan[lchan_nr]
         atr = i2h(self.card.reset())
+        # use extended length APDUs if the card indicates support in EF.ATR (and not already in the ATR)
+        self.lchan[0].scc.probe_ext_length()
         if cmd_app:
             cmd_app.lchan = self.lchan[0]
         # select MF to reset internal state and to verify card really works
@@ -269,12 +287,7 @@ class RuntimeLchan:
 
         for p in pathlist:
             # Look for the next file in the path list
-            selectables = file.get_selectables()
-            file = None
-            for selectable in selectables:
-                if selectable == p:
-                    file = selectables[selectable]
-                    break
+            file = file.get_selectables().get(p)
 
             # When we hit none, then the given path must be invalid
             if file is None:
@@ -478,31 +491,63 @@ class RuntimeLchan:
         data, sw = self.scc.activate_file(f.fid)
         return data, sw
 
-    def read_binary(self, length: int = None, offset: int = 0):
+    def sfi_of(self, ef: CardEF) -> Optional[int]:
+        """Determine whether the given EF can be read without selecting it, which is the case when the EF
+        has a short file identifier, is located in the currently selected DF/ADF and the use of SFIs is
+        enabled (RuntimeState.use_sfi).  Note that the EF read by its SFI becomes the current EF of the card,
+        while the DF/ADF remains the selected file of this lchan.
+
+        Args:
+            ef : CardEF [or derived class] instance
+        Returns:
+            short file identifier or None in case the EF has to be selected
+        """
+        if not self.rs.use_sfi or ef.sfid is None or ef.parent != self.selected_file:
+            return None
+        return int(ef.sfid)
+
+    def _read_target(self, ef: Optional[CardEF], ef_cls: type, ef_type: str,
+                     sfi_usable: bool = True) -> Tuple[CardEF, Optional[int]]:
+        """Determine the EF to be read (the currently selected EF by default) and the SFI to read it by.
+        In case the EF cannot be read by its SFI, it is selected first."""
+        f = ef or self.selected_file
+        if not isinstance(f, ef_cls):
+            raise TypeError("Only works with %s, but %s is %s" % (ef_type, f, f.__class__.__mro__))
+        sfi = None
+        if f != self.selected_file:
+            if sfi_usable:
+                sfi = self.sfi_of(f)
+            if sfi is None:
+                self.select_file(f)
+        return f, sfi
+
+    def read_binary(self, length: int = None, offset: int = 0, ef: Optional[TransparentEF] = None):
         """Read [part of] a transparent EF binary data.
 
         Args:
             length : Amount of data to read (None: as much as possible)
             offset : Offset into the file from which to read 'length' bytes
+            ef : EF to read instead of the currently selected EF; read by its SFI if possible (see sfi_of),
+                 selected otherwise
         Returns:
             binary data read from the file
         """
-        if not isinstance(self.selected_file, TransparentEF):
-            raise TypeError("Only works with TransparentEF, but %s is %s" % (self.selected_file,
-                                                                             self.selected_file.__class__.__mro__))
-        return self.scc.read_binary(self.selected_file.fid, length, offset)
+        (f, sfi) = self._read_target(ef, TransparentEF, 'TransparentEF', offset <= 0xff)
+        if sfi is not None:
+            (data, sw) = self.scc.read_binary_sfi_bin(sfi, length, offset)
+            return b2h(data), sw
+        return self.scc.read_binary(f.fid, length, offset)
 
-    def read_binary_dec(self) -> Tuple[dict, str]:
+    def read_binary_dec(self, ef: Optional[TransparentEF] = None) -> Tuple[dict, str]:
         """Read [part of] a transparent EF binary data and decode it.
 
         Args:
-            length : Amount of data to read (None: as much as possible)
-            offset : Offset into the file from which to read 'length' bytes
+            ef : EF to read instead of the currently selected EF (see read_binary)
         Returns:
             abstract decode data read from the file
         """
-        (data, sw) = self.read_binary()
-        dec_data = self.selected_file.decode_hex(data)
+        (data, sw) = self.read_binary(ef=ef)
+        dec_data = (ef or self.selected_file).decode_hex(data)
         return (dec_data, sw)
 
     def update_binary(self, data_hex: str, offset: int = 0):
@@ -527,30 +572,67 @@ class RuntimeLchan:
         data_hex = self.selected_file.encode_hex(data, self.selected_file_size())
         return self.update_binary(data_hex)
 
-    def read_record(self, rec_nr: int = 0):
+    def read_record(self, rec_nr: int = 0, ef: Optional[LinFixedEF] = None):
         """Read a record as binary data.
 
         Args:
             rec_nr : Record number to read
+            ef : EF to read instead of the currently selected EF; read by its SFI if possible (see sfi_of),
+                 selected otherwise
         Returns:
             hex string of binary data contained in record
         """
-        if not isinstance(self.selected_file, LinFixedEF):
-            raise TypeError("Only works with Linear Fixed EF, but %s is %s" % (self.selected_file,
-                                                                               self.selected_file.__class__.__mro__))
+        (f, sfi) = self._read_target(ef, LinFixedEF, 'Linear Fixed EF')
+        if sfi is not None:
+            return self.scc.read_record_sfi(sfi, rec_nr)
         # returns a string of hex nibbles
-        return self.scc.read_record(self.selected_file.fid, rec_nr)
+        return self.scc.read_record(f.fid, rec_nr)
 
-    def read_record_dec(self, rec_nr: int = 0) -> Tuple[dict, str]:
+    def read_record_dec(self, rec_nr: int = 0, ef: Optional[LinFixedEF] = None) -> Tuple[dict, str]:
         """Read a record and decode it to abstract data.
 
         Args:
             rec_nr : Record number to read
+            ef : EF to read instead of the currently selected EF (see read_record)
         Returns:
             abstract data contained in record
         """
-        (data, sw) = self.read_record(rec_nr)
-        return (self.selected_file.decode_record_hex(data, rec_nr), sw)
+        (data, sw) = self.read_record(rec_nr, ef)
+        return ((ef or self.selected_file).decode_record_hex(data, rec_nr), sw)
+
+    def read_records(self, rec_range: Optional[Iterable[int]] = None,
+                     ef: Optional[LinFixedEF] = None) -> Tuple[Dict[int, str], str]:
+        """Read multiple records as binary data.
+
+        Args:
+            rec_range : Record numbers to read (None: all records)
+            ef : EF to read instead of the currently selected EF; read by its SFI if possible (see sfi_of),
+                 selected otherwise.  Reading all records requires the EF to be selected.
+        Returns:
+            dict of hex strings of binary data contained in records, indexed by record number
+        """
+        (f, sfi) = self._read_target(ef, LinFixedEF, 'Linear Fixed EF', rec_range is not None)
+        if sfi is not None:
+            return self.scc.read_records_sfi(sfi, rec_range)
+        if rec_range is None and self.selected_file_fcp:
+            num_of_rec = self.selected_file_num_of_rec()
+            if num_of_rec:
+                rec_range = range(1, 1 + num_of_rec)
+        return self.scc.read_records(f.fid, rec_range)
+
+    def read_records_dec(self, rec_range: Optional[Iterable[int]] = None,
+                         ef: Optional[LinFixedEF] = None) -> Tuple[Dict[int, dict], str]:
+        """Read multiple records and decode them to abstract data.
+
+        Args:
+            rec_range : Record numbers to read (None: all records)
+            ef : EF to read instead of the currently selected EF (see read_records)
+        Returns:
+            dict of abstract data contained in records, indexed by record number
+        """
+        (records, sw) = self.read_records(rec_range, ef)
+        f = ef or self.selected_file
+        return ({r: f.decode_record_hex(data, r) for r, data in records.items()}, sw)
 
     def update_record(self, rec_nr: int, data_hex: str):
         """Update a record with given binary data
@@ -6,12 +6,12 @@
 import os
 import abc
 import argparse
-from typing import Optional, Tuple
+from typing import Optional, Tuple, List
 from construct import Construct
 from osmocom.utils import b2h, h2b, i2h, Hexstr
 
 from pySim.exceptions import *
-from pySim.utils import SwHexstr, SwMatchstr, ResTuple, sw_match
+from pySim.utils import SwHexstr, SwMatchstr, ResTuple, ResTupleBin, sw_match, atr_ext_length_info
 from pySim.cat import ProactiveCommand, CommandDetails, DeviceIdentities, Result
 
 #
@@ -33,6 +33,12 @@ from pySim.cat import ProactiveCommand, CommandDetails, DeviceIdentities, Result
 #
 
 
+# Instructions which do not change the selection state of the card (when executed successfully), see
+# also SimCardCommands.select_path().  Anything else (SELECT, MANAGE CHANNEL, CREATE/DELETE FILE,
+# FETCH/ENVELOPE which may trigger a REFRESH, ...) invalidates the selection cache of all lchans.
+SELECTION_NEUTRAL_INS = [0xb0, 0xb1, 0xb2, 0xb3, 0xd6, 0xd7, 0xdc, 0xdd, 0xa2, 0x32, 0xc0, 0xf2, 0xcb, 0xdb,
+                         0xca, 0x20, 0x24, 0x26, 0x28, 0x2c, 0x88, 0x89, 0x78, 0x10]
+
 class ApduTracer:
     def trace_command(self, cmd):
         pass
@@ -85,19 +91,57 @@ class ProactiveHandler(abc.ABC):
 class LinkBase(abc.ABC):
     """Base class for link/transport to card."""
 
+    # Upper limit for the data length of extended length APDUs.  The card may support up to 64k, but
+    # the buffers of many readers (e.g. dwMaxCCIDMessageLength of CCID readers) are much smaller.
+    EXT_LEN_MAX = 4096
+
     def __init__(self, sw_interpreter=None, apdu_tracer: Optional[ApduTracer]=None,
                  proactive_handler: Optional[ProactiveHandler]=None):
+        # like the abc.abstractmethod check, but for a pair of methods of which one must be implemented
+        if type(self)._send_apdu_raw_bin is LinkBase._send_apdu_raw_bin and not hasattr(self, '_send_apdu_raw'):
+            raise TypeError("Can't instantiate %s: it implements neither _send_apdu_raw nor _send_apdu_raw_bin"
+                            % type(self).__name__)
         self.sw_interpreter = sw_interpreter
         self.apdu_tracer = apdu_tracer
         self.proactive_handler = proactive_handler
+        # currently selected path (and related select responses) per lchan, maintained by
+        # SimCardCommands.  The card itself is the only source of truth, so we drop the cache
+        # whenever something may have changed the selection state of the card.
+        self.sel_cache = {}
+        # maximum number of command/response data bytes in an extended length APDU, or None if only
+        # short APDUs can be used.  See set_ext_length().
+        self.ext_len = None
 
     @abc.abstractmethod
     def __str__(self) -> str:
         """Implementation specific method for printing an information to identify the device."""
 
-    @abc.abstractmethod
-    def _send_apdu_raw(self, pdu: Hexstr) -> ResTuple:
-        """Implementation specific method for sending the PDU."""
+    # Implementation specific method for sending the PDU (hex string variant):
+    #   def _send_apdu_raw(self, pdu: Hexstr) -> ResTuple
+    # A transport implements either this method or _send_apdu_raw_bin(), which is checked in __init__().
+
+    def _send_apdu_raw_bin(self, pdu: bytes) -> ResTupleBin:
+        """Implementation specific method for sending the PDU (binary variant).  A transport
+        implements either this method or _send_apdu_raw()."""
+        (data, sw) = self._send_apdu_raw(b2h(pdu)) # pylint: disable=no-member
+        return h2b(data) if data else b'', sw
+
+    def supports_ext_length(self) -> bool:
+        """Whether the link (currently) is able to transport extended length APDUs.  This is usually
+        only the case with the T=1 protocol."""
+        return False
+
+    def set_ext_length(self, ext_len: Optional[Tuple[int, int]]):
+        """Enable the use of extended length APDUs, as far as supported by the link.
+
+        Args:
+           ext_len : maximum number of command and response data bytes supported by the card
+                     (see pySim.utils.atr_ext_length_info), None to disable extended length APDUs
+        """
+        if ext_len and self.supports_ext_length():
+            self.ext_len = (min(ext_len[0], self.EXT_LEN_MAX), min(ext_len[1], self.EXT_LEN_MAX))
+        else:
+            self.ext_len = None
 
     def set_sw_interpreter(self, interp):
         """Set an (optional) status word interpreter."""
@@ -132,27 +176,45 @@ class LinkBase(abc.ABC):
         """
         if self.apdu_tracer:
             self.apdu_tracer.trace_reset()
+        self.sel_cache.clear()
+        self.ext_len = None
         return self._reset_card()
 
-    def send_apdu_raw(self, pdu: Hexstr) -> ResTuple:
+    def _update_sel_cache(self, pdu: bytes, sw: Optional[SwHexstr]):
+        """Invalidate the selection cache in case the given command/response pair may have changed
+        the selection state of the card."""
+        if not self.sel_cache:
+            return
+        if pdu[1] in SELECTION_NEUTRAL_INS and sw and sw[0:2].lower() in ['90', '91', '61', '9f', '6c']:
+            # READ/UPDATE BINARY/RECORD addressing an EF by its SFI make that EF the current EF
+            if not ((pdu[1] in [0xb0, 0xd6] and pdu[2] & 0x80) or (pdu[1] in [0xb2, 0xdc] and pdu[3] & 0xf8)):
+                return
+        self.sel_cache.clear()
+
+    def send_apdu_raw_bin(self, pdu: bytes) -> ResTupleBin:
         """Sends an APDU with minimal processing
 
         Args:
-           pdu : string of hexadecimal characters (ex. "A0A40000023F00")
+           pdu : binary APDU (ex. b'\xa0\xa4\x00\x00\x02\x3f\x00')
         Returns:
            tuple(data, sw), where
-                        data : string (in hex) of returned data (ex. "074F4EFFFF")
+                        data : bytes of returned data
                         sw   : string (in hex) of status word (ex. "9000")
         """
         if self.apdu_tracer:
-            self.apdu_tracer.trace_command(pdu)
-        (data, sw) = self._send_apdu_raw(pdu)
+            self.apdu_tracer.trace_command(b2h(pdu))
+        try:
+            (data, sw) = self._send_apdu_raw_bin(pdu)
+        except Exception as e:
+            self.sel_cache.clear()
+            raise e
+        self._update_sel_cache(pdu, sw)
         if self.apdu_tracer:
-            self.apdu_tracer.trace_response(pdu, sw, data)
+            self.apdu_tracer.trace_response(b2h(pdu), sw, b2h(data))
         return (data, sw)
 
-    def send_apdu(self, pdu: Hexstr) -> ResTuple:
-        """Sends an APDU and auto fetch response data
+    def send_apdu_raw(self, pdu: Hexstr) -> ResTuple:
+        """Sends an APDU with minimal processing
 
         Args:
            pdu : string of hexadecimal characters (ex. "A0A40000023F00")
@@ -161,42 +223,70 @@ class LinkBase(abc.ABC):
                         data : string (in hex) of returned data (ex. "074F4EFFFF")
                         sw   : string (in hex) of status word (ex. "9000")
         """
+        (data, sw) = self.send_apdu_raw_bin(h2b(pdu))
+        return b2h(data), sw
+
+    def send_apdu_bin(self, pdu: bytes) -> ResTupleBin:
+        """Sends an APDU and auto fetch response data
+
+        Args:
+           pdu : binary APDU (ex. b'\xa0\xa4\x00\x00\x02\x3f\x00')
+        Returns:
+           tuple(data, sw), where
+                        data : bytes of returned data
+                        sw   : string (in hex) of status word (ex. "9000")
+        """
         prev_pdu = pdu
-        data, sw = self.send_apdu_raw(pdu)
+        data, sw = self.send_apdu_raw_bin(pdu)
 
         # When we have sent the first APDU, the SW may indicate that there are response bytes
         # available. There are two SWs commonly used for this 9fxx (sim) and 61xx (usim), where
         # xx is the number of response bytes available.
         # See also:
         if sw is not None:
+            if sw[0:2] in ['9f', '61', '62', '63']:
+                data = bytearray(data)
             while (sw[0:2] in ['9f', '61', '62', '63']):
                 # SW1=9F: 3GPP TS 51.011 9.4.1, Responses to commands which are correctly executed
                 # SW1=61: ISO/IEC 7816-4, Table 5 — General meaning of the interindustry values of SW1-SW2
                 # SW1=62: ETSI TS 102 221 7.3.1.1.4 Clause 4b): 62xx, 63xx, 9xxx != 9000
-                pdu_gr = pdu[0:2] + 'c00000' + sw[2:4]
+                pdu_gr = bytes([pdu[0], 0xc0, 0x00, 0x00, int(sw[2:4], 16)])
                 prev_pdu = pdu_gr
-                d, sw = self.send_apdu_raw(pdu_gr)
+                d, sw = self.send_apdu_raw_bin(pdu_gr)
                 data += d
             if sw[0:2] == '6c':
                 # SW1=6C: ETSI TS 102 221 Table 7.1: Procedure byte coding
-                pdu_gr = prev_pdu[0:8] + sw[2:4]
-                data, sw = self.send_apdu_raw(pdu_gr)
+                pdu_gr = prev_pdu[0:4] + bytes([int(sw[2:4], 16)])
+                data, sw = self.send_apdu_raw_bin(pdu_gr)
 
         return data, sw
 
-    def send_apdu_checksw(self, pdu: Hexstr, sw: SwMatchstr = "9000") -> ResTuple:
-        """Sends an APDU and check returned SW
+    def send_apdu(self, pdu: Hexstr) -> ResTuple:
+        """Sends an APDU and auto fetch response data
 
         Args:
            pdu : string of hexadecimal characters (ex. "A0A40000023F00")
+        Returns:
+           tuple(data, sw), where
+                        data : string (in hex) of returned data (ex. "074F4EFFFF")
+                        sw   : string (in hex) of status word (ex. "9000")
+        """
+        (data, sw) = self.send_apdu_bin(h2b(pdu))
+        return b2h(data), sw
+
+    def send_apdu_checksw_bin(self, pdu: bytes, sw: SwMatchstr = "9000") -> ResTupleBin:
+        """Sends an APDU and check returned SW
+
+        Args:
+           pdu : binary APDU (ex. b'\xa0\xa4\x00\x00\x02\x3f\x00')
            sw : string of 4 hexadecimal characters (ex. "9000"). The user may mask out certain
                         digits using a '?' to add some ambiguity if needed.
         Returns:
                 tuple(data, sw), where
-                        data : string (in hex) of returned data (ex. "074F4EFFFF")
+                        data : bytes of returned data
                         sw   : string (in hex) of status word (ex. "9000")
         """
-        rv = self.send_apdu(pdu)
+        rv = self.send_apdu_bin(pdu)
         last_sw = rv[1]
 
         while sw == '9000' and sw_match(last_sw, '91xx'):
@@ -205,7 +295,7 @@ class LinkBase(abc.ABC):
             rv = (rv[0], '9000')
             # proactive sim as per TS 102 221 Setion 7.4.2
             # TODO: Check SW manually to avoid recursing on the stack (provided this piece of code stays in this place)
-            fetch_rv = self.send_apdu_checksw('80120000' + last_sw[2:], sw)
+            fetch_rv = self.send_apdu_checksw_bin(bytes([0x80, 0x12, 0x00, 0x00, int(last_sw[2:], 16)]), sw)
             # Setting this in case we later decide not to send a terminal
             # response immediately unconditionally -- the card may still have
             # something pending even though the last command was not processed
@@ -213,8 +303,8 @@ class LinkBase(abc.ABC):
             last_sw = fetch_rv[1]
             # parse the proactive command
             pcmd = ProactiveCommand()
-            parsed = pcmd.from_tlv(h2b(fetch_rv[0]))
-            print("FETCH: %s (%s)" % (fetch_rv[0], type(parsed).__name__))
+            parsed = pcmd.from_tlv(bytes(fetch_rv[0]))
+            print("FETCH: %s (%s)" % (b2h(fetch_rv[0]), type(parsed).__name__))
             if self.proactive_handler:
                 # Extension point: If this does return a list of TLV objects,
                 # they could be appended after the Result; if the first is a
@@ -238,15 +328,43 @@ class LinkBase(abc.ABC):
             # Testing hint: In contrast to the above, this part is positively
             # essential to get the SJA2 to provide the later parts of a
             # multipart SMS in response to an OTA RFM command.
-            terminal_response = '80140000' + b2h(len(tail).to_bytes(1, 'big') + tail)
+            terminal_response = bytes([0x80, 0x14, 0x00, 0x00, len(tail)]) + tail
 
-            terminal_response_rv = self.send_apdu(terminal_response)
+            terminal_response_rv = self.send_apdu_bin(terminal_response)
             last_sw = terminal_response_rv[1]
 
         if not sw_match(rv[1], sw):
             raise SwMatchError(rv[1], sw.lower(), self.sw_interpreter)
         return rv
 
+    def send_apdus_checksw_bin(self, pdus: List[bytes], sw: SwMatchstr = "9000") -> List[ResTupleBin]:
+        """Sends a sequence of APDUs and checks the returned SW of each.  Transports which are able to
+        pipeline APDUs (see ModemATCommandLink) override this; they may re-send an APDU whose status word
+        does not match, so this must only be used with idempotent commands (READ/UPDATE RECORD, ...).
+
+        Args:
+           pdus : list of binary APDUs
+           sw : string of 4 hexadecimal characters (ex. "9000"), see send_apdu_checksw_bin()
+        Returns:
+                list of tuple(data, sw), one for each APDU
+        """
+        return [self.send_apdu_checksw_bin(pdu, sw) for pdu in pdus]
+
+    def send_apdu_checksw(self, pdu: Hexstr, sw: SwMatchstr = "9000") -> ResTuple:
+        """Sends an APDU and check returned SW
+
+        Args:
+           pdu : string of hexadecimal characters (ex. "A0A40000023F00")
+           sw : string of 4 hexadecimal characters (ex. "9000"). The user may mask out certain
+                        digits using a '?' to add some ambiguity if needed.
+        Returns:
+                tuple(data, sw), where
+                        data : string (in hex) of returned data (ex. "074F4EFFFF")
+                        sw   : string (in hex) of status word (ex. "9000")
+        """
+        (data, sw) = self.send_apdu_checksw_bin(h2b(pdu), sw)
+        return b2h(data), sw
+
 def argparse_add_reader_args(arg_parser: argparse.ArgumentParser):
     """Add all reader related arguments to the given argparse.Argumentparser instance."""
     from pySim.transport.serial import SerialSimLink
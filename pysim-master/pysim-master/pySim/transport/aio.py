@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+""" pySim: asyncio interface to card transport links and SimCardCommands
+"""
+
+# (C) 2024 by sysmocom - s.f.m.c. GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Callable, Any
+
+from osmocom.utils import Hexstr
+
+from pySim.transport import LinkBase
+from pySim.commands import SimCardCommands
+from pySim.utils import ResTuple, ResTupleBin, SwMatchstr
+
+
+class AsyncLink:
+    """asyncio variant of a card transport link.  It wraps a (synchronous) LinkBase instance and runs all of
+    its blocking operations (PC/SC calls, serial port I/O, ...) in a dedicated single-thread executor.
+
+    As there is one executor thread per link, the operations on one card are strictly serialized, while the
+    operations on any number of links (readers, slots) progress concurrently from within one event loop."""
+
+    def __init__(self, link: LinkBase, executor: Optional[ThreadPoolExecutor] = None):
+        """
+        Args:
+            link : synchronous transport link (e.g. as returned by init_reader())
+            executor : executor to use; by default a single-thread executor is created for this link
+        """
+        self.link = link
+        self._own_executor = executor is None
+        self._executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='AsyncLink')
+
+    def __str__(self) -> str:
+        return str(self.link)
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run an arbitrary blocking function using the link (or a card on it) in the executor of this
+        link, e.g. a sequence of commands that must not be interleaved with other commands."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def close(self):
+        """Shut down the executor (if created by us).  The link itself is not disconnected."""
+        if self._own_executor:
+            self._executor.shutdown(wait=False)
+
+    async def wait_for_card(self, timeout: Optional[int] = None, newcardonly: bool = False):
+        return await self.run(self.link.wait_for_card, timeout, newcardonly)
+
+    async def connect(self):
+        return await self.run(self.link.connect)
+
+    async def disconnect(self):
+        return await self.run(self.link.disconnect)
+
+    async def reset_card(self):
+        return await self.run(self.link.reset_card)
+
+    async def get_atr(self) -> Hexstr:
+        return await self.run(self.link.get_atr)
+
+    async def send_apdu_bin(self, pdu: bytes) -> ResTupleBin:
+        return await self.run(self.link.send_apdu_bin, pdu)
+
+    async def send_apdu(self, pdu: Hexstr) -> ResTuple:
+        return await self.run(self.link.send_apdu, pdu)
+
+    async def send_apdu_checksw_bin(self, pdu: bytes, sw: SwMatchstr = "9000") -> ResTupleBin:
+        return await self.run(self.link.send_apdu_checksw_bin, pdu, sw)
+
+    async def send_apdu_checksw(self, pdu: Hexstr, sw: SwMatchstr = "9000") -> ResTuple:
+        return await self.run(self.link.send_apdu_checksw, pdu, sw)
+
+    async def send_apdus_checksw_bin(self, pdus: List[bytes], sw: SwMatchstr = "9000") -> List[ResTupleBin]:
+        return await self.run(self.link.send_apdus_checksw_bin, pdus, sw)
+
+
+class AsyncSimCardCommands:
+    """asyncio variant of SimCardCommands.  Each method of SimCardCommands that talks to the card is
+    available as a coroutine of the same name and signature, e.g. 'await scc.read_binary(['3f00', '2fe2'])'.
+    The commands are executed in the executor of the AsyncLink, so concurrent commands for the same card
+    are serialized.  Plain attributes (cla_byte, sel_ctrl, lchan_nr, ...) are passed through."""
+
+    def __init__(self, alink: AsyncLink, scc: Optional[SimCardCommands] = None, lchan_nr: int = 0):
+        """
+        Args:
+            alink : asyncio transport link
+            scc : synchronous SimCardCommands instance to wrap; created if not specified
+            lchan_nr : logical channel number (only used if scc is not specified)
+        """
+        self.alink = alink
+        self.scc = scc or SimCardCommands(alink.link, lchan_nr)
+
+    def fork_lchan(self, lchan_nr: int) -> 'AsyncSimCardCommands':
+        """Fork a per-lchan specific AsyncSimCardCommands instance off the current instance."""
+        return AsyncSimCardCommands(self.alink, self.scc.fork_lchan(lchan_nr))
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.scc, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        @functools.wraps(attr)
+        async def wrapper(*args, **kwargs):
+            return await self.alink.run(attr, *args, **kwargs)
+        return wrapper
+
+    def __setattr__(self, name: str, value):
+        if name in ['alink', 'scc']:
+            super().__setattr__(name, value)
+        else:
+            setattr(self.scc, name, value)
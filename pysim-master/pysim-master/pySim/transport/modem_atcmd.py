@@ -20,11 +20,11 @@ import logging as log
 import time
 import re
 import argparse
-from typing import Optional
+from typing import Optional, List
 import serial
-from osmocom.utils import Hexstr
+from osmocom.utils import Hexstr, b2h, h2b
 
-from pySim.utils import ResTuple
+from pySim.utils import ResTuple, ResTupleBin, SwMatchstr, sw_match
 from pySim.transport import LinkBase
 from pySim.exceptions import ReaderError, ProtocolError
 
@@ -45,6 +45,8 @@ class ModemATCommandLink(LinkBase):
         self._echo = False		# this will be auto-detected by _check_echo()
         self._device = device
         self._atr = None
+        # number of AT+CSIM commands to combine in one command line (see send_apdus_checksw_bin)
+        self._pipeline = getattr(opts, 'modem_pipeline', 1)
 
         # Check the AT interface
         self._check_echo()
@@ -56,10 +58,23 @@ class ModemATCommandLink(LinkBase):
         if hasattr(self, '_sl'):
             self._sl.close()
 
-    def send_at_cmd(self, cmd, timeout=0.2, patience=0.002):
+    @staticmethod
+    def _is_final_result(line: bytes) -> bool:
+        """Whether the given line is a final result code (ITU-T V.250 / 3GPP TS 27.007)."""
+        return line in [b'OK', b'ERROR'] or line.startswith((b'+CME ERROR:', b'+CMS ERROR:'))
+
+    def send_at_cmd(self, cmd, timeout=0.2) -> List[bytes]:
+        """Send an AT command line and wait for its final result code.
+
+        Args:
+                cmd : AT command line (without trailing CR) as str or bytes
+                timeout : maximum time (in seconds) to wait for the final result code
+        Returns:
+                list of (non-empty) response lines, the last one being the final result code
+                (unless the timeout expired)
+        """
         # Convert from string to bytes, if needed
         bcmd = cmd if isinstance(cmd, bytes) else cmd.encode()
-        bcmd += b'\r'
 
         # Clean input buffer from previous/unexpected data
         self._sl.reset_input_buffer()
@@ -67,38 +82,37 @@ class ModemATCommandLink(LinkBase):
         # Send command to the modem
         log.debug('Sending AT command: %s', cmd)
         try:
-            wlen = self._sl.write(bcmd)
-            assert wlen == len(bcmd)
+            wlen = self._sl.write(bcmd + b'\r')
+            assert wlen == len(bcmd) + 1
         except Exception as exc:
             raise ReaderError('Failed to send AT command: %s' % cmd) from exc
 
-        rsp = b''
-        its = 1
+        # Block in read_until() on the serial port: we return as soon as the final result code has
+        # been received instead of polling for data.  Changing the timeout of the port is expensive,
+        # so we only do it if needed and check the overall deadline below.
+        if self._sl.timeout != timeout:
+            self._sl.timeout = timeout
+        rsp = []
         t_start = time.time()
         while True:
-            rsp = rsp + self._sl.read(self._sl.in_waiting)
-            lines = rsp.split(b'\r\n')
-            if len(lines) >= 2:
-                res = lines[-2]
-                if res == b'OK':
-                    log.debug('Command finished with result: %s', res)
-                    break
-                if res == b'ERROR' or res.startswith(b'+CME ERROR:'):
-                    log.error('Command failed with result: %s', res)
-                    break
-
+            line = self._sl.read_until(b'\r\n')
+            if line.endswith(b'\n'):
+                line = line.strip()
+                if line == bcmd:
+                    # echo of the command line
+                    self._echo = True
+                elif line:
+                    rsp.append(line)
+                    if self._is_final_result(line):
+                        if line == b'OK':
+                            log.debug('Command finished with result: %s', line)
+                        else:
+                            log.error('Command failed with result: %s', line)
+                        break
             if time.time() - t_start >= timeout:
                 log.info('Command finished with timeout >= %ss', timeout)
                 break
-            time.sleep(patience)
-            its += 1
-        log.debug('Command took %0.6fs (%d cycles a %fs)', time.time() - t_start, its, patience)
-
-        if self._echo:
-            # Skip echo chars
-            rsp = rsp[wlen:]
-        rsp = rsp.strip()
-        rsp = rsp.split(b'\r\n\r\n')
+        log.debug('Command took %0.6fs', time.time() - t_start)
 
         log.debug('Got response from modem: %s', rsp)
         return rsp
@@ -111,18 +125,13 @@ class ModemATCommandLink(LinkBase):
         ATE1/ATE0, respectively, we rather detect the current
         configuration of the modem without any change.
         """
-        # Next command shall not strip the echo from the response
+        # send_at_cmd() sets this flag if it receives the echo of the command line
         self._echo = False
         result = self.send_at_cmd('AT')
 
         # Verify the response
-        if len(result) > 0:
-            if result[-1] == b'OK':
-                self._echo = False
-                return
-            if result[-1] == b'AT\r\r\nOK':
-                self._echo = True
-                return
+        if len(result) > 0 and result[-1] == b'OK':
+            return
         raise ReaderError('Interface \'%s\' does not respond to \'AT\' command' % self._device)
 
     def _reset_card(self):
@@ -145,34 +154,82 @@ class ModemATCommandLink(LinkBase):
     def wait_for_card(self, timeout: Optional[int] = None, newcardonly: bool = False):
         pass  # Nothing to do really ...
 
-    def _send_apdu_raw(self, pdu: Hexstr) -> ResTuple:
+    @staticmethod
+    def _csim_cmd(pdu: Hexstr) -> str:
         # Make sure pdu has upper case hex digits [A-F]
         pdu = pdu.upper()
-
         # Prepare the command as described in 8.17
-        cmd = 'AT+CSIM=%d,\"%s\"' % (len(pdu), pdu)
+        return '+CSIM=%d,\"%s\"' % (len(pdu), pdu)
+
+    def _send_csim(self, pdus: List[Hexstr]) -> List[ResTuple]:
+        """Send one or more APDUs using AT+CSIM commands within a single AT command line."""
+        cmd = 'AT' + ';'.join([self._csim_cmd(pdu) for pdu in pdus])
         log.debug('Sending command: %s',  cmd)
 
-        # Send AT+CSIM command to the modem
-        rsp = self.send_at_cmd(cmd)
-        if rsp[-1].startswith(b'+CME ERROR:'):
+        # Send AT+CSIM command(s) to the modem
+        rsp = self.send_at_cmd(cmd, timeout=0.2 * len(pdus))
+        if rsp and rsp[-1].startswith(b'+CME ERROR:'):
             raise ProtocolError('AT+CSIM failed with: %s' % str(rsp))
-        if len(rsp) != 2 or rsp[-1] != b'OK':
+        if not rsp or rsp[-1] != b'OK':
             raise ReaderError('APDU transfer failed: %s' % str(rsp))
-        rsp = rsp[0]  # Get rid of b'OK'
 
-        # Make sure that the response has format: b'+CSIM: %d,\"%s\"'
-        try:
-            result = re.match(b'\+CSIM: (\d+),\"([0-9A-F]+)\"', rsp)
+        # Make sure that the responses have format: b'+CSIM: %d,\"%s\"'
+        ret = []
+        for line in rsp[:-1]:
+            result = re.match(b'\\+CSIM: (\\d+),\"([0-9A-F]+)\"', line)
+            if not result:
+                # unsolicited result code or the like
+                log.debug('Ignoring unexpected line: %s', line)
+                continue
             (_rsp_pdu_len, rsp_pdu) = result.groups()
-        except Exception as exc:
-            raise ReaderError('Failed to parse response from modem: %s' % rsp) from exc
+            if len(rsp_pdu) < 4:
+                raise ReaderError('Response from modem lacks status word: %s' % line)
+            data = rsp_pdu[:-4].decode().lower()
+            sw = rsp_pdu[-4:].decode().lower()
+            log.debug('Command response: %s, %s',  data, sw)
+            ret.append((data, sw))
+        if len(ret) != len(pdus):
+            raise ReaderError('Failed to parse response from modem: %s' % str(rsp))
+        return ret
 
-        # TODO: make sure we have at least SW
-        data = rsp_pdu[:-4].decode().lower()
-        sw = rsp_pdu[-4:].decode().lower()
-        log.debug('Command response: %s, %s',  data, sw)
-        return data, sw
+    def _send_apdu_raw(self, pdu: Hexstr) -> ResTuple:
+        return self._send_csim([pdu])[0]
+
+    # instructions of the APDUs that may be pipelined: The modem executes all commands of a command line,
+    # even if one of them fails, so only commands without side effects are pipelined (READ RECORD).
+    PIPELINE_INS = [0xb2]
+
+    def send_apdus_checksw_bin(self, pdus: List[bytes], sw: SwMatchstr = "9000") -> List[ResTupleBin]:
+        """Send a sequence of APDUs, pipelining up to 'modem_pipeline' AT+CSIM commands in one AT command
+        line if all of them are READ RECORD commands (see PIPELINE_INS).  Any APDU whose status word does
+        not match is re-sent via send_apdu_checksw_bin(), which takes care of GET RESPONSE, proactive
+        commands, errors, ...; the APDUs following it in the same command line are sent again, too."""
+        if self._pipeline < 2 or any(pdu[1] not in self.PIPELINE_INS for pdu in pdus):
+            return super().send_apdus_checksw_bin(pdus, sw)
+        ret = []
+        todo = list(pdus)
+        while todo:
+            batch = todo[:self._pipeline]
+            try:
+                rsps = self._send_csim([b2h(pdu) for pdu in batch])
+            except Exception as e:
+                self.sel_cache.clear()
+                raise e
+            num_ok = 0
+            for pdu, (data, rsw) in zip(batch, rsps):
+                self._update_sel_cache(pdu, rsw)
+                if self.apdu_tracer:
+                    self.apdu_tracer.trace_command(b2h(pdu))
+                    self.apdu_tracer.trace_response(b2h(pdu), rsw, data)
+            for (data, rsw) in rsps:
+                if not sw_match(rsw, sw):
+                    break
+                ret.append((h2b(data), rsw))
+                num_ok += 1
+            todo = todo[num_ok:]
+            if num_ok < len(batch):
+                ret.append(self.send_apdu_checksw_bin(todo.pop(0), sw))
+        return ret
 
     def __str__(self) -> str:
         return "modem:%s" % self._device
@@ -186,3 +243,6 @@ the AT+CSIM interface for Generic SIM access as specified in 3GPP TS 27.007.""")
                                  help='Serial port of modem for Generic SIM Access (3GPP TS 27.007)')
         modem_group.add_argument('--modem-baud', type=int, metavar='BAUD', default=115200,
                                  help='Baud rate used for modem port')
+        modem_group.add_argument('--modem-pipeline', type=int, metavar='N', default=1,
+                                 help='Number of AT+CSIM commands to combine in a single AT command line when '
+                                 'reading multiple records (requires modem support, default: 1)')
@@ -27,20 +27,27 @@ from smartcard.Exceptions import NoCardException, CardRequestTimeoutException, C
 from smartcard.System import readers
 from smartcard.ExclusiveConnectCardConnection import ExclusiveConnectCardConnection
 
-from osmocom.utils import h2i, i2h, Hexstr
+from osmocom.utils import Hexstr
 
 from pySim.exceptions import NoCardError, ProtocolError, ReaderError
 from pySim.transport import LinkBase
-from pySim.utils import ResTuple
+from pySim.utils import ResTupleBin, atr_ext_length_info
 
 
 class PcscSimLink(LinkBase):
     """ pySim: PCSC reader transport link."""
     name = 'PC/SC'
 
+    PROTOCOLS = {
+        'T0': CardConnection.T0_protocol,
+        'T1': CardConnection.T1_protocol,
+        'auto': CardConnection.T0_protocol | CardConnection.T1_protocol,
+    }
+
     def __init__(self, opts: argparse.Namespace = argparse.Namespace(pcsc_dev=0), **kwargs):
         super().__init__(**kwargs)
         self._reader = None
+        self._protocol = self.PROTOCOLS[getattr(opts, 'pcsc_protocol', None) or 'T0']
         r = readers()
         if opts.pcsc_dev is not None:
             # actual reader index number (integer)
@@ -83,13 +90,20 @@ class PcscSimLink(LinkBase):
             # To avoid leakage of resources, make sure the reader
             # is disconnected
             self.disconnect()
+            # this may well be a different card now
+            self.sel_cache.clear()
 
-            # Explicitly select T=0 communication protocol
-            self._con.connect(CardConnection.T0_protocol)
+            # Explicitly select the communication protocol (T=0 by default)
+            self._con.connect(self._protocol)
         except CardConnectionException as exc:
             raise ProtocolError() from exc
         except NoCardException as exc:
             raise NoCardError() from exc
+        # extended length APDUs, if the card says so in its ATR (see also SimCardCommands.probe_ext_length)
+        self.set_ext_length(atr_ext_length_info(bytes(self.get_atr())))
+
+    def supports_ext_length(self) -> bool:
+        return self._con.getProtocol() == CardConnection.T1_protocol
 
     def get_atr(self) -> Hexstr:
         return self._con.getATR()
@@ -102,16 +116,12 @@ class PcscSimLink(LinkBase):
         self.connect()
         return 1
 
-    def _send_apdu_raw(self, pdu: Hexstr) -> ResTuple:
-
-        apdu = h2i(pdu)
-
-        data, sw1, sw2 = self._con.transmit(apdu)
+    def _send_apdu_raw_bin(self, pdu: bytes) -> ResTupleBin:
 
-        sw = [sw1, sw2]
+        data, sw1, sw2 = self._con.transmit(list(pdu))
 
         # Return value
-        return i2h(data), i2h(sw)
+        return bytes(data), '%02x%02x' % (sw1, sw2)
 
     def __str__(self) -> str:
         return "PCSC[%s]" % (self._reader)
@@ -126,6 +136,9 @@ interface, if not even a generic USB CCID driver is used.  You can use a tool li
 to obtain a list of readers available on your system. """)
         pcsc_group.add_argument('--pcsc-shared', action='store_true',
                                 help='Open PC/SC reaer in SHARED access (default: EXCLUSIVE)')
+        pcsc_group.add_argument('--pcsc-protocol', choices=PcscSimLink.PROTOCOLS.keys(), default='T0',
+                                help='Transmission protocol to use.  Extended length APDUs (if supported by '
+                                'the card) require T=1 (default: T0)')
         dev_group = pcsc_group.add_mutually_exclusive_group()
         dev_group.add_argument('-p', '--pcsc-device', type=int, dest='pcsc_dev', metavar='PCSC', default=None,
                                help='Number of PC/SC reader to use for SIM access')
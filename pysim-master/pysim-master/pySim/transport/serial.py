@@ -21,11 +21,15 @@ import os
 import argparse
 from typing import Optional
 import serial
-from osmocom.utils import h2b, b2h, Hexstr
+from osmocom.utils import b2h, Hexstr
 
 from pySim.exceptions import NoCardError, ProtocolError
 from pySim.transport import LinkBase
-from pySim.utils import ResTuple
+from pySim.utils import ResTupleBin
+
+# ISO/IEC 7816-3 Table 7 (clock rate conversion integer Fi) and Table 8 (baud rate adjustment integer Di)
+FI_TABLE = [372, 372, 558, 744, 1116, 1488, 1860, None, None, 512, 768, 1024, 1536, 2048, None, None]
+DI_TABLE = [None, 1, 2, 4, 8, 16, 32, 64, 12, 20, None, None, None, None, None, None]
 
 
 class SerialSimLink(LinkBase):
@@ -47,9 +51,13 @@ class SerialSimLink(LinkBase):
             rtscts=0,
             baudrate=opts.baudrate,
         )
+        self._baudrate = opts.baudrate
+        self._pps = getattr(opts, 'pps', False)
         self._rst_pin = rst
         self._debug = debug
         self._atr = None
+        # bytes received from the serial port, but not consumed yet
+        self._rxbuf = bytearray()
 
     def __del__(self):
         if hasattr(self, "_sl"):
@@ -123,12 +131,16 @@ class SerialSimLink(LinkBase):
         except Exception as exc:
             raise ValueError('Invalid reset pin %s' % self._rst_pin) from exc
 
+        # the card falls back to the default transmission rate after reset
+        if self._sl.baudrate != self._baudrate:
+            self._sl.baudrate = self._baudrate
         rst_meth(rst_val)
         time.sleep(0.1)  # 100 ms
         self._sl.flushInput()
+        self._rxbuf.clear()
         rst_meth(rst_val ^ 1)
 
-        b = self._rx_byte()
+        b = self._rx(1)
         if not b:
             return 0
         if ord(b) != 0x3b:
@@ -136,7 +148,7 @@ class SerialSimLink(LinkBase):
         self._dbg_print("TS: 0x%x Direct convention" % ord(b))
 
         while ord(b) == 0x3b:
-            b = self._rx_byte()
+            b = self._rx(1)
 
         if not b:
             return -1
@@ -144,100 +156,130 @@ class SerialSimLink(LinkBase):
         self._dbg_print("T0: 0x%x" % t0)
         self._atr = [0x3b, ord(b)]
 
-        for i in range(4):
-            if t0 & (0x10 << i):
-                b = self._rx_byte()
-                self._atr.append(ord(b))
-                self._dbg_print("T%si = %x" % (chr(ord('A')+i), ord(b)))
-
-        for i in range(0, t0 & 0xf):
-            b = self._rx_byte()
-            self._atr.append(ord(b))
-            self._dbg_print("Historical = %x" % ord(b))
-
-        while True:
-            x = self._rx_byte()
-            if not x:
+        # interface bytes (ISO/IEC 7816-3 Section 8.2.3), remember TA1 and the protocols for PPS
+        y = t0 >> 4
+        i = 1
+        interface = {}
+        protocols = []
+        while y:
+            for j in range(4):
+                if y & (1 << j):
+                    b = self._rx(1)
+                    if not b:
+                        return -1
+                    self._atr.append(ord(b))
+                    interface['T%s%u' % (chr(ord('A')+j), i)] = ord(b)
+                    self._dbg_print("T%s%u = %x" % (chr(ord('A')+j), i, ord(b)))
+            if not y & 0x8:
                 break
-            self._atr.append(ord(x))
-            self._dbg_print("Extra: %x" % ord(x))
+            protocols.append(interface['TD%u' % i] & 0x0f)
+            y = interface['TD%u' % i] >> 4
+            i += 1
+
+        # historical bytes, followed by TCK unless only T=0 is indicated
+        num_bytes = (t0 & 0xf) + (1 if any(protocols) else 0)
+        b = self._rx(num_bytes)
+        self._atr += list(b)
+        self._dbg_print("Historical/TCK = %s" % b2h(b))
+        if len(b) < num_bytes:
+            return -1
+
+        if self._pps and 'TA1' in interface and 'TA2' not in interface:
+            self._do_pps(interface['TA1'], protocols[0] if protocols else 0)
 
         return 1
 
+    def _do_pps(self, ta1: int, protocol: int):
+        """Perform the protocol and parameters selection (ISO/IEC 7816-3 Section 9) in order to switch to
+        the transmission rate indicated in TA1 of the ATR."""
+        fi = FI_TABLE[ta1 >> 4]
+        di = DI_TABLE[ta1 & 0xf]
+        if not fi or not di or fi // di == 372:
+            return
+        pps = bytes([0xff, 0x10 | protocol, ta1])
+        pps += bytes([pps[0] ^ pps[1] ^ pps[2]])
+        self._tx(pps)
+        # PPSS, PPS0 and PPS1 (only if bit 5 of PPS0 is set), followed by PCK
+        rsp = self._rx(3)
+        if len(rsp) == 3 and rsp[1] & 0x10:
+            rsp += self._rx(1)
+        if rsp == bytes([0xff, protocol, 0xff ^ protocol]):
+            # the card did not confirm PPS1: continue with the default Fi/Di (ISO/IEC 7816-3 Section 9.3)
+            self._dbg_print("PPS: card keeps the default Fi/Di")
+            return
+        if rsp != pps:
+            self._dbg_print("PPS failed: %s" % b2h(rsp))
+            raise ProtocolError('PPS with TA1=%02x failed (response: %s)' % (ta1, b2h(rsp)))
+        # the host baud rate corresponds to the default Fi=372, Di=1
+        self._sl.baudrate = self._baudrate * 372 * di // fi
+        self._dbg_print("PPS: Fi=%u, Di=%u, now using %u baud" % (fi, di, self._sl.baudrate))
+
     def _dbg_print(self, s):
         if self._debug:
             print(s)
 
-    def _tx_byte(self, b):
-        self._sl.write(b)
-        r = self._sl.read()
-        if r != b:  # TX and RX are tied, so we must clear the echo
-            raise ProtocolError("Bad echo value. Expected %02x, got %s)" % (
-                ord(b), '%02x' % ord(r) if r else '(nil)'))
+    def _rx(self, n: int) -> bytes:
+        """Receive (up to, in case of timeout) n bytes.  Reads all bytes available at the serial port in
+        a single call, any surplus is kept in the receive buffer for subsequent calls."""
+        while len(self._rxbuf) < n:
+            chunk = self._sl.read(max(n - len(self._rxbuf), self._sl.in_waiting))
+            if not chunk:
+                break
+            self._rxbuf += chunk
+        ret = bytes(self._rxbuf[:n])
+        del self._rxbuf[:n]
+        return ret
 
-    def _tx_string(self, s):
+    def _tx(self, s: bytes):
         """This is only safe if it's guaranteed the card won't send any data
         during the time of tx of the string !!!"""
         self._sl.write(s)
-        r = self._sl.read(len(s))
+        r = self._rx(len(s))
         if r != s:  # TX and RX are tied, so we must clear the echo
             raise ProtocolError(
                 "Bad echo value (Expected: %s, got %s)" % (b2h(s), b2h(r)))
 
-    def _rx_byte(self):
-        return self._sl.read()
-
-    def _send_apdu_raw(self, pdu: Hexstr) -> ResTuple:
-
-        pdu = h2b(pdu)
-        data_len = pdu[4]  # P3
+    def _send_apdu_raw_bin(self, pdu: bytes) -> ResTupleBin:
+        ins = pdu[1]
+        tx_data = pdu[5:]
+        # number of bytes expected from the card (case 2); P3=0 means 256 here
+        rx_len = 0 if tx_data else (pdu[4] or 256)
 
         # Send first CLASS,INS,P1,P2,P3
-        self._tx_string(pdu[0:5])
+        self._tx(pdu[0:5])
 
-        # Wait ack which can be
-        #  - INS: Command acked -> go ahead
+        # T=0 state machine (ISO/IEC 7816-3 Section 10.3.3), driven by the procedure bytes:
         #  - 0x60: NULL, just wait some more
-        #  - SW1: The card can apparently proceed ...
+        #  - INS: transfer all remaining data bytes
+        #  - INS ^ 0xFF: transfer the next data byte
+        #  - SW1: followed by SW2, end of the command
+        data = bytearray()
         while True:
-            b = self._rx_byte()
-            if ord(b) == pdu[1]:
-                break
-            if b != '\x60':
-                # Ok, it 'could' be SW1
-                sw1 = b
-                sw2 = self._rx_byte()
-                nil = self._rx_byte()
-                if (sw2 and not nil):
-                    return '', b2h(sw1+sw2)
-
-                raise ProtocolError()
-
-        # Send data (if any)
-        if len(pdu) > 5:
-            self._tx_string(pdu[5:])
-
-        # Receive data (including SW !)
-        #  length = [P3 - tx_data (=len(pdu)-len(hdr)) + 2 (SW1//2) ]
-        to_recv = data_len - len(pdu) + 5 + 2
-
-        data = bytes(0)
-        while len(data) < to_recv:
-            b = self._rx_byte()
-            if (to_recv == 2) and (b == '\x60'):  # Ignore NIL if we have no RX data (hack ?)
-                continue
+            b = self._rx(1)
             if not b:
-                break
-            data += b
-
-        # Split datafield from SW
-        if len(data) < 2:
-            return None, None
-        sw = data[-2:]
-        data = data[0:-2]
-
-        # Return value
-        return b2h(data), b2h(sw)
+                raise ProtocolError('Timeout waiting for procedure byte')
+            pb = b[0]
+            if pb == 0x60:
+                continue
+            if pb & 0xf0 in [0x60, 0x90]:
+                sw2 = self._rx(1)
+                if not sw2:
+                    raise ProtocolError('Timeout waiting for SW2')
+                return bytes(data), '%02x%02x' % (pb, sw2[0])
+            if pb == ins:
+                if tx_data:
+                    self._tx(tx_data)
+                    tx_data = b''
+                else:
+                    data += self._rx(rx_len - len(data))
+            elif pb == ins ^ 0xff:
+                if tx_data:
+                    self._tx(tx_data[:1])
+                    tx_data = tx_data[1:]
+                else:
+                    data += self._rx(1)
+            else:
+                raise ProtocolError('Unexpected procedure byte 0x%02x' % pb)
 
     def __str__(self) -> str:
         return "serial:%s" % (self._sl.name)
@@ -251,3 +293,6 @@ readers, only with the very primitive readers following the ancient `Phoenix` or
                                   help='Serial Device for SIM access')
         serial_group.add_argument('-b', '--baud', dest='baudrate', type=int, metavar='BAUD', default=9600,
                                   help='Baud rate used for SIM access')
+        serial_group.add_argument('--pps', action='store_true',
+                                  help='Switch to the (higher) transmission rate indicated by the card in its ATR '
+                                  'using PPS.  The serial port must support the resulting baud rate')
@@ -3,6 +3,7 @@
 """ pySim: various utilities
 """
 
+import os
 import json
 import abc
 import string
@@ -11,7 +12,7 @@ import argparse
 from io import BytesIO
 from typing import Optional, List, Dict, Any, Tuple, NewType, Union
 from osmocom.utils import *
-from osmocom.tlv import bertlv_encode_tag, bertlv_encode_len
+from osmocom.tlv import bertlv_encode_tag, bertlv_encode_len, bertlv_parse_one_rawtag
 
 # Copyright (C) 2009-2010  Sylvain Munaut <tnt@246tNt.com>
 # Copyright (C) 2021 Harald Welte <laforge@osmocom.org>
@@ -48,6 +49,7 @@ from osmocom.tlv import bertlv_encode_tag, bertlv_encode_len
 SwHexstr = NewType('SwHexstr', str)
 SwMatchstr = NewType('SwMatchstr', str)
 ResTuple = Tuple[Hexstr, SwHexstr]
+ResTupleBin = Tuple[bytes, SwHexstr]
 
 def enc_imsi(imsi: str):
     """Converts a string IMSI into the encoded value of the EF"""
@@ -526,6 +528,88 @@ def expand_hex(hexstring, length):
     return hexstring
 
 
+def atr_decompose(atr: bytes) -> Tuple[List[int], bytes]:
+    """Decompose an ATR as per ISO/IEC 7816-3 Section 8.2.
+
+    Args:
+            atr : binary ATR (TS, T0, interface bytes, historical bytes [, TCK])
+    Returns:
+            tuple of list of the transmission protocols (T=...) indicated and the historical bytes
+    """
+    protocols = []
+    num_hist = atr[1] & 0x0f
+    y = atr[1] >> 4
+    i = 2
+    while True:
+        # skip TAi, TBi, TCi (if present)
+        i += bin(y & 0x7).count('1')
+        if not y & 0x8:
+            break
+        # TDi
+        protocols.append(atr[i] & 0x0f)
+        y = atr[i] >> 4
+        i += 1
+    return (protocols or [0], atr[i:i+num_hist])
+
+# ISO/IEC 7816-4 Table 118: third software function table byte of the card capabilities
+_CARD_CAPS_EXT_LEN = 0x40
+
+def atr_ext_length_info(atr: bytes) -> Optional[Tuple[int, int]]:
+    """Determine from the card capabilities in the historical bytes of the ATR whether the card supports
+    extended length APDUs (ISO/IEC 7816-4 Section 8.1.1.2.7).
+
+    Args:
+            atr : binary ATR
+    Returns:
+            tuple of maximum number of command and response data bytes, or None if not supported
+    """
+    (_protocols, hist) = atr_decompose(atr)
+    # category indicator: 0x80 = COMPACT-TLV, 0x00 = COMPACT-TLV followed by 3 status bytes
+    if len(hist) < 1 or hist[0] not in [0x00, 0x80]:
+        return None
+    ctlv = hist[1:-3] if hist[0] == 0x00 else hist[1:]
+    while len(ctlv):
+        tag = ctlv[0] >> 4
+        length = ctlv[0] & 0x0f
+        value = ctlv[1:1+length]
+        ctlv = ctlv[1+length:]
+        if tag == 0x7 and len(value) >= 3:
+            if value[2] & _CARD_CAPS_EXT_LEN:
+                return (0xffff, 0x10000)
+            return None
+    return None
+
+def ef_atr_ext_length_info(ef_atr: bytes) -> Optional[Tuple[int, int]]:
+    """Determine from the contents of EF.ATR (ETSI TS 102 221 Section 13.2) whether the card supports
+    extended length APDUs.  Considers both the card capabilities and the extended length information
+    (ISO/IEC 7816-4 Section 12.7.1).
+
+    Args:
+            ef_atr : binary contents of EF.ATR
+    Returns:
+            tuple of maximum number of command and response data bytes, or None if not supported
+    """
+    supported = False
+    max_lens = (0xffff, 0x10000)
+    remainder = ef_atr
+    while len(remainder) and remainder[0] not in [0x00, 0xff]:
+        (tag, _l, value, remainder) = bertlv_parse_one_rawtag(remainder)
+        if tag == 0x47 and len(value) >= 3:
+            supported = bool(value[2] & _CARD_CAPS_EXT_LEN)
+        elif tag == 0x7f66:
+            # two INTEGER DOs: maximum number of bytes in a command and in a response APDU
+            ints = []
+            while len(value):
+                (itag, _il, ivalue, value) = bertlv_parse_one_rawtag(value)
+                if itag == 0x02:
+                    ints.append(int.from_bytes(ivalue, 'big'))
+            if len(ints) >= 2:
+                supported = True
+                # the sizes include header, Lc, Le and SW; we only care about the data part
+                max_lens = (ints[0] - 9, ints[1] - 2)
+    return max_lens if supported else None
+
+
 def boxed_heading_str(heading, width=80):
     """Generate a string that contains a boxed heading."""
     # Auto-enlarge box if heading exceeds length
@@ -539,6 +623,12 @@ def boxed_heading_str(heading, width=80):
     return res
 
 
+def cache_dir() -> str:
+    """Return the directory for the on-disk caches of pySim ($XDG_CACHE_HOME/pysim or ~/.cache/pysim)."""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'pysim')
+
+
 class DataObject(abc.ABC):
     """A DataObject (DO) in the sense of ISO 7816-4.  Contrary to 'normal' TLVs where one
     simply has any number of different TLVs that may occur in any order at any point, ISO 7816
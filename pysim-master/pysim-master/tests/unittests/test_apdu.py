@@ -1,11 +1,19 @@
 #!/usr/bin/env python3
 
+import io
+import json
+import time
 import unittest
+from unittest import mock
 from osmocom.utils import h2b, b2h
 from osmocom.construct import filter_dict
 
-from pySim.apdu import Apdu
+from pySim.apdu import Apdu, CardReset
+from pySim.apdu.output import JsonlApduOutput, MsgpackApduOutput, TextApduOutput
 from pySim.apdu.ts_31_102 import UsimAuthenticateEven
+from pySim.apdu.ts_102_221 import UiccSelect, ReadRecord
+from pySim.runtime import RuntimeState
+from pySim.ts_102_221 import CardProfileUICC
 
 class TestApdu(unittest.TestCase):
     def test_successful(self):
@@ -22,6 +30,89 @@ class TestApdu(unittest.TestCase):
         apdu = SwApdu('00a40400023f00', '9000')
         self.assertEqual(apdu.successful, False)
 
+class TestLazyDecode(unittest.TestCase):
+    def test_lazy(self):
+        for lazy in [False, True]:
+            with self.subTest(lazy=lazy):
+                apdu = ReadRecord('00b2030406', '0102030405069000', lazy=lazy)
+                self.assertEqual(apdu._cmd_dict is None, lazy)
+                self.assertEqual(apdu.col_id, '03')
+                self.assertEqual(apdu.to_dict(), {'cmd': {'record_number': 3, 'file': 'currently_selected_ef',
+                                                          'p3': 6},
+                                                  'rsp': {'body': h2b('010203040506'), 'sw': '9000'}})
+
+    def test_deferred_processed(self):
+        """In lazy mode, process() does not decode the FCP returned by SELECT: it is decoded once, on first
+        access of the processed property."""
+        card = mock.MagicMock()
+        card._scc.fork_lchan.return_value.select_file.return_value = ('', '9000')
+        rs = RuntimeState(card, CardProfileUICC(), addons=[], applications=[])
+        apdu = UiccSelect('00a40004023f00', '62088202782183023f009000', lazy=True)
+        with mock.patch.object(rs.mf, 'decode_select_response', wraps=rs.mf.decode_select_response) as decode:
+            apdu.process(rs)
+            decode.assert_not_called()
+            self.assertIs(apdu.file, rs.mf)
+            self.assertEqual(apdu.processed['file_identifier'], '3f00')
+            self.assertEqual(apdu.processed['file_identifier'], '3f00')
+            decode.assert_called_once_with('62088202782183023f00')
+        self.assertIsNone(apdu._cmd_dict)
+
+class TestApduOutput(unittest.TestCase):
+    def records(self):
+        apdu = ReadRecord('00b2030406', '0102030405069000', lazy=True)
+        apdu.processed = {'raw': apdu.rsp_data}
+        return [(CardReset(h2b('3b9f96')), 1.5), (apdu, 2.5)]
+
+    def write(self, cls, flush_interval):
+        stream = io.BytesIO()
+        out = cls(io.BufferedWriter(stream), flush_interval)
+        for rec, ts in self.records():
+            if isinstance(rec, CardReset):
+                out.output_reset(rec, ts)
+            else:
+                out.output_apdu(rec, ts)
+        return out, stream
+
+    def test_jsonl(self):
+        out, stream = self.write(JsonlApduOutput, 3600)
+        # buffered until the flush interval expires
+        self.assertEqual(stream.getvalue(), b'')
+        out.flush()
+        lines = stream.getvalue().split(b'\n')
+        self.assertEqual(lines[-1], b'')
+        self.assertEqual(json.loads(lines[0]), {'ts': 1.5, 'reset': '3b9f96'})
+        self.assertEqual(json.loads(lines[1]), {'ts': 2.5, 'lchan': 0, 'cmd': 'READ RECORD', 'ins': 0xb2,
+                                                'path': None, 'sw': '9000', 'id': '03',
+                                                'data': {'raw': '010203040506'}})
+
+    def test_flush_timer(self):
+        """Buffered records are flushed after the flush interval, even if no further record arrives."""
+        out, stream = self.write(JsonlApduOutput, 0.05)
+        for i in range(100):
+            if stream.getvalue().count(b'\n') == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(stream.getvalue().count(b'\n'), 2)
+        self.assertIsNone(out._timer)
+        out.close()
+
+    def test_text(self):
+        out, stream = self.write(TextApduOutput, 0)
+        self.assertEqual(stream.getvalue().decode().split('\n')[0:3],
+                         ['CardReset(3b9f96)', TextApduOutput.SEPARATOR,
+                          '00 READ RECORD      %-35s 03       9000 {"raw": "010203040506"}' % ''])
+        out.write({'card': 'trace.pcap', 'ts': 3.5, 'reset': None})
+        self.assertTrue(stream.getvalue().decode().endswith('trace.pcap CardReset()\n' + TextApduOutput.SEPARATOR + '\n'))
+
+    def test_msgpack(self):
+        try:
+            import msgpack
+        except ImportError:
+            self.skipTest('msgpack not installed')
+        _out, stream = self.write(MsgpackApduOutput, 0)
+        recs = list(msgpack.Unpacker(io.BytesIO(stream.getvalue())))
+        self.assertEqual(recs[1]['data'], {'raw': h2b('010203040506')})
+
 # TODO: Tests for TS 102 221 / 31.102 ApduCommands
 
 class TestUsimAuth(unittest.TestCase):
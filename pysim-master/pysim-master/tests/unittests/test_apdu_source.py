@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+import os
+import struct
+import tempfile
+import unittest
+from osmocom.utils import h2b, b2h
+
+from pySim.apdu import CardReset
+from pySim.apdu_source.gsmtap_pcap import *
+
+PCAPNG_FILE = 'tests/pySim-trace_test/pySim-trace_test_gsmtap.pcapng'
+
+def gsmtap_sim(sub_type: int, body: bytes) -> bytes:
+    return bytes([GSMTAP_VERSION, 4, GSMTAP_TYPE_SIM]) + bytes(9) + bytes([sub_type]) + bytes(3) + body
+
+def ipv4_udp(payload: bytes, dport: int = GSMTAP_UDP_PORT, sport: int = 12345) -> bytes:
+    udp = struct.pack('>HHHH', sport, dport, 8 + len(payload), 0) + payload
+    return struct.pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 0, 0, 64, 17, 0,
+                       b'\x7f\x00\x00\x01', b'\x7f\x00\x00\x01') + udp
+
+def ethernet(ip: bytes) -> bytes:
+    # VLAN tagged; padded to the minimum Ethernet frame size
+    frame = bytes(12) + b'\x81\x00\x00\x01\x08\x00' + ip
+    return frame + bytes(max(0, 60 - len(frame)))
+
+def pcap_file(packets, endian: str = '<', linktype: int = LINKTYPE_ETHERNET) -> bytes:
+    ret = struct.pack(endian + 'IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, linktype)
+    for n, pkt in enumerate(packets):
+        ret += struct.pack(endian + 'IIII', 1700000000 + n, 500000, len(pkt), len(pkt)) + pkt
+    return ret
+
+class GsmtapPcap_Test(unittest.TestCase):
+    def test_pcapng(self):
+        source = GsmtapPcapApduSource(PCAPNG_FILE)
+        apdus = []
+        with self.assertRaises(StopIteration):
+            while True:
+                apdus.append(source.read())
+        self.assertIsInstance(apdus[0], CardReset)
+        self.assertEqual(b2h(apdus[0].atr), '3b9f96801f878031e073fe211b674a4c753034054ba9')
+        self.assertEqual(len(apdus), 682)
+        self.assertTrue(source.timestamp > 1.6e9)
+
+    def test_pcap(self):
+        packets = [gsmtap_sim(GSMTAP_SIM_ATR, h2b('3b9f96801f878031e073fe211b674a4c753034054ba9')),
+                   gsmtap_sim(GSMTAP_SIM_APDU, h2b('00a40004023f00') + h2b('9000')),
+                   gsmtap_sim(GSMTAP_SIM_APDU, h2b('00b0000002') + h2b('01029000'))]
+        for endian in ['<', '>']:
+            with self.subTest(endian=endian):
+                frames = [ethernet(ipv4_udp(packets[0])),
+                          # some other UDP traffic
+                          ethernet(ipv4_udp(b'\x00' * 20, dport=53)),
+                          ethernet(ipv4_udp(packets[1])),
+                          ethernet(ipv4_udp(packets[2]))]
+                with tempfile.TemporaryDirectory() as tmpdir:
+                    fname = os.path.join(tmpdir, 'trace.pcap')
+                    with open(fname, 'wb') as f:
+                        f.write(pcap_file(frames, endian))
+                    source = GsmtapPcapApduSource(fname)
+                    self.assertIsInstance(source.read(), CardReset)
+                    select = source.read()
+                    self.assertEqual(select.ins, 0xa4)
+                    self.assertEqual(select.cmd_data, h2b('3f00'))
+                    # the Ethernet padding must not end up in the APDU
+                    self.assertEqual(select.sw, h2b('9000'))
+                    read = source.read()
+                    self.assertEqual(read.rsp_data, h2b('0102'))
+                    self.assertEqual(source.timestamp, 1700000003.5)
+                    with self.assertRaises(StopIteration):
+                        source.read()
+
+    def test_senders(self):
+        packets = [(1111, gsmtap_sim(GSMTAP_SIM_ATR, h2b('3b00'))),
+                   (2222, gsmtap_sim(GSMTAP_SIM_ATR, h2b('3b01'))),
+                   (1111, gsmtap_sim(GSMTAP_SIM_APDU, h2b('00a40004023f00') + h2b('9000'))),
+                   (2222, gsmtap_sim(GSMTAP_SIM_APDU, h2b('00a40004022f00') + h2b('9000')))]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fname = os.path.join(tmpdir, 'trace.pcap')
+            with open(fname, 'wb') as f:
+                f.write(pcap_file([ethernet(ipv4_udp(p, sport=sport)) for sport, p in packets]))
+            self.assertEqual(gsmtap_pcap_senders(fname), ['127.0.0.1:1111', '127.0.0.1:2222'])
+            source = GsmtapPcapApduSource(fname, sender='127.0.0.1:2222')
+            self.assertEqual(source.read().atr, h2b('3b01'))
+            self.assertEqual(source.read().cmd_data, h2b('2f00'))
+            with self.assertRaises(StopIteration):
+                source.read()
+
+    def test_udp_payload(self):
+        ip = ipv4_udp(b'foo')
+        self.assertEqual(bytes(udp_payload(LINKTYPE_RAW, memoryview(ip), GSMTAP_UDP_PORT)[2]), b'foo')
+        src, sport, payload = udp_payload(LINKTYPE_ETHERNET, memoryview(ethernet(ip)), GSMTAP_UDP_PORT)
+        self.assertEqual(format_sender(src, sport), '127.0.0.1:12345')
+        self.assertEqual(bytes(payload), b'foo')
+        sll = bytes(14) + b'\x08\x00' + ip
+        self.assertEqual(bytes(udp_payload(LINKTYPE_LINUX_SLL, memoryview(sll), GSMTAP_UDP_PORT)[2]), b'foo')
+        self.assertEqual(parse_sender('[::1]:4729'), (bytes(15) + b'\x01', 4729))
+        self.assertIsNone(udp_payload(LINKTYPE_RAW, memoryview(ip), 1234))
+        self.assertIsNone(udp_payload(12345, memoryview(ip), GSMTAP_UDP_PORT))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import io
+import unittest
+import contextlib
+
+from pySim.transport import LinkBase
+from pySim.app import init_card
+from pySim.runtime import RuntimeState
+from pySim.ts_102_221 import CardProfileUICC
+
+EID = '89049032123451234512345678901235'
+
+class FakeCardLink(LinkBase):
+    """Link to a (very) generic card: Answers every APDU with 9000 and no data, except for the APDUs
+    starting (after CLA) with one of the prefixes listed in 'responses'; the longest prefix wins."""
+    def __init__(self, responses: dict = {}, **kwargs):
+        super().__init__(**kwargs)
+        self.responses = responses
+        self.apdus = []
+
+    def __str__(self):
+        return 'fake'
+
+    def _send_apdu_raw(self, pdu):
+        self.apdus.append(pdu.lower())
+        for prefix in sorted(self.responses, key=len, reverse=True):
+            if pdu[2:].lower().startswith(prefix):
+                return self.responses[prefix]
+        return '', '9000'
+
+    def get_atr(self):
+        return [0x3b, 0x00]
+
+    def wait_for_card(self, timeout=None, newcardonly=False):
+        pass
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def _reset_card(self):
+        return 1
+
+class InitCard_Test(unittest.TestCase):
+    def init_card(self, sl: LinkBase):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return init_card(sl)
+
+    def test_uicc(self):
+        # STORE DATA (GetEuiccData) is not supported: not an eUICC
+        sl = FakeCardLink({'e2': ('', '6d00')})
+        rs, _card = self.init_card(sl)
+        self.assertIsInstance(rs, RuntimeState)
+        self.assertIsInstance(rs.profile, CardProfileUICC)
+        self.assertNotIn('EID', rs.identity)
+
+    def test_euicc(self):
+        # STORE DATA: GetEuiccData with a tag list containing only the EID
+        sl = FakeCardLink({'e2': ('', '6a88'), 'e2910006bf3e035c015a': ('bf3e125a10' + EID, '9000')})
+        rs, _card = self.init_card(sl)
+        self.assertEqual(rs.identity['EID'], EID)
+
+if __name__ == "__main__":
+    unittest.main()
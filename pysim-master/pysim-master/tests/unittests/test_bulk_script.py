@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import argparse
+import tempfile
+import importlib.util
+import multiprocessing
+import unittest
+from unittest import mock
+
+SHELL_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'pySim-shell.py')
+
+def load_shell():
+    """Import pySim-shell.py as a module (its __main__ part is not executed)."""
+    spec = importlib.util.spec_from_file_location('pysim_shell', SHELL_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def fake_worker(worker_nr, reader_opts, ch_config, opts, results):
+    """Stands in for bulk_script_worker: reader 0 processes two cards (one fails), reader 1 one card.
+    The reader options are reported as 'transcript', so that the test can check them."""
+    transcript = '%s/%s/%s' % (reader_opts.pcsc_dev, reader_opts.pcsc_shared, reader_opts.pcsc_protocol)
+    if worker_nr == 0:
+        results.put((worker_nr, 0, transcript))
+        results.put((worker_nr, -1, transcript))
+    else:
+        results.put((worker_nr, 0, transcript))
+    results.put((worker_nr, None, None))
+
+def dying_worker(worker_nr, reader_opts, ch_config, opts, results):
+    """Like fake_worker, but the worker of reader 1 is killed before it can report anything."""
+    if worker_nr == 1:
+        os._exit(3)
+    fake_worker(worker_nr, reader_opts, ch_config, opts, results)
+
+@unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), 'requires fork()')
+class BulkScriptParallel_Test(unittest.TestCase):
+    def setUp(self):
+        try:
+            self.shell = load_shell()
+        except ImportError as e:
+            # e.g. pyscard not being installed
+            self.skipTest('cannot import pySim-shell: %s' % e)
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.output = []
+        # only the attributes/methods used by _bulk_script_parallel
+        self.app = mock.Mock(spec=['equip', 'sl', 'poutput', 'card_cache', 'reader_opts',
+                                   '_show_success_sign', '_show_failure_sign'])
+        self.app.poutput.side_effect = self.output.append
+        self.app.reader_opts = argparse.Namespace(pcsc_dev=None, pcsc_regex='Reader', pcsc_shared=True,
+                                                  pcsc_protocol='T1')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_bulk_script(self, init_card_side_effect, worker=fake_worker):
+        opts = self.shell.PysimApp.bulk_script_parser.parse_args(['script.txt', '--pcsc_devices', '3,4',
+                                                                  '--transcript_dir', self.tmpdir.name])
+        with mock.patch.object(self.shell, 'bulk_script_worker', worker), \
+             mock.patch('pySim.app.init_card', side_effect=init_card_side_effect) as init_card:
+            self.shell.PysimApp._bulk_script_parallel(self.app, opts)
+        return init_card
+
+    def test_results(self):
+        init_card = self.run_bulk_script([('rs', 'card')])
+        self.assertIn("Statistics: success :2, failure: 1", self.output[-1])
+        self.app._show_failure_sign.assert_called_once_with()
+        self.assertIn("Reader 3: failure, transcript: 3/True/T1", self.output)
+        self.assertIn("Reader 4: success, transcript: 4/True/T1", self.output)
+        # the reader is released for the workers and taken back afterwards
+        self.app.sl.disconnect.assert_called_once_with()
+        init_card.assert_called_once_with(self.app.sl, self.app.card_cache)
+        self.assertEqual(self.app.equip.call_args_list, [mock.call(None, None), mock.call('card', 'rs')])
+
+    def test_no_card_afterwards(self):
+        self.run_bulk_script(Exception('no card'))
+        self.assertEqual(self.app.equip.call_args_list, [mock.call(None, None)])
+        self.assertTrue(any('failed after bulk_script: no card' in l for l in self.output))
+
+    def test_worker_died(self):
+        """A worker that dies without telling us must not make us wait forever."""
+        self.run_bulk_script([('rs', 'card')], dying_worker)
+        self.assertIn("Reader 4: failure, worker 1 exited unexpectedly (exit code 3)", self.output)
+        self.assertIn("Statistics: success :1, failure: 2", self.output[-1])
+        self.assertEqual(self.app.equip.call_args_list, [mock.call(None, None), mock.call('card', 'rs')])
+
+    def test_prefetch(self):
+        path = os.path.join(self.tmpdir.name, 'iccids.txt')
+        with open(path, 'w') as f:
+            f.write('8949440000001155314\n\n8988211000000467343\n')
+        with mock.patch.object(self.shell, 'card_key_provider_prefetch') as prefetch:
+            self.shell.PysimApp._bulk_script_prefetch(self.app, path)
+        prefetch.assert_called_once_with('ICCID', ['8949440000001155314', '8988211000000467343'])
+
+if __name__ == "__main__":
+    unittest.main()
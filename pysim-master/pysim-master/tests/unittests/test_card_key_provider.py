@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from Cryptodome.Cipher import AES
+from osmocom.utils import h2b, b2h
+
+from pySim.card_key_provider import *
+
+KEY = '000102030405060708090a0b0c0d0e0f'
+
+def encrypt(val: str) -> str:
+    cipher = AES.new(h2b(KEY), AES.MODE_CBC, CardKeyProviderCsv.IV)
+    return b2h(cipher.encrypt(h2b(val)))
+
+SCP03_ENC = '51d4fc44bcba7c4589dfada3297720af112788f75d15f678f51a8eb606766b16'
+
+class CardKeyProviderCsv_Test(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'card_data.csv')
+        with open(self.filename, 'w') as f:
+            f.write('iccid,imsi,adm1,SCP03_ENC_ISDR\n')
+            f.write('8949440000001155314,001010000000001,34173960,%s\n' % encrypt(SCP03_ENC))
+            f.write('"8988211000000467343","001010000000002","67225880","%s"\n' % encrypt(SCP03_ENC[::-1]))
+        self.ckp = CardKeyProviderCsv(self.filename, {'SCP03_ISDR': KEY})
+
+    def tearDown(self):
+        self.ckp.csv_file.close()
+        self.tmpdir.cleanup()
+
+    def test_get(self):
+        self.assertEqual(self.ckp.get(['ADM1'], 'ICCID', '8988211000000467343'), {'ADM1': '67225880'})
+        self.assertEqual(self.ckp.get_field('ADM1', 'IMSI', '001010000000001'), '34173960')
+        self.assertEqual(self.ckp.get(['ADM1'], 'ICCID', '1234'), {})
+        with self.assertRaises(RuntimeError):
+            self.ckp.get(['PIN1'], 'ICCID', '8949440000001155314')
+
+    def test_decrypt(self):
+        self.assertEqual(self.ckp.get_field('SCP03_ENC_ISDR', 'ICCID', '8949440000001155314'), SCP03_ENC)
+        self.assertEqual(self.ckp.get_field('SCP03_ENC_ISDR', 'ICCID', '8988211000000467343'), SCP03_ENC[::-1])
+
+    def test_persisted_index(self):
+        self.ckp.get_field('ADM1', 'ICCID', '8949440000001155314')
+        self.assertTrue(os.path.isfile(self.filename + '.idx'))
+        ckp = CardKeyProviderCsv(self.filename, {})
+        self.assertTrue(ckp._load_index(os.stat(self.filename)))
+        self.assertEqual(ckp.get_field('ADM1', 'ICCID', '8988211000000467343'), '67225880')
+        ckp.csv_file.close()
+
+    def test_rebuild_on_change(self):
+        self.assertEqual(self.ckp.get_field('ADM1', 'ICCID', '8949440000001155314'), '34173960')
+        with open(self.filename, 'a') as f:
+            f.write('8949440000001155322,001010000000003,11111111,\n')
+        self.assertEqual(self.ckp.get_field('ADM1', 'ICCID', '8949440000001155322'), '11111111')
+
+    def test_multiline_record(self):
+        with open(self.filename, 'a') as f:
+            f.write('8949440000001155330,001010000000004,"multi\nline",\n')
+            f.write('8949440000001155348,001010000000005,22222222,\n')
+        self.assertEqual(self.ckp.get_field('ADM1', 'ICCID', '8949440000001155330'), 'multi\nline')
+        self.assertEqual(self.ckp.get_field('ADM1', 'IMSI', '001010000000005'), '22222222')
+        self.assertEqual(self.ckp.get(['ADM1'], 'ICCID', 'line"'), {})
+
+    def test_many_rows(self):
+        with open(self.filename, 'a') as f:
+            for i in range(1000):
+                f.write('89494400000011%05u,0010100000%05u,%08u,\n' % (i, i, i))
+            # duplicate: the last row wins
+            f.write('8949440000001100500,001010000099999,99999999,\n')
+        for i in [0, 1, 499, 999]:
+            self.assertEqual(self.ckp.get_field('ADM1', 'ICCID', '89494400000011%05u' % i), '%08u' % i)
+        self.assertEqual(self.ckp.get_field('ADM1', 'ICCID', '8949440000001100500'), '99999999')
+        for iccid in ['', '8949440000001101000', '894944000000110000', '89494400000011000000', '9']:
+            self.assertEqual(self.ckp.get(['ADM1'], 'ICCID', iccid), {})
+
+class CardKeyProviderSqlite_Test(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'card_data.db')
+        conn = sqlite3.connect(self.filename)
+        conn.execute('CREATE TABLE card_data (iccid TEXT, imsi TEXT, adm1 TEXT, scp03_enc_isdr TEXT)')
+        for i in range(1000):
+            conn.execute('INSERT INTO card_data VALUES (?, ?, ?, ?)',
+                         ('89494400000011%05u' % i, '0010100000%05u' % i, '%08u' % i, encrypt(SCP03_ENC)))
+        conn.commit()
+        conn.close()
+        self.ckp = CardKeyProviderSqlite(self.filename, {'SCP03_ISDR': KEY})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_index(self):
+        indexes = [r[1] for r in self.ckp.conn().execute('PRAGMA index_list(card_data)')]
+        self.assertEqual(sorted(indexes), ['idx_card_data_iccid', 'idx_card_data_imsi'])
+
+    def test_read_only(self):
+        self.ckp.conn().execute('DROP INDEX idx_card_data_imsi')
+        self.ckp.conn().commit()
+        connect = sqlite3.connect
+        def connect_ro(filename):
+            return connect('file:%s?mode=ro' % filename, uri=True)
+        with mock.patch('sqlite3.connect', connect_ro), \
+             self.assertLogs('pySim.card_key_provider', 'WARNING') as logs:
+            ckp = CardKeyProviderSqlite(self.filename, {})
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("column 'IMSI'", logs.output[0])
+        # look-ups still work, just without the index
+        self.assertEqual(ckp.get_field('ADM1', 'IMSI', '001010000000999'), '00000999')
+
+    def test_get(self):
+        self.assertEqual(self.ckp.get(['ADM1', 'SCP03_ENC_ISDR'], 'ICCID', '8949440000001100042'),
+                         {'ADM1': '00000042', 'SCP03_ENC_ISDR': SCP03_ENC})
+        self.assertEqual(self.ckp.get_field('ADM1', 'IMSI', '001010000000999'), '00000999')
+        self.assertEqual(self.ckp.get(['ADM1'], 'ICCID', '1234'), {})
+        with self.assertRaises(RuntimeError):
+            self.ckp.get(['PIN1'], 'ICCID', '8949440000001100042')
+        with self.assertRaises(RuntimeError):
+            self.ckp.get(['ADM1'], 'EID', '1234')
+
+    def test_prefetch(self):
+        provider_list = []
+        card_key_provider_register(self.ckp, provider_list)
+        iccids = ['89494400000011%05u' % i for i in range(0, 1000, 2)] + ['1234']
+        card_key_provider_prefetch('ICCID', iccids, provider_list)
+        self.assertEqual(len(self.ckp._prefetched), 500)
+        self.assertEqual(card_key_provider_get(['ADM1'], 'ICCID', '8949440000001100998', provider_list),
+                         {'ADM1': '00000998'})
+        # cards outside of the prefetched batch are still found
+        self.assertEqual(card_key_provider_get_field('ADM1', 'ICCID', '8949440000001100999', provider_list),
+                         '00000999')
+
+if __name__ == "__main__":
+    unittest.main()
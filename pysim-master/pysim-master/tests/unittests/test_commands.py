@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+import unittest
+import asyncio
+import threading
+
+from pySim.transport import LinkBase
+from pySim.commands import SimCardCommands, build_apdu
+from pySim.transport.aio import AsyncLink, AsyncSimCardCommands
+
+# GSM 11.11 style select responses (byte 7 = type of file)
+RSP_DF = '000000000000020000000000000000'
+RSP_EF = '0000000a0000040000000000000005'
+
+class FakeSimLink(LinkBase):
+    """Link that answers every APDU with a canned response and records the APDUs sent."""
+    name = 'fake'
+
+    def __init__(self, ext_len: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.apdus = []
+        self.sw = '9000'
+        # record length reported in RSP_EF and returned by READ RECORD with Le=00
+        self.rec_len = 5
+        self._supports_ext_len = ext_len
+
+    def __str__(self):
+        return 'fake'
+
+    def _send_apdu_raw(self, pdu):
+        self.apdus.append(pdu.lower())
+        if pdu[2:4].lower() == 'a4':
+            if pdu[-4:].lower()[0] in ['3', '7', '5']:
+                return RSP_DF, self.sw
+            return RSP_EF, self.sw
+        if pdu[2:4].lower() == 'b2' and pdu[8:10] == '00':
+            # READ RECORD without knowing the record length (by SFI): the card returns the whole record
+            return '00' * self.rec_len, self.sw
+        if len(pdu) == 14 and pdu[8:10] == '00':
+            # extended length case 2 APDU
+            return '00' * int(pdu[10:14], 16), self.sw
+        return '00' * int(pdu[8:10], 16), self.sw
+
+    def supports_ext_length(self):
+        return self._supports_ext_len
+
+    def wait_for_card(self, timeout=None, newcardonly=False):
+        pass
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def _reset_card(self):
+        return 1
+
+    def selects(self):
+        return [a[-4:] for a in self.apdus if a[2:4] == 'a4']
+
+class SelectionCache_Test(unittest.TestCase):
+    def setUp(self):
+        self.tp = FakeSimLink()
+        self.scc = SimCardCommands(self.tp)
+
+    def test_same_path(self):
+        for i in range(3):
+            self.scc.read_record(['3f00', '7f10', '6f3a'], i + 1)
+        self.assertEqual(self.tp.selects(), ['3f00', '7f10', '6f3a'])
+
+    def test_sibling_ef(self):
+        self.scc.read_binary(['3f00', '7f20', '6f07'])
+        self.scc.read_binary(['3f00', '7f20', '6f38'])
+        self.assertEqual(self.tp.selects(), ['3f00', '7f20', '6f07', '6f38'])
+
+    def test_below_df(self):
+        self.scc.select_path(['3f00', '7f20'])
+        self.scc.read_binary(['3f00', '7f20', '6f07'])
+        self.assertEqual(self.tp.selects(), ['3f00', '7f20', '6f07'])
+
+    def test_parent_df(self):
+        self.scc.read_binary(['3f00', '7f20', '6f07'])
+        self.scc.select_path(['3f00', '7f20'])
+        self.assertEqual(self.tp.selects(), ['3f00', '7f20', '6f07', '3f00', '7f20'])
+
+    def test_single_fid(self):
+        self.scc.select_file('6F07')
+        self.scc.read_binary('6f07')
+        self.scc.binary_size('6f07')
+        self.assertEqual(self.tp.selects(), ['6f07'])
+
+    def test_forked_lchan_shares_cache(self):
+        scc2 = self.scc.fork_lchan(0)
+        self.scc.read_binary(['3f00', '2fe2'])
+        scc2.read_binary(['3f00', '2fe2'])
+        self.assertEqual(self.tp.selects(), ['3f00', '2fe2'])
+
+    def test_invalidate_reset(self):
+        self.scc.read_binary(['3f00', '2fe2'])
+        self.scc.reset_card()
+        self.scc.read_binary(['3f00', '2fe2'])
+        self.assertEqual(self.tp.selects(), ['3f00', '2fe2'] * 2)
+
+    def test_invalidate_manage_channel(self):
+        self.scc.read_binary(['3f00', '2fe2'])
+        self.scc.manage_channel('open', 1)
+        self.scc.read_binary(['3f00', '2fe2'])
+        self.assertEqual(self.tp.selects(), ['3f00', '2fe2'] * 2)
+
+    def test_invalidate_raw_select(self):
+        self.scc.read_binary(['3f00', '2fe2'])
+        self.tp.send_apdu('a0a40000023f00')
+        self.scc.read_binary(['3f00', '2fe2'])
+        self.assertEqual(self.tp.selects(), ['3f00', '2fe2', '3f00', '3f00', '2fe2'])
+
+    def test_invalidate_error_sw(self):
+        self.scc.read_binary(['3f00', '2fe2'])
+        self.tp.sw = '6a82'
+        with self.assertRaises(Exception):
+            self.scc.read_binary(['3f00', '2fe2'])
+        self.tp.sw = '9000'
+        self.scc.read_binary(['3f00', '2fe2'])
+        self.assertEqual(self.tp.selects(), ['3f00', '2fe2'] * 2)
+
+class BulkRecords_Test(unittest.TestCase):
+    def setUp(self):
+        self.tp = FakeSimLink()
+        self.scc = SimCardCommands(self.tp)
+
+    def test_read_records(self):
+        (records, sw) = self.scc.read_records(['3f00', '7f10', '6f3a'], range(1, 4))
+        self.assertEqual(sw, '9000')
+        self.assertEqual(list(records.keys()), [1, 2, 3])
+        self.assertEqual(records[1], '0000000000')
+        self.assertEqual(self.tp.selects(), ['3f00', '7f10', '6f3a'])
+        self.assertEqual([a for a in self.tp.apdus if a[2:4] == 'b2'],
+                         ['a0b2010405', 'a0b2020405', 'a0b2030405'])
+
+    def test_read_all_records(self):
+        # file size 10, record length 5
+        (records, _sw) = self.scc.read_records(['3f00', '7f10', '6f3a'])
+        self.assertEqual(list(records.keys()), [1, 2])
+
+    def test_update_records(self):
+        self.scc.update_records(['3f00', '7f10', '6f3a'], {1: '0102', 3: '03'})
+        self.assertEqual(self.tp.selects(), ['3f00', '7f10', '6f3a'])
+        self.assertEqual([a for a in self.tp.apdus if a[2:4] == 'dc'],
+                         ['a0dc0104050102ffffff', 'a0dc03040503ffffffff'])
+
+    def test_update_records_conserve(self):
+        self.scc.update_records(['3f00', '7f10', '6f3a'], {1: '0000000000', 2: '01'}, conserve=True)
+        self.assertEqual([a for a in self.tp.apdus if a[2:4] == 'dc'], ['a0dc02040501ffffffff'])
+
+class SfiRead_Test(unittest.TestCase):
+    def setUp(self):
+        self.tp = FakeSimLink()
+        self.scc = SimCardCommands(self.tp)
+
+    def reads(self):
+        return [a for a in self.tp.apdus if a[2:4] in ['b0', 'b2']]
+
+    def test_read_binary_df_selected(self):
+        self.scc.select_path(['3f00', '7f20'])
+        self.assertEqual(self.scc.read_binary(['3f00', '7f20', '6f07'], 9, sfi=0x07), ('00' * 9, '9000'))
+        self.scc.read_binary(['3f00', '7f20', '6f38'], 4, sfi=0x04)
+        self.assertEqual(self.tp.selects(), ['3f00', '7f20'])
+        self.assertEqual(self.reads(), ['a0b0870009', 'a0b0840004'])
+        # the DF is still known to be selected, the EF is not
+        self.scc.read_binary(['3f00', '7f20', '6f07'], 9)
+        self.assertEqual(self.tp.selects(), ['3f00', '7f20', '6f07'])
+
+    def test_read_binary_sibling_selected(self):
+        self.scc.read_binary(['3f00', '7f20', '6f07'], 9)
+        self.scc.read_binary(['3f00', '7f20', '6f38'], 300, offset=2, sfi=0x04)
+        self.scc.read_binary(['3f00', '7f20', '6f07'], 9)
+        self.assertEqual(self.tp.selects(), ['3f00', '7f20', '6f07', '6f07'])
+        self.assertEqual(self.reads()[1:3], ['a0b08402ff', 'a0b001012d'])
+
+    def test_read_binary_df_not_selected(self):
+        self.scc.read_binary(['3f00', '7f20', '6f07'], 9, sfi=0x07)
+        self.scc.read_binary(['3f00', '7f10', '6f38'], 9, sfi=0x04)
+        self.assertEqual(self.tp.selects(), ['3f00', '7f20', '6f07', '3f00', '7f10', '6f38'])
+        self.assertEqual(self.reads(), ['a0b0000009', 'a0b0000009'])
+
+    def test_read_records(self):
+        self.scc.select_path(['3f00', '7f10'])
+        self.scc.read_record(['3f00', '7f10', '6f3a'], 1, sfi=0x01)
+        (records, _sw) = self.scc.read_records(['3f00', '7f10', '6f3b'], range(1, 3), sfi=0x02)
+        self.assertEqual(records, {1: '00' * 5, 2: '00' * 5})
+        self.assertEqual(self.tp.selects(), ['3f00', '7f10'])
+        # the record length returned for the first record (read by SFI) is used for the following ones
+        self.assertEqual(self.reads(), ['a0b2010c00', 'a0b2011400', 'a0b2020405'])
+
+    def test_invalid_sfi(self):
+        with self.assertRaises(ValueError):
+            self.scc.read_binary_sfi_bin(0x1f, 1)
+        with self.assertRaises(ValueError):
+            self.scc.read_record_sfi(0, 1)
+
+class BinaryApdu_Test(unittest.TestCase):
+    def setUp(self):
+        self.tp = FakeSimLink()
+        self.scc = SimCardCommands(self.tp)
+
+    def test_send_apdu_bin(self):
+        (data, sw) = self.scc.send_apdu_checksw_bin(b'\xa0\xb0\x00\x00\x03')
+        self.assertEqual(data, b'\x00\x00\x00')
+        self.assertEqual(sw, '9000')
+        self.assertEqual(self.scc.send_apdu_checksw('a0b0000002'), ('0000', '9000'))
+
+    def test_read_binary_chunks(self):
+        (data, sw) = self.scc.read_binary_bin(['3f00', '2fe2'], 600)
+        self.assertEqual(data, bytes(600))
+        self.assertEqual([a[:10] for a in self.tp.apdus if a[2:4] == 'b0'],
+                         ['a0b00000ff', 'a0b000ffff', 'a0b001fe5a'])
+        self.assertEqual(self.scc.read_binary(['3f00', '2fe2'], 2), ('0000', '9000'))
+
+    def test_update_binary_chunks(self):
+        self.scc.update_binary(['3f00', '2fe2'], '01' * 300)
+        self.assertEqual([a for a in self.tp.apdus if a[2:4] == 'd6'],
+                         ['a0d60000ff' + '01' * 255, 'a0d600ff2d' + '01' * 45])
+
+    def test_send_method_required(self):
+        class BareLink(LinkBase):
+            def __str__(self):
+                return 'bare'
+            wait_for_card = connect = disconnect = _reset_card = FakeSimLink.connect
+        with self.assertRaises(TypeError):
+            BareLink()
+
+        class BinLink(BareLink):
+            def _send_apdu_raw_bin(self, pdu):
+                return b'', '9000'
+        self.assertEqual(SimCardCommands(BinLink()).send_apdu_checksw('a0b0000000'), ('', '9000'))
+
+class ExtendedLength_Test(unittest.TestCase):
+    def test_build_apdu(self):
+        self.assertEqual(build_apdu(b'\x00\xb0\x00\x00', le=255), b'\x00\xb0\x00\x00\xff')
+        self.assertEqual(build_apdu(b'\x00\xb0\x00\x00', le=256), b'\x00\xb0\x00\x00\x00')
+        self.assertEqual(build_apdu(b'\x00\xb0\x00\x00', le=4096), b'\x00\xb0\x00\x00\x00\x10\x00')
+        self.assertEqual(build_apdu(b'\x00\xd6\x00\x00', b'\x01' * 3), b'\x00\xd6\x00\x00\x03\x01\x01\x01')
+        self.assertEqual(build_apdu(b'\x00\xd6\x00\x00', b'\x01' * 300)[:7], b'\x00\xd6\x00\x00\x00\x01\x2c')
+        self.assertEqual(build_apdu(b'\x00\xe2\x00\x00', b'\x01' * 300, le=0)[-2:], b'\x00\x00')
+
+    def test_not_supported(self):
+        tp = FakeSimLink()
+        tp.set_ext_length((0xffff, 0x10000))
+        self.assertIsNone(tp.ext_len)
+        self.assertEqual(SimCardCommands(tp).max_cmd_len, 255)
+
+    def test_read_update_binary(self):
+        tp = FakeSimLink(ext_len=True)
+        tp.set_ext_length((0xffff, 0x10000))
+        self.assertEqual(tp.ext_len, (tp.EXT_LEN_MAX, tp.EXT_LEN_MAX))
+        scc = SimCardCommands(tp)
+        (data, _sw) = scc.read_binary_bin(['3f00', '2fe2'], 5000)
+        self.assertEqual(data, bytes(5000))
+        self.assertEqual([a[:14] for a in tp.apdus if a[2:4] == 'b0'], ['a0b00000001000', 'a0b01000000388'])
+        scc.update_binary(['3f00', '2fe2'], '01' * 300)
+        self.assertEqual([a for a in tp.apdus if a[2:4] == 'd6'], ['a0d6000000012c' + '01' * 300])
+        # a reset disables extended length APDUs until the card has been probed again
+        tp.reset_card()
+        self.assertIsNone(tp.ext_len)
+
+class AsyncCommands_Test(unittest.TestCase):
+    def test_concurrent_links(self):
+        tps = [FakeSimLink() for i in range(4)]
+        threads = {}
+        def record_thread(tp):
+            orig = tp._send_apdu_raw
+            def _send_apdu_raw(pdu):
+                threads.setdefault(id(tp), set()).add(threading.get_ident())
+                return orig(pdu)
+            tp._send_apdu_raw = _send_apdu_raw
+        for tp in tps:
+            record_thread(tp)
+
+        async def run():
+            alinks = [AsyncLink(tp) for tp in tps]
+            sccs = [AsyncSimCardCommands(alink) for alink in alinks]
+            sccs[0].cla_byte = '00'
+            self.assertEqual(sccs[0].scc.cla_byte, '00')
+            ret = await asyncio.gather(*[scc.read_binary(['3f00', '2fe2'], 10) for scc in sccs],
+                                       *[scc.read_record(['3f00', '7f10', '6f3a'], 1) for scc in sccs])
+            for alink in alinks:
+                alink.close()
+            return ret
+
+        ret = asyncio.run(run())
+        self.assertEqual(ret[0], ('00' * 10, '9000'))
+        self.assertEqual(ret[4], ('00' * 5, '9000'))
+        self.assertEqual(tps[0].apdus[0][:2], '00')
+        self.assertEqual(tps[1].selects(), ['3f00', '2fe2', '7f10', '6f3a'])
+        # each link is served by one thread of its own
+        self.assertEqual(len(threads), 4)
+        self.assertTrue(all(len(t) == 1 for t in threads.values()))
+        self.assertEqual(len(set.union(*threads.values())), 4)
+
+if __name__ == "__main__":
+    unittest.main()
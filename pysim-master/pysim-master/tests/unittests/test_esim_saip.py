@@ -18,10 +18,14 @@
 import unittest
 import logging
 import copy
+import os
+import tempfile
+import random
 from osmocom.utils import h2b, b2h
 
 from pySim.esim.saip import *
 from pySim.esim.saip.personalization import *
+from pySim.esim.saip.batch import *
 from pprint import pprint as pp
 
 
@@ -52,6 +56,61 @@ class SaipTest(unittest.TestCase):
         self.assertEqual([x.type for x in self.pes.pe_list], self.expected_pet_list)
         self.assertEqual(len(self.pes.pes_by_naa), 4)
 
+    def test_incremental_index(self):
+        """Verify that append/extend/insert/remove maintain the same indexes as a full rebuild."""
+        def assert_index_equal(pes):
+            ref = ProfileElementSequence()
+            ref.pe_list = list(pes.pe_list)
+            ref._process_pelist()
+            self.assertEqual(pes.pe_by_type, ref.pe_by_type)
+            self.assertEqual(pes.pes_by_naa, ref.pes_by_naa)
+            self.assertEqual([pe.identification for pe in pes.pe_list if pe.header],
+                             list(range(1, len([pe for pe in pes.pe_list if pe.header]) + 1)))
+
+        pes = ProfileElementSequence()
+        pes.extend(copy.deepcopy(self.pes.pe_list))
+        self.assertEqual([x.type for x in pes.pe_list], self.expected_pet_list)
+        assert_index_equal(pes)
+
+        pes.remove(pes.get_pes_for_type('usim')[0])
+        assert_index_equal(pes)
+        pes.remove(pes.get_pes_for_type('rfm')[1])
+        assert_index_equal(pes)
+        pes.insert(3, ProfileElementUSIM())
+        assert_index_equal(pes)
+        pes.insert(-1, ProfileElementPin())
+        assert_index_equal(pes)
+        pes.add_ssd(ProfileElementSSD())
+        assert_index_equal(pes)
+
+    def test_lazy_parse(self):
+        """Test that a lazily parsed sequence only decodes the PEs that are accessed."""
+        pes = ProfileElementSequence.from_der(self.per_input, lazy=True)
+        self.assertEqual([x.type for x in pes.pe_list], self.expected_pet_list)
+        self.assertEqual(len(pes.pes_by_naa), 4)
+        self.assertTrue(all('_lazy_der' in pe.__dict__ for pe in pes.pe_list))
+        self.assertEqual(pes.to_der(), self.per_input)
+        # accessing the header only decodes the header PE
+        self.assertEqual(pes.iccid, self.pes.iccid)
+        self.assertEqual(len([pe for pe in pes.pe_list if '_lazy_der' not in pe.__dict__]), 1)
+        # accessing the file system decodes all file-system bearing PEs
+        self.assertEqual(pes.mf.walk(lambda node, **kwargs: node.fid),
+                         self.pes.mf.walk(lambda node, **kwargs: node.fid))
+        self.assertEqual(pes.to_der(), self.per_input)
+
+    def test_lazy_personalization(self):
+        """Test that personalization of a lazily parsed sequence yields the same result."""
+        results = []
+        for lazy in [False, True]:
+            pes = ProfileElementSequence.from_der(self.per_input, lazy=lazy)
+            for p in [Iccid('984944000000115531'), Imsi('001010000000123'), Pin1('1111'),
+                      K(h2b('000102030405060708090a0b0c0d0e0f'))]:
+                p.validate()
+                p.apply(pes)
+            results.append(pes.to_der())
+        self.assertEqual(results[0], results[1])
+        self.assertNotEqual(results[0], self.per_input)
+
     def test_personalization(self):
         """Test some of the personalization operations."""
         pes = copy.deepcopy(self.pes)
@@ -83,6 +142,67 @@ class SaipTest(unittest.TestCase):
                 pes.append(inst)
                 pes.to_der()
 
+class CompiledTemplateTest(unittest.TestCase):
+    with open('smdpp-data/upp/TS48v2_SAIP2.3_NoBERTLV.der', 'rb') as f:
+        per_input = f.read()
+
+    @staticmethod
+    def params(n: int, pin1: str = '1111'):
+        return [Iccid('98944000000%07u' % n), Imsi('0010100000%05u' % n), Pin1(pin1), Adm1('%08u' % n),
+                K(h2b('%032x' % n)), Opc(h2b('%032x' % (n + 1000))), AlgorithmID(1)]
+
+    def personalize_slow(self, params):
+        pes = ProfileElementSequence.from_der(self.per_input)
+        for p in params:
+            p.validate()
+            p.apply(pes)
+        return pes.to_der()
+
+    def test_compile(self):
+        ct = CompiledTemplate(self.per_input, self.params(0))
+        self.assertEqual(ct.slow, [])
+        for n in [1, 42, 99999]:
+            with self.subTest(n):
+                self.assertEqual(ct.personalize(self.params(n)), self.personalize_slow(self.params(n)))
+
+    def test_deterministic(self):
+        ct1 = CompiledTemplate(self.per_input, self.params(0))
+        ct2 = CompiledTemplate(self.per_input, self.params(0))
+        self.assertEqual(ct1.base, ct2.base)
+        self.assertEqual(ct1.offsets, ct2.offsets)
+        ct3 = CompiledTemplate(self.per_input, self.params(0), seed=1)
+        self.assertNotEqual(ct1.base, ct3.base)
+        self.assertEqual(ct3.slow, [])
+
+    def test_probes(self):
+        ct = CompiledTemplate(self.per_input, [])
+        used = set()
+        rng = random.Random(0)
+        pins = ct._probes(Pin1('1111'), rng, used)
+        self.assertEqual(len(pins), ct.PROBE_SETS)
+        self.assertEqual(len(set(p.value for p in pins)), ct.PROBE_SETS)
+        # only three valid values, none of them may collide with the value bytes of other parameters
+        algo_ids = ct._probes(AlgorithmID(1), rng, used)
+        self.assertEqual(sorted(p.value for p in algo_ids), [1, 2, 3])
+        self.assertEqual(ct._probes(AlgorithmID(1), rng, used), [])
+
+    def test_length_mismatch(self):
+        """Test the fall-back to regular personalization if a value has a different length."""
+        ct = CompiledTemplate(self.per_input, self.params(0))
+        self.assertEqual(ct.personalize(self.params(1, pin1='12345678')),
+                         self.personalize_slow(self.params(1, pin1='12345678')))
+
+    def test_personalize_csv(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_filename = os.path.join(tmpdir, 'batch.csv')
+            with open(csv_filename, 'w') as f:
+                f.write('ICCID,IMSI,K\n')
+                for n in range(3):
+                    f.write('98944000000%07u,0010100000%05u,%032x\n' % (n, n, n))
+            self.assertEqual(personalize_csv(self.per_input, csv_filename, tmpdir, processes=2), 3)
+            with open(os.path.join(tmpdir, '989440000000000002.der'), 'rb') as f:
+                self.assertEqual(f.read(), self.personalize_slow(self.params(2)[0:2] + [K(h2b('%032x' % 2))]))
+
 class OidTest(unittest.TestCase):
     def test_cmp(self):
         self.assertTrue(oid.OID('1.0') > oid.OID('0.9'))
@@ -16,6 +16,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import unittest
+from unittest import mock
 import logging
 from osmocom.utils import *
 
@@ -536,6 +537,81 @@ class filesystem_enc_dec_test(unittest.TestCase):
         do_encdec_test_raw(TransRecEF_raw())
 
 
+class Export_Test(unittest.TestCase):
+    """Export of EFs read by their SFI (the lchan is not asked for any FCP data then)."""
+    def test_lin_fixed_by_sfi(self):
+        ef = LinFixedEF(fid='6f40', sfid=0x03, name='EF.TEST', rec_len=(2, 2))
+        lchan = mock.Mock(spec=['read_record', 'read_record_dec'])
+        lchan.read_record.side_effect = [('0102', '9000'), ('0304', '9000'), SwMatchError('6a83', '9000')]
+        self.assertEqual(LinFixedEF.export(False, lchan, ef=ef), 'update_record 1 0102\nupdate_record 2 0304')
+        self.assertEqual(lchan.read_record.call_args_list, [mock.call(r, ef=ef) for r in [1, 2, 3]])
+
+    def test_transparent_by_sfi(self):
+        ef = TransparentEF(fid='6f07', sfid=0x07, name='EF.TEST')
+        lchan = mock.Mock(spec=['read_binary', 'read_binary_dec'])
+        lchan.read_binary.return_value = ('0102', '9000')
+        self.assertEqual(TransparentEF.export(False, lchan, ef=ef), 'update_binary 0102')
+        lchan.read_binary.assert_called_once_with(ef=ef)
+
+
+class Selectables_Test(unittest.TestCase):
+    def setUp(self):
+        self.mf = CardMF()
+        self.df = CardDF(fid='7f10', name='DF.TELECOM')
+        self.ef = TransparentEF(fid='6f3a', name='EF.ADN')
+        self.mf.add_file(self.df)
+        self.df.add_file(self.ef)
+
+    def test_selectables(self):
+        sels = self.ef.get_selectables()
+        self.assertIs(sels['..'], self.df)
+        self.assertIs(sels['MF'], self.mf)
+        self.assertIs(sels['6f3a'], self.ef)
+        self.assertEqual(self.df.get_selectable_names(['FNAMES', 'SELF']), ['.', 'DF.TELECOM', 'EF.ADN'])
+        # cached result is re-used
+        self.assertIs(self.ef.get_selectables(), sels)
+        self.assertIs(self.df.get_selectables(['FIDS', 'SELF']), self.df.get_selectables(['SELF', 'FIDS']))
+
+    def test_selectables_flags(self):
+        # flags passed as tuple/set share the cache entry with the list, so must give the same result
+        self.assertEqual(self.ef.get_selectables(()), self.ef.get_selectables([]))
+        self.assertIn('EF.ADN', self.ef.get_selectables(()))
+        self.assertIs(self.df.get_selectables({'FIDS'}), self.df.get_selectables(['FIDS']))
+        self.assertEqual(self.mf.get_app_selectables(set()), self.mf.get_app_selectables())
+
+    def test_selectables_read_only(self):
+        with self.assertRaises(TypeError):
+            self.ef.get_selectables()['EF.FOO'] = self.ef
+        with self.assertRaises(TypeError):
+            self.mf.get_app_selectables()['ADF.FOO'] = self.ef
+
+    def test_invalidate_add_file(self):
+        self.assertNotIn('EF.FDN', self.ef.get_selectables())
+        self.assertNotIn('EF.FDN', self.df.get_selectable_names())
+        fdn = TransparentEF(fid='6f3b', name='EF.FDN')
+        self.df.add_file(fdn)
+        self.assertIs(self.ef.get_selectables()['EF.FDN'], fdn)
+        self.assertIn('EF.FDN', self.df.get_selectable_names())
+
+    def test_invalidate_add_application_df(self):
+        self.assertNotIn('ADF.TEST', self.ef.get_selectables())
+        self.assertEqual(self.mf.get_app_selectables(), {})
+        adf = CardADF(aid='a000000087', name='ADF.TEST')
+        self.mf.add_application_df(adf)
+        self.assertIs(self.ef.get_selectables()['ADF.TEST'], adf)
+        self.assertIs(self.mf.get_app_selectables(['AIDS'])['a000000087'], adf)
+
+    def test_detached_subtree(self):
+        # a DF populated before it is added to the MF
+        df = CardDF(fid='7f20', name='DF.GSM')
+        ef = TransparentEF(fid='6f07', name='EF.IMSI')
+        df.add_file(ef)
+        self.assertNotIn('MF', df.get_selectables())
+        self.mf.add_file(df)
+        self.assertIs(df.get_selectables()['MF'], self.mf)
+        self.assertIs(ef.get_selectables()['MF'], self.mf)
+
+
 if __name__ == '__main__':
     logger = logging.getLogger()
     logger.setLevel(logging.DEBUG)
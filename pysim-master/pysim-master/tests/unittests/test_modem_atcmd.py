@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+# (C) 2024 by sysmocom - s.f.m.c. GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import time
+import argparse
+import unittest
+from unittest import mock
+
+from osmocom.utils import h2b
+
+from pySim.transport import ApduTracer
+from pySim.transport.modem_atcmd import ModemATCommandLink
+from pySim.exceptions import ProtocolError
+
+class FakeSerial:
+    """Stands in for serial.Serial: A modem that answers the AT command lines written to it."""
+    def __init__(self, device, baudrate, timeout):
+        self.timeout = timeout
+        self.echo = False
+        self.rx = b''
+        # all command lines received, and the special responses to some of them
+        self.lines = []
+        self.responses = {}
+        # record length of the card's EF (answer to READ RECORD with another length: 6Cxx)
+        self.rec_len = 5
+
+    def reset_input_buffer(self):
+        self.rx = b''
+
+    def write(self, data: bytes) -> int:
+        line = data.rstrip(b'\r')
+        self.lines.append(line)
+        if self.echo:
+            self.rx += line + b'\r\r\n'
+        if line in self.responses:
+            self.rx += self.responses[line]
+        elif line.startswith(b'AT+CSIM='):
+            for pdu in re.findall(b'\\+CSIM=\\d+,"([0-9A-F]+)"', line):
+                rsp = self.csim(pdu.decode()).upper().encode()
+                self.rx += b'\r\n+CSIM: %d,"%s"\r\n' % (len(rsp), rsp)
+            self.rx += b'\r\nOK\r\n'
+        else:
+            self.rx += b'\r\nOK\r\n'
+        return len(data)
+
+    def csim(self, pdu: str) -> str:
+        if pdu[2:4] == 'B2':
+            if int(pdu[8:10], 16) != self.rec_len:
+                return '6c%02x' % self.rec_len
+            return pdu[4:6] * self.rec_len + '9000'
+        return '9000'
+
+    def read_until(self, expected: bytes) -> bytes:
+        if not self.rx:
+            # nothing (more) to read: wait for the timeout, like the real thing
+            time.sleep(self.timeout)
+            return b''
+        end = self.rx.find(expected)
+        end = len(self.rx) if end < 0 else end + len(expected)
+        line, self.rx = self.rx[:end], self.rx[end:]
+        return line
+
+    def close(self):
+        pass
+
+class RecordingTracer(ApduTracer):
+    def __init__(self):
+        self.trace = []
+
+    def trace_command(self, cmd):
+        self.trace.append(('cmd', cmd))
+
+    def trace_response(self, cmd, sw, resp):
+        self.trace.append(('rsp', cmd, sw))
+
+class ModemATCommandLink_Test(unittest.TestCase):
+    def setUp(self):
+        opts = argparse.Namespace(modem_dev='/dev/null', modem_baud=115200, modem_pipeline=3)
+        with mock.patch('serial.Serial', FakeSerial):
+            self.tp = ModemATCommandLink(opts)
+        self.ser = self.tp._sl
+        self.ser.lines = []
+
+    @staticmethod
+    def read_record(rec_no: int, rec_len: int = 5) -> bytes:
+        return bytes([0x00, 0xb2, rec_no, 0x04, rec_len])
+
+    def test_init(self):
+        tp = self.tp
+        self.assertFalse(tp._echo)
+        self.assertEqual(self.ser.timeout, 0.2)
+
+    def test_echo(self):
+        self.ser.echo = True
+        self.assertEqual(self.tp.send_at_cmd('AT'), [b'OK'])
+        self.assertTrue(self.tp._echo)
+
+    def test_unsolicited(self):
+        self.ser.responses[b'AT+CREG?'] = b'\r\n+CREG: 0,1\r\n\r\nRING\r\n\r\nOK\r\n'
+        self.assertEqual(self.tp.send_at_cmd('AT+CREG?'), [b'+CREG: 0,1', b'RING', b'OK'])
+        # unsolicited lines between the responses of AT+CSIM are ignored
+        self.ser.responses[b'AT+CSIM=10,"00B2010405"'] = b'\r\nRING\r\n\r\n+CSIM: 14,"01010101019000"\r\n\r\nOK\r\n'
+        self.assertEqual(self.tp.send_apdu_raw('00b2010405'), ('0101010101', '9000'))
+
+    def test_timeout(self):
+        self.ser.responses[b'AT+FOO'] = b'\r\n+FOO: 1\r\n'
+        t_start = time.time()
+        self.assertEqual(self.tp.send_at_cmd('AT+FOO', timeout=0.05), [b'+FOO: 1'])
+        self.assertLess(time.time() - t_start, 0.2)
+        # a partial line is not returned
+        self.ser.responses[b'AT+FOO'] = b'\r\n+FOO: 1\r\n\r\nOK'
+        self.assertEqual(self.tp.send_at_cmd('AT+FOO', timeout=0.05), [b'+FOO: 1'])
+
+    def test_error(self):
+        self.ser.responses[b'AT+CSIM=10,"00B2010405"'] = b'\r\n+CME ERROR: 10\r\n'
+        with self.assertRaises(ProtocolError):
+            self.tp.send_apdu_raw('00b2010405')
+
+    def test_pipeline(self):
+        self.tp.apdu_tracer = RecordingTracer()
+        rsps = self.tp.send_apdus_checksw_bin([self.read_record(i) for i in range(1, 6)])
+        self.assertEqual(rsps, [(bytes([i] * 5), '9000') for i in range(1, 6)])
+        self.assertEqual(len(self.ser.lines), 2)
+        self.assertEqual(self.ser.lines[1], b'AT+CSIM=10,"00B2040405";+CSIM=10,"00B2050405"')
+        # each command is traced together with its response
+        self.assertEqual(self.tp.apdu_tracer.trace[0:4], [('cmd', '00b2010405'), ('rsp', '00b2010405', '9000'),
+                                                          ('cmd', '00b2020405'), ('rsp', '00b2020405', '9000')])
+
+    def test_resend(self):
+        """An APDU with an unexpected status word is re-sent on its own, the following ones again."""
+        pdus = [self.read_record(1), self.read_record(2, 4), self.read_record(3), self.read_record(4)]
+        rsps = self.tp.send_apdus_checksw_bin(pdus)
+        self.assertEqual(rsps, [(bytes([i] * 5), '9000') for i in range(1, 5)])
+        self.assertEqual(self.ser.lines, [b'AT+CSIM=10,"00B2010405";+CSIM=10,"00B2020404";+CSIM=10,"00B2030405"',
+                                          b'AT+CSIM=10,"00B2020404"', b'AT+CSIM=10,"00B2020405"',
+                                          b'AT+CSIM=10,"00B2030405";+CSIM=10,"00B2040405"'])
+
+    def test_no_pipeline_update(self):
+        pdus = [h2b('00dc0104050101010101'), h2b('00dc0204050202020202')]
+        self.assertEqual(self.tp.send_apdus_checksw_bin(pdus), [(b'', '9000'), (b'', '9000')])
+        self.assertEqual(self.ser.lines, [b'AT+CSIM=20,"00DC0104050101010101"',
+                                          b'AT+CSIM=20,"00DC0204050202020202"'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from pySim.profile import CardProfile
+from pySim.profile_cache import *
+from pySim.ts_102_221 import CardProfileUICC
+from pySim.ts_51_011 import AddonSIM
+
+ATR = '3B9F96801F878031E073FE211B674A4C753034054BA9'
+ENTRY = {'card': 'pySim.cards.UiccCardBase', 'adm_chv_num': 10, 'profile': 'pySim.ts_102_221.CardProfileUICC',
+         'cla': '00', 'sel_ctrl': '0004', 'addons': ['pySim.ts_51_011.AddonSIM'],
+         'applications': ['a0000000871002'], 'aids': ['a0000000871002f310ffff89080000ff'], 'eid': None}
+
+class CardProfileCache_Test(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmpdir.name, 'pysim', 'card_profiles.json')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_put_get(self):
+        cache = CardProfileCache(self.filename)
+        self.assertIsNone(cache.get(ATR, '8949440000001155314'))
+        cache.put(ATR, '8949440000001155314', ENTRY)
+        # persisted to disk
+        cache = CardProfileCache(self.filename)
+        self.assertEqual(cache.get(ATR.lower(), '8949440000001155314'), ENTRY)
+        self.assertIsNone(cache.get(ATR, '8949440000001155315'))
+        self.assertEqual(cache.get_by_atr(ATR), [ENTRY])
+        self.assertEqual(cache.get_by_atr('3b00'), [])
+        cache.remove(ATR, '8949440000001155314')
+        self.assertEqual(CardProfileCache(self.filename).entries, {})
+
+    def test_invalid_file(self):
+        os.makedirs(os.path.dirname(self.filename))
+        with open(self.filename, 'w') as f:
+            f.write('{"version": 1, "cards"')
+        self.assertEqual(CardProfileCache(self.filename).entries, {})
+        with open(self.filename, 'w') as f:
+            f.write('{"version": 0, "cards": {"3b00:123": {}}}')
+        self.assertEqual(CardProfileCache(self.filename).entries, {})
+
+    def test_default_path(self):
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.tmpdir.name}):
+            self.assertEqual(default_cache_path(), self.filename)
+
+    def test_find_class(self):
+        self.assertEqual(class_name(CardProfileUICC), 'pySim.ts_102_221.CardProfileUICC')
+        self.assertIs(find_class(CardProfile, ENTRY['profile']), CardProfileUICC)
+        self.assertIs(find_class(CardProfile, 'pySim.ts_102_221.CardProfileFoo'), None)
+        self.assertEqual(class_name(AddonSIM), ENTRY['addons'][0])
+
+if __name__ == "__main__":
+    unittest.main()
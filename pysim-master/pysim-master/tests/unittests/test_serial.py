@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+# (C) 2024 by sysmocom - s.f.m.c. GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import unittest
+from unittest import mock
+
+from osmocom.utils import h2b
+
+from pySim.transport.serial import SerialSimLink
+from pySim.exceptions import ProtocolError
+
+class FakeSerial:
+    """Stands in for serial.Serial: A Phoenix reader (TX and RX tied, so everything written is echoed)
+    with a card that answers according to a script."""
+    def __init__(self, **kwargs):
+        self.baudrate = kwargs['baudrate']
+        self.name = kwargs['port']
+        # chunks of data as they arrive at the serial port; each read() returns data of one chunk only
+        self.chunks = []
+        # the answers of the card (lists of chunks) to the data written, one for each write()
+        self.script = []
+        self.written = []
+        self.atr = h2b('3b00')
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self.chunks[0]) if self.chunks else 0
+
+    def read(self, n: int) -> bytes:
+        if not self.chunks:
+            # timeout
+            return b''
+        ret = self.chunks[0][:n]
+        self.chunks[0] = self.chunks[0][n:]
+        if not self.chunks[0]:
+            self.chunks.pop(0)
+        return ret
+
+    def write(self, data: bytes):
+        self.written.append(data)
+        self.chunks.append(data)
+        if self.script:
+            self.chunks += self.script.pop(0)
+
+    def setRTS(self, val):
+        # the card sends its ATR when the reset line is released
+        if not val:
+            self.chunks.append(self.atr)
+
+    setDTR = setRTS
+
+    def flushInput(self):
+        self.chunks = []
+
+    def close(self):
+        pass
+
+class SerialSimLink_Test(unittest.TestCase):
+    def link(self, atr: str = '3b00', pps: bool = False) -> SerialSimLink:
+        opts = argparse.Namespace(device='/dev/null', baudrate=9600, pps=pps)
+        with mock.patch('serial.Serial', FakeSerial):
+            tp = SerialSimLink(opts)
+        tp._sl.atr = h2b(atr)
+        with mock.patch('time.sleep'):
+            tp.reset_card()
+        tp._sl.written = []
+        return tp
+
+    def test_atr(self):
+        tp = self.link('3b9f96801fc78031a073be21136743200718000001a5')
+        self.assertEqual(tp.get_atr(), list(h2b('3b9f96801fc78031a073be21136743200718000001a5')))
+
+    def test_null_ins(self):
+        """NULL procedure bytes, then INS: all data bytes at once, split over several reads."""
+        tp = self.link()
+        tp._sl.script = [[b'\x60', b'\x60\xb0\x01', b'\x02\x03', b'\x04\x90', b'\x00']]
+        self.assertEqual(tp.send_apdu_raw('a0b0000004'), ('01020304', '9000'))
+
+    def test_ins_tx(self):
+        tp = self.link()
+        tp._sl.script = [[b'\xd6'], [b'\x90\x00']]
+        self.assertEqual(tp.send_apdu_raw('a0d6000002aabb'), ('', '9000'))
+        self.assertEqual(tp._sl.written, [h2b('a0d6000002'), h2b('aabb')])
+
+    def test_ins_ff_tx(self):
+        """INS ^ 0xFF: transfer one data byte at a time."""
+        tp = self.link()
+        tp._sl.script = [[b'\x29'], [b'\x29'], [b'\x91', b'\x10']]
+        self.assertEqual(tp.send_apdu_raw('a0d6000002aabb'), ('', '9110'))
+        self.assertEqual(tp._sl.written, [h2b('a0d6000002'), h2b('aa'), h2b('bb')])
+
+    def test_ins_ff_rx(self):
+        tp = self.link()
+        tp._sl.script = [[b'\x4f', b'\x01', b'\x60\xb0', b'\x02\x03', b'\x90\x00']]
+        self.assertEqual(tp.send_apdu_raw('a0b0000003'), ('010203', '9000'))
+
+    def test_sw_only(self):
+        tp = self.link()
+        tp._sl.script = [[b'\x6a', b'\x82']]
+        self.assertEqual(tp.send_apdu_raw('a0a4000002'), ('', '6a82'))
+
+    def test_errors(self):
+        tp = self.link()
+        with self.assertRaisesRegex(ProtocolError, 'procedure byte'):
+            tp.send_apdu_raw('a0b0000004')
+        tp._sl.script = [[b'\x6a']]
+        with self.assertRaisesRegex(ProtocolError, 'SW2'):
+            tp.send_apdu_raw('a0b0000004')
+        tp._sl.script = [[b'\x42']]
+        with self.assertRaisesRegex(ProtocolError, 'Unexpected procedure byte 0x42'):
+            tp.send_apdu_raw('a0b0000004')
+
+    def test_pps(self):
+        # TA1=0x13: Fi=372, Di=4
+        tp = self.link('3b1013', pps=False)
+        self.assertEqual(tp._sl.baudrate, 9600)
+        tp._pps = True
+        tp._sl.script = [[h2b('ff1013fc')]]
+        with mock.patch('time.sleep'):
+            tp.reset_card()
+        self.assertEqual(tp._sl.written, [h2b('ff1013fc')])
+        self.assertEqual(tp._sl.baudrate, 38400)
+
+    def test_pps_default(self):
+        """The card confirms PPS without PPS1: it keeps the default Fi/Di."""
+        tp = self.link('3b1013', pps=False)
+        tp._pps = True
+        tp._sl.script = [[h2b('ff00ff')]]
+        with mock.patch('time.sleep'):
+            tp.reset_card()
+        self.assertEqual(tp._sl.baudrate, 9600)
+
+    def test_pps_failed(self):
+        tp = self.link('3b1013', pps=False)
+        tp._pps = True
+        tp._sl.script = [[h2b('ff1011fe')]]
+        with mock.patch('time.sleep'), self.assertRaises(ProtocolError):
+            tp.reset_card()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import time
+import subprocess
+import unittest
+
+# Run the given program with '--help' and report (on stderr) the modules it imported.  The (heavy) card
+# application and profile modules are imported only on first use, so they must not show up here.
+HELP_MODULES = """
+import sys, json, runpy
+sys.argv = [sys.argv[1], '--help']
+try:
+    runpy.run_path(sys.argv[0], run_name='__main__')
+except SystemExit:
+    pass
+sys.stderr.write(json.dumps(sorted(sys.modules)))
+"""
+
+# modules that are not required for parsing the command line arguments
+LAZY_MODULES = ['pySim.app', 'pySim.euicc', 'pySim.ara_m', 'pySim.global_platform', 'pySim.ts_31_102',
+                'pySim.ts_31_103', 'pySim.ts_31_104', 'pySim.sysmocom_sja2', 'pySim.esim',
+                'asn1tools', 'cryptography', 'jsonpath_ng', 'yaml', 'Cryptodome']
+
+# generous upper bound for the wall time of '--help', only to catch gross regressions
+MAX_HELP_TIME = 5.0
+
+class Startup_Test(unittest.TestCase):
+    def _help_modules(self, prog: str):
+        start = time.monotonic()
+        res = subprocess.run([sys.executable, '-c', HELP_MODULES, prog], capture_output=True, text=True,
+                             check=False)
+        duration = time.monotonic() - start
+        try:
+            modules = json.loads(res.stderr.splitlines()[-1])
+        except (IndexError, ValueError):
+            self.fail('%s --help failed: %s' % (prog, res.stderr))
+        self.assertIn('usage:', res.stdout)
+        self.assertLess(duration, MAX_HELP_TIME)
+        return modules
+
+    def _assert_lazy(self, modules, lazy_modules):
+        for name in lazy_modules:
+            with self.subTest(module=name):
+                self.assertNotIn(name, modules)
+
+    def test_shell(self):
+        self._assert_lazy(self._help_modules('pySim-shell.py'), LAZY_MODULES)
+
+    def test_trace(self):
+        # the tracer always needs the USIM commands (and hence pySim.ts_31_102) for decoding
+        self._assert_lazy(self._help_modules('pySim-trace.py'),
+                          [m for m in LAZY_MODULES if m != 'pySim.ts_31_102'])
+
+if __name__ == "__main__":
+    unittest.main()
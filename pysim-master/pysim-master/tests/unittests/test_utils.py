@@ -2,6 +2,7 @@
 
 import unittest
 from pySim import utils
+from osmocom.utils import h2b
 from pySim.legacy import utils as legacy_utils
 from pySim.ts_31_102 import EF_SUCI_Calc_Info
 
@@ -189,5 +190,21 @@ class TestLuhn(unittest.TestCase):
         # 18 digits; we expect luhn check digit to be added
         self.assertEqual(utils.sanitize_iccid('898821100000053008'), '8988211000000530082')
 
+class TestAtr(unittest.TestCase):
+    def test_decompose(self):
+        (protocols, hist) = utils.atr_decompose(h2b('3B9F96801F878031E073FE211B674A4C753034054BA9'))
+        self.assertEqual(protocols, [0, 15])
+        self.assertEqual(hist, h2b('8031E073FE211B674A4C753034054B'))
+        self.assertEqual(utils.atr_decompose(h2b('3B991800118822334455667760'))[0], [0])
+
+    def test_ext_length_info(self):
+        # card capabilities without extended Lc/Le
+        self.assertIsNone(utils.atr_ext_length_info(h2b('3B9F96801F878031E073FE211B674A4C753034054BA9')))
+        # T=1, card capabilities with extended Lc/Le
+        self.assertEqual(utils.atr_ext_length_info(h2b('3B8A8001807300C0400102030405B8')), (0xffff, 0x10000))
+        self.assertEqual(utils.ef_atr_ext_length_info(h2b('80017147030000c0')), (0xffff, 0x10000))
+        self.assertEqual(utils.ef_atr_ext_length_info(h2b('47030000c07f66080202010902020102ffff')), (256, 256))
+        self.assertIsNone(utils.ef_atr_ext_length_info(h2b('4703000000ffffffff')))
+
 if __name__ == "__main__":
 	unittest.main()